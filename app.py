@@ -19,9 +19,11 @@ from database import Database
 from solana_wallet import UniversalSolanaWallet
 from exchange_rate import get_sol_to_rub_rate, calculate_commissions, rub_to_sol, sol_to_rub_with_commissions
 from qr_generator import QRCodeManager
+from money import rub_to_kopecks, rub_kopecks_to_lamports, lamports_to_sol, percent_of
 from datetime import datetime, timedelta
 from functools import wraps
 from security_logger import SecurityLogger
+from payment_dispatcher import DISPATCH_MAX_ATTEMPTS, DISPATCH_RETRY_DELAY, notify_payment_queued
 from rate_limiter import rate_limiter, get_session_key, get_auth_code_key, get_login_key
 
 app = Flask(__name__)
@@ -439,8 +441,20 @@ def user_info():
 def user_transactions():
     """Получить историю транзакций пользователя"""
     user_id = session['user_id']
+    after = request.args.get('after') or None
+    include_archived = request.args.get('archived') == '1'
     
-    transactions = db.get_user_transactions(user_id)
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        limit = 50
+    limit = max(1, min(limit, 100))
+    
+    try:
+        transactions, next_cursor = db.get_user_transactions_page(
+            user_id, after, limit, include_archived=include_archived)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     pending_withdrawals = db.get_pending_withdrawals_for_user(user_id)
     
@@ -481,7 +495,11 @@ def user_transactions():
         else:
             transaction['created_at'] = "Дата не определена"
     
-    return jsonify({'transactions': transactions})
+    return jsonify({
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @app.route('/api/wallet/refresh-balance', methods=['POST'])
 @login_required
@@ -600,10 +618,14 @@ def process_payment():
         user = db.get_user_by_telegram_id(session['telegram_id'])
         
         exchange_rate = get_sol_to_rub_rate()
-        amount_sol_without_commission = amount_rub / exchange_rate
-        worker_earnings_sol = amount_sol_without_commission * 1.05
-        admin_commission_sol = amount_sol_without_commission * 0.05
-        total_user_payment_sol = amount_sol_without_commission * 1.10
+        amount_lamports = rub_kopecks_to_lamports(rub_to_kopecks(amount_rub), exchange_rate)
+        worker_earnings_lamports = amount_lamports + percent_of(amount_lamports, 5)
+        admin_commission_lamports = percent_of(amount_lamports, 5)
+        total_user_payment_lamports = worker_earnings_lamports + admin_commission_lamports
+        
+        worker_earnings_sol = lamports_to_sol(worker_earnings_lamports)
+        admin_commission_sol = lamports_to_sol(admin_commission_lamports)
+        total_user_payment_sol = lamports_to_sol(total_user_payment_lamports)
         
         wallet = db.get_user_wallet(user_id, 'SOL')
         if not wallet or not wallet.get('private_key'):
@@ -623,20 +645,6 @@ def process_payment():
             }), 400
 
         frozen_balance = total_user_payment_sol
-        if not db.freeze_user_balance_atomic(user_id, 'SOL', frozen_balance, real_balance):
-            return jsonify({'error': 'Недостаточно средств или произошла ошибка'}), 400
-        
-        transaction_id = db.create_transaction(
-            user_id=user_id,
-            transaction_type='payment',
-            currency='SOL',
-            amount=-total_user_payment_sol,
-            amount_rub=-amount_rub,
-            exchange_rate=exchange_rate,
-            qr_code_data=qr_code_data,
-            status='pending'
-        )
-        
         qr_result = QRCodeManager.generate_payment_qr(amount_rub, "Оплата покупки")
         
         user_balances = {
@@ -657,36 +665,60 @@ def process_payment():
             'admin_commission_sol': admin_commission_sol
         })
         
-        db.add_to_payment_queue(
-            transaction_id=transaction_id,
-            qr_code_data=qr_code_data,
-            qr_code_image=qr_result['qr_image'] if qr_result['success'] else '',
-            user_info=user_info,
-            amount_rub=amount_rub,
-            worker_earnings_rub=worker_earnings_sol * exchange_rate
-        )
-        
-        SecurityLogger.log_payment_event(transaction_id, 'created', amount_rub)
-        
-        try:
-            from bot_notifications import send_payment_notification_sync
+        # Заморозка, транзакция и очередь - одна транзакция БД: либо все, либо ничего
+        with db.unit_of_work():
+            if not db.freeze_user_balance_atomic(user_id, 'SOL', frozen_balance, real_balance):
+                return jsonify({'error': 'Недостаточно средств или произошла ошибка'}), 400
             
-            print(f"📤 Sending payment notification for transaction #{transaction_id}")
+            transaction_id = db.create_transaction(
+                user_id=user_id,
+                transaction_type='payment',
+                currency='SOL',
+                amount=-total_user_payment_sol,
+                amount_rub=-amount_rub,
+                exchange_rate=exchange_rate,
+                qr_code_data=qr_code_data,
+                status='pending'
+            )
             
-            sent_count = send_payment_notification_sync(
+            db.add_to_payment_queue(
                 transaction_id=transaction_id,
                 qr_code_data=qr_code_data,
-                qr_code_image=qr_result['qr_image'] if qr_result['success'] else '',
+                qr_image_hash=qr_result['qr_image_hash'] if qr_result['success'] else None,
                 user_info=user_info,
                 amount_rub=amount_rub,
-                worker_earnings_sol=worker_earnings_sol,
-                frozen_amount_sol=frozen_balance
+                worker_earnings_rub=worker_earnings_sol * exchange_rate
             )
+        
+        SecurityLogger.log_payment_event(transaction_id, 'created', amount_rub)
+        
+        try:
+            from bot_notifications import send_payment_notification_sync
             
-            if sent_count > 0:
-                print(f"✅ Payment notification sent successfully to {sent_count} recipients")
-            else:
-                print(f"⚠️ Payment notification failed to send to any recipient")
+            # Диспетчер бота сам заберет запись из payment_queue; без него отправляем напрямую
+            if notify_payment_queued():
+                print(f"📮 Payment #{transaction_id} passed to dispatcher")
+            elif db.claim_pending_payments(limit=1, transaction_id=transaction_id):
+                print(f"📤 Sending payment notification for transaction #{transaction_id}")
+                
+                sent_count = send_payment_notification_sync(
+                    transaction_id=transaction_id,
+                    qr_code_data=qr_code_data,
+                    qr_image_hash=qr_result['qr_image_hash'] if qr_result['success'] else None,
+                    user_info=user_info,
+                    amount_rub=amount_rub,
+                    worker_earnings_sol=worker_earnings_sol,
+                    frozen_amount_sol=frozen_balance
+                )
+            
+                if sent_count > 0:
+                    print(f"✅ Payment notification sent successfully to {sent_count} recipients")
+                    # Все воркеры уже получили платеж: следующих волн и повторной рассылки не нужно
+                    db.record_payment_offer(transaction_id, 1, None)
+                else:
+                    print(f"⚠️ Payment notification failed to send to any recipient")
+                    db.retry_payment_dispatch(transaction_id, 'not delivered to any recipient',
+                                              DISPATCH_MAX_ATTEMPTS, DISPATCH_RETRY_DELAY)
             
         except Exception as e:
             print(f"❌ Error sending payment notification: {e}")
@@ -760,24 +792,26 @@ def withdrawal_request():
                 'error': f'Недостаточно SOL на кошельке. Доступно: {available_balance:.6f} SOL, запрошено: {amount_sol:.6f} SOL'
             }), 400
         
-        frozen_balance = amount_sol
-        if not db.freeze_user_balance_atomic(user_id, 'SOL', frozen_balance, available_balance):
-            return jsonify({'error': 'Недостаточно средств или произошла ошибка при заморозке баланса'}), 400
-        
-        withdrawal_id = db.create_withdrawal_request(user_id, amount_sol, wallet_address, 'balance')
-        
         exchange_rate = get_sol_to_rub_rate()
         amount_rub = amount_sol * exchange_rate
         
-        transaction_id = db.create_transaction(
-            user_id=user_id,
-            transaction_type='withdrawal',
-            currency='SOL',
-            amount=-amount_sol,
-            amount_rub=-amount_rub,
-            exchange_rate=exchange_rate,
-            status='in_progress'
-        )
+        frozen_balance = amount_sol
+        # Заморозка, заявка и транзакция - одна транзакция БД: при ошибке ничего не остается
+        with db.unit_of_work():
+            if not db.freeze_user_balance_atomic(user_id, 'SOL', frozen_balance, available_balance):
+                return jsonify({'error': 'Недостаточно средств или произошла ошибка при заморозке баланса'}), 400
+            
+            withdrawal_id = db.create_withdrawal_request(user_id, amount_sol, wallet_address, 'balance')
+            
+            transaction_id = db.create_transaction(
+                user_id=user_id,
+                transaction_type='withdrawal',
+                currency='SOL',
+                amount=-amount_sol,
+                amount_rub=-amount_rub,
+                exchange_rate=exchange_rate,
+                status='in_progress'
+            )
         
         try:
             print(f"📤 Sending withdrawal notification to admins: withdrawal_id={withdrawal_id}")
@@ -825,13 +859,6 @@ def withdrawal_request():
         print(f"💥 {error_msg}")
         SecurityLogger.log_suspicious_activity(error_msg)
         
-        try:
-            user_id = session.get('user_id')
-            if user_id:
-                db.unfreeze_user_balance(user_id, 'SOL')
-        except Exception as rollback_error:
-            print(f"⚠️ Error unfreezing balance: {rollback_error}")
-        
         return jsonify({'error': 'Внутренняя ошибка сервера при создании заявки на вывод'}), 500
                
 def send_withdrawal_to_admins_sync(withdrawal_id, user_id, user_name, user_username, user_wallet, to_wallet, amount_sol, amount_rub, transaction_id):
@@ -992,9 +1019,7 @@ def test_deposit():
         
         user_id = session['user_id']
         
-        current_balance = db.get_user_balance(user_id, 'SOL')
-        new_balance = current_balance + 2.0
-        db.update_user_balance(user_id, 'SOL', new_balance)
+        new_balance = db.increment_user_balance(user_id, 'SOL', 2.0)
         
         db.create_transaction(
             user_id=user_id,
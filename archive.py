@@ -0,0 +1,114 @@
+"""
+Модуль архивации: завершенные старые строки переносятся из основной БД
+в подключенный файл archive (ATTACH DATABASE ... AS archive)
+"""
+
+import os
+import cfg
+from typing import List
+from migrations import TRANSACTION_STATS
+
+ARCHIVE_AFTER_DAYS = getattr(cfg, 'ARCHIVE_AFTER_DAYS', 90)
+ARCHIVE_BATCH_SIZE = getattr(cfg, 'ARCHIVE_BATCH_SIZE', 500)
+
+# Таблица -> конечные статусы, после которых строка больше не меняется
+ARCHIVED_TABLES = {
+    'transactions': ('completed', 'cancelled', 'error', 'failed', 'rejected'),
+    'payment_queue': ('completed', 'cancelled', 'error'),
+    'withdrawal_requests': ('completed', 'rejected'),
+}
+
+ARCHIVE_INDEXES = {
+    'transactions': [('idx_transactions_user_created', 'user_id, created_at')],
+    'payment_queue': [('idx_payment_queue_transaction', 'transaction_id')],
+    'withdrawal_requests': [('idx_withdrawal_requests_user_created', 'user_id, created_at')],
+}
+
+
+def archive_path_for(db_path: str):
+    """Путь к архиву: ARCHIVE_DATABASE_PATH для основной БД ('' - архив выключен), иначе файл рядом"""
+    configured = getattr(cfg, 'ARCHIVE_DATABASE_PATH', None)
+    if configured is not None and db_path == cfg.DATABASE_PATH:
+        return configured or None
+    return f'{os.path.splitext(db_path)[0]}_archive.db'
+
+
+def table_columns(cursor, schema: str, table: str) -> List[tuple]:
+    """Колонки таблицы: [(имя, тип), ...] в порядке объявления"""
+    cursor.execute(f'PRAGMA {schema}.table_info({table})')
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+
+def ensure_archive_schema(cursor):
+    """Создать таблицы архива и добавить колонки, появившиеся в основной БД"""
+    for table in ARCHIVED_TABLES:
+        columns = table_columns(cursor, 'main', table)
+        archived = {name for name, _ in table_columns(cursor, 'archive', table)}
+
+        if not archived:
+            definitions = ', '.join(
+                f'{name} INTEGER PRIMARY KEY' if name == 'id' else f'{name} {column_type}'
+                for name, column_type in columns
+            )
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS archive.{table} ({definitions})')
+        else:
+            for name, column_type in columns:
+                if name not in archived:
+                    cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}')
+
+        for index_name, index_columns in ARCHIVE_INDEXES[table]:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS archive.{index_name} ON {table} ({index_columns})')
+
+
+def ensure_archive_views(cursor, tables=tuple(ARCHIVED_TABLES)):
+    """Временные представления all_<таблица>: основная БД + архив (UNION ALL)"""
+    for table in tables:
+        columns = ', '.join(name for name, _ in table_columns(cursor, 'main', table))
+        cursor.execute(f'''
+            CREATE TEMP VIEW IF NOT EXISTS all_{table} AS
+            SELECT {columns} FROM main.{table}
+            UNION ALL
+            SELECT {columns} FROM archive.{table}
+        ''')
+
+
+def archive_batch(cursor, table: str, cutoff: str, batch_size: int) -> int:
+    """Перенести в архив одну пачку завершенных строк старше cutoff; вернуть их число.
+
+    Вызывается внутри транзакции: копирование и удаление фиксируются вместе.
+    Счетчики system_stats компенсируются, чтобы статистика учитывала архив.
+    """
+    statuses = ARCHIVED_TABLES[table]
+    cursor.execute(f'''
+        SELECT id FROM main.{table}
+        WHERE status IN ({', '.join('?' for _ in statuses)}) AND created_at < ?
+        LIMIT ?
+    ''', (*statuses, cutoff, batch_size))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return 0
+
+    id_list = ', '.join('?' for _ in ids)
+    columns = ', '.join(name for name, _ in table_columns(cursor, 'main', table))
+
+    # OR REPLACE: повторный запуск после сбоя между файлами не создаст дублей в архиве
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO archive.{table} ({columns})
+        SELECT {columns} FROM main.{table} WHERE id IN ({id_list})
+    ''', ids)
+
+    if table == 'transactions':
+        # Триггеры удаления вычтут вклад строк, поэтому заранее прибавляем его обратно
+        for name, expr in TRANSACTION_STATS.items():
+            cursor.execute(f'''
+                UPDATE system_stats
+                SET value = value + (
+                    SELECT COALESCE(SUM({expr.format(row='t')}), 0)
+                    FROM main.transactions t WHERE t.id IN ({id_list})
+                )
+                WHERE name = ?
+            ''', (*ids, name))
+
+    cursor.execute(f'DELETE FROM main.{table} WHERE id IN ({id_list})', ids)
+    return len(ids)
+
@@ -0,0 +1,47 @@
+"""
+Модуль асинхронного доступа к базе данных для Telegram бота
+"""
+
+import asyncio
+import functools
+import cfg
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+
+DB_EXECUTOR_WORKERS = getattr(cfg, 'DB_EXECUTOR_WORKERS', 4)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database: те же методы, но выполняются в пуле потоков.
+
+    Запросы SQLite не блокируют цикл событий бота: каждый вызов
+    `await adb.method(...)` уходит в отдельный поток со своим соединением из пула.
+    """
+
+    def __init__(self, db: Database = None, max_workers: int = DB_EXECUTOR_WORKERS):
+        self.db = db or Database()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(attr, *args, **kwargs))
+
+        # Обертка кешируется: следующие обращения не проходят через __getattr__
+        setattr(self, name, call)
+        return call
+
+    async def refresh_roles(self):
+        """Сверить индекс ролей с БД в пуле потоков, если подошел срок проверки"""
+        if self.db.roles_need_refresh():
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.db.refresh_roles)
+
+    def shutdown(self, wait: bool = True):
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=wait)
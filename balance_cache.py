@@ -0,0 +1,185 @@
+"""
+Кеш балансов кошельков Solana: короткий TTL и объединение одновременных запросов
+одного адреса в один RPC-запрос (single-flight) для синхронного и асинхронного кода
+"""
+
+import asyncio
+import threading
+import time
+import cfg
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+BALANCE_CACHE_TTL = getattr(cfg, 'BALANCE_CACHE_TTL', 10)
+BALANCE_CACHE_MAX_ENTRIES = getattr(cfg, 'BALANCE_CACHE_MAX_ENTRIES', 10000)
+
+
+class BalanceCache:
+    """Балансы по (сеть, адрес).
+
+    Первый промах по адресу запускает запрос, остальные вызывающие ждут его
+    результат. Ошибки не кешируются. invalidate() вызывается после наших
+    переводов: запись удаляется, а ответы RPC по адресу еще один TTL не
+    кешируются, пока сеть не отразила перевод.
+    """
+
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL, max_entries: int = BALANCE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._unsettled = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    @staticmethod
+    def _key(address: str):
+        return (cfg.SOLANA_NETWORK, address)
+
+    def _lookup(self, key) -> Tuple[str, object]:
+        """('hit', баланс), ('wait', Future чужого запроса) или ('lead', Future своего запроса)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return 'hit', entry[1]
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return 'wait', future
+            self.misses += 1
+            future = self._inflight[key] = Future()
+            return 'lead', future
+
+    def _store(self, key, value: float, now: float):
+        unsettled = self._unsettled.get(key)
+        if unsettled is not None:
+            if unsettled > now:
+                return
+            del self._unsettled[key]
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def _finish(self, key, future: Future, value: float = None, error: Exception = None):
+        with self._lock:
+            # После invalidate() запрос уже не в _inflight: его ответ мог устареть
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+                if error is None:
+                    self._store(key, value, time.monotonic())
+            if error is not None:
+                self.errors += 1
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def get(self, address: str, fetch) -> float:
+        """Баланс из кеша или через fetch() (исключения fetch пробрасываются)"""
+        if not self.enabled:
+            return fetch()
+        key = self._key(address)
+        kind, result = self._lookup(key)
+        if kind == 'hit':
+            return result
+        if kind == 'wait':
+            return result.result()
+        try:
+            value = fetch()
+        except Exception as e:
+            self._finish(key, result, error=e)
+            raise
+        self._finish(key, result, value)
+        return value
+
+    async def get_async(self, address: str, fetch) -> float:
+        """То же для корутины fetch(); ожидание чужого запроса не блокирует цикл событий"""
+        if not self.enabled:
+            return await fetch()
+        key = self._key(address)
+        kind, result = self._lookup(key)
+        if kind == 'hit':
+            return result
+        if kind == 'wait':
+            return await asyncio.wrap_future(result)
+        try:
+            value = await fetch()
+        except BaseException as e:
+            self._finish(key, result, error=e if isinstance(e, Exception) else RuntimeError(str(e)))
+            raise
+        self._finish(key, result, value)
+        return value
+
+    def peek_many(self, addresses: List[str]) -> Tuple[Dict[str, float], List[str]]:
+        """Найденные в кеше балансы и адреса, которые нужно запросить"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for address in addresses:
+                entry = self._data.get(self._key(address)) if self.enabled else None
+                if entry is not None and entry[0] > now:
+                    found[address] = entry[1]
+                    self.hits += 1
+                else:
+                    missing.append(address)
+                    self.misses += 1
+        return found, missing
+
+    def put_many(self, balances: Dict[str, float]):
+        """Запомнить балансы, полученные пакетным запросом"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for address, value in balances.items():
+                self._store(self._key(address), value, now)
+
+    def invalidate(self, *addresses: str):
+        """Сбросить балансы адресов после нашего перевода"""
+        now = time.monotonic()
+        with self._lock:
+            for address in addresses:
+                key = self._key(address)
+                self._data.pop(key, None)
+                self._inflight.pop(key, None)
+                self._unsettled[key] = now + self.ttl
+                self.invalidations += 1
+            for key in [key for key, deadline in self._unsettled.items() if deadline <= now]:
+                del self._unsettled[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        """Счетчики кеша: hits/misses, объединенные запросы, ошибки и сбросы"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'errors': self.errors,
+                'invalidations': self.invalidations,
+                'inflight': len(self._inflight),
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+balance_cache = BalanceCache()
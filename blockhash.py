@@ -0,0 +1,174 @@
+"""
+Общий недавний blockhash для сборки транзакций: обновляется фоновым потоком,
+поэтому перевод SOL не делает отдельный запрос getLatestBlockhash
+"""
+
+import asyncio
+import atexit
+import threading
+import time
+import cfg
+from typing import NamedTuple, Optional
+from solana_rpc import current_endpoint, rpc_clients
+
+BLOCKHASH_REFRESH_INTERVAL = getattr(cfg, 'BLOCKHASH_REFRESH_INTERVAL', 5)
+# Blockhash действителен около 60 секунд; старше этого значение не выдается
+BLOCKHASH_MAX_AGE = getattr(cfg, 'BLOCKHASH_MAX_AGE', 30)
+# Сколько раз ждать новый blockhash для повтора одинакового перевода (новый слот - около 0.4 с)
+BLOCKHASH_REUSE_RETRIES = getattr(cfg, 'BLOCKHASH_REUSE_RETRIES', 10)
+BLOCKHASH_REUSE_WAIT = 0.4
+# Blockhash действителен около 60-90 секунд: дольше помнить, под каким ушел перевод, не нужно
+TRANSFER_MEMORY_SECONDS = 120
+
+
+class RecentBlockhash(NamedTuple):
+    blockhash: object
+    last_valid_block_height: int
+    endpoint: str
+    fetched_at: float
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class BlockhashProvider:
+    """Последний blockhash текущей сети.
+
+    Поток обновляет значение каждые interval секунд; get()/get_async() отдают его
+    без запроса к RPC, а если потока нет, значение устарело или сменилась сеть -
+    запрашивают сами.
+
+    Одинаковый перевод (отправитель, получатель, лампорты) под тем же blockhash -
+    побайтно та же транзакция: сеть отклонит ее как дубликат или вернет подпись
+    первой. for_transfer() запоминает, под каким blockhash ушел перевод, и для
+    повтора ждет новый.
+    """
+
+    def __init__(self, interval: float = BLOCKHASH_REFRESH_INTERVAL, max_age: float = BLOCKHASH_MAX_AGE):
+        self.interval = interval
+        self.max_age = max_age
+        self._current = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._transfers = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.reused = 0
+
+    def _store(self, response, endpoint: str) -> RecentBlockhash:
+        recent = RecentBlockhash(response.value.blockhash, response.value.last_valid_block_height,
+                                 endpoint, time.monotonic())
+        with self._lock:
+            self._current = recent
+            self.refreshes += 1
+        return recent
+
+    def _cached(self) -> Optional[RecentBlockhash]:
+        recent = self._current
+        with self._lock:
+            if recent is not None and recent.endpoint == current_endpoint() and recent.age < self.max_age:
+                self.hits += 1
+                return recent
+            self.misses += 1
+            return None
+
+    def refresh(self) -> RecentBlockhash:
+        """Запросить свежий blockhash и запомнить его"""
+        endpoint = current_endpoint()
+        return self._store(rpc_clients.client(endpoint).get_latest_blockhash(), endpoint)
+
+    async def refresh_async(self) -> RecentBlockhash:
+        endpoint = current_endpoint()
+        return self._store(await rpc_clients.async_client(endpoint).get_latest_blockhash(), endpoint)
+
+    def get(self) -> RecentBlockhash:
+        """Blockhash для новой транзакции"""
+        return self._cached() or self.refresh()
+
+    async def get_async(self) -> RecentBlockhash:
+        return self._cached() or await self.refresh_async()
+
+    def _claim(self, transfer: tuple, recent: RecentBlockhash) -> bool:
+        """Закрепить blockhash за переводом; False - этот перевод уже шел под ним"""
+        now = time.monotonic()
+        with self._lock:
+            used = self._transfers.get(transfer)
+            if used is not None and used[0] == recent.blockhash:
+                self.reused += 1
+                return False
+            for key in [key for key, (_, used_at) in self._transfers.items()
+                        if now - used_at > TRANSFER_MEMORY_SECONDS]:
+                del self._transfers[key]
+            self._transfers[transfer] = (recent.blockhash, now)
+            return True
+
+    def for_transfer(self, transfer: tuple) -> RecentBlockhash:
+        """Blockhash для перевода transfer = (отправитель, получатель, лампорты)"""
+        recent = self.get()
+        for attempt in range(BLOCKHASH_REUSE_RETRIES):
+            if self._claim(transfer, recent):
+                return recent
+            if attempt:
+                time.sleep(BLOCKHASH_REUSE_WAIT)
+            recent = self.refresh()
+        raise RuntimeError("Нет нового blockhash для повтора одинакового перевода")
+
+    async def for_transfer_async(self, transfer: tuple) -> RecentBlockhash:
+        recent = await self.get_async()
+        for attempt in range(BLOCKHASH_REUSE_RETRIES):
+            if self._claim(transfer, recent):
+                return recent
+            if attempt:
+                await asyncio.sleep(BLOCKHASH_REUSE_WAIT)
+            recent = await self.refresh_async()
+        raise RuntimeError("Нет нового blockhash для повтора одинакового перевода")
+
+    def invalidate(self):
+        """Забыть значение (например, после отклоненной отправки)"""
+        with self._lock:
+            self._current = None
+
+    def start(self):
+        """Запустить поток обновления (один раз на процесс)"""
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, name='blockhash-refresher', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток обновления"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        recent = self._current
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'errors': self.errors,
+                'reused': self.reused,
+                'age': round(recent.age, 1) if recent is not None else None,
+                'last_valid_block_height': recent.last_valid_block_height if recent is not None else None,
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"❌ Ошибка обновления blockhash: {e}")
+            self._stop.wait(self.interval)
+
+
+blockhash_provider = BlockhashProvider()
@@ -1,6 +1,5 @@
 import asyncio
 import json
-import base64
 import io
 import cfg
 import time
@@ -8,21 +7,50 @@ from datetime import datetime, timedelta
 from collections import defaultdict
 from functools import wraps
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from database import Database
+from async_database import AsyncDatabase
+from payment_dispatcher import PaymentDispatcher, notification_args
+from worker_dispatch import WorkerOffers
 from exchange_rate import calculate_commissions, get_sol_to_rub_rate
 from qr_generator import QRCodeManager
+from qr_store import qr_store
 from typing import Union
-from solana_wallet import UniversalSolanaWallet
+from solana_wallet import AsyncUniversalSolanaWallet
+from solana_rpc import rpc_clients
+from balance_cache import balance_cache
+from blockhash import blockhash_provider
 
 bot = Bot(token=cfg.TELEGRAM_BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 db = Database()
+adb = AsyncDatabase(db)
+worker_offers = WorkerOffers(adb)
+
+@dp.update.outer_middleware()
+async def role_index_middleware(handler, event, data):
+    """Сверка индекса ролей с БД в пуле потоков: is_worker() в обработчиках читает только память"""
+    try:
+        await adb.refresh_roles()
+    except Exception as e:
+        print(f"Ошибка обновления индекса ролей: {e}")
+    return await handler(event, data)
+
+@dp.update.outer_middleware()
+async def worker_heartbeat_middleware(handler, event, data):
+    """Любое действие воркера в боте - heartbeat для распределения платежей"""
+    user = data.get('event_from_user')
+    if user is not None and 'worker' in db.cached_role_set(user.id) and worker_offers.heartbeat_due(user.id):
+        try:
+            await adb.touch_worker_heartbeat(user.id)
+        except Exception as e:
+            print(f"Ошибка записи heartbeat воркера {user.id}: {e}")
+    return await handler(event, data)
 
 class BotRateLimiter:
     def __init__(self):
@@ -70,15 +98,11 @@ def is_admin(user_id: int) -> bool:
     return user_id in cfg.ADMIN_IDS
 
 def is_worker(user_id: int) -> bool:
-    """Проверка, является ли пользователь воркером (из конфига или БД)"""
-    if user_id in cfg.WORKER_IDS:
-        return True
-    
-    roles = db.get_user_roles(user_id)
-    return 'worker' in roles or is_admin(user_id)
+    """Проверка, является ли пользователь воркером (из конфига или БД, по индексу ролей в памяти)"""
+    return 'worker' in db.cached_role_set(user_id) or is_admin(user_id)
 
 def get_user_role_display(user_id: int) -> str:
-    roles = db.get_user_roles(user_id)
+    roles = db.cached_role_set(user_id)
     if 'admin' in roles:
         return "👑 Администратор"
     elif 'worker' in roles:
@@ -87,10 +111,14 @@ def get_user_role_display(user_id: int) -> str:
         return "👤 Пользователь"
 
 async def send_payment_to_workers(transaction_id: int, qr_code_data: str, 
-                                  qr_code_image: str, user_info: str, amount_rub: float, 
+                                  qr_image_hash: str, user_info: str, amount_rub: float, 
                                   worker_earnings_sol: float = None, real_transaction: bool = False, 
                                   admin_tx_hash: str = None, worker_tx_hash: str = None,
-                                  frozen_amount_sol: float = None):
+                                  frozen_amount_sol: float = None, worker_ids: list = None):
+    """Уведомить о новом платеже первую волну воркеров и админов; вернуть число отправленных.
+
+    worker_ids - отправить только этим воркерам (следующая волна из WorkerOffers.run)
+    """
     try:
         user_data = json.loads(user_info)
         
@@ -100,9 +128,9 @@ async def send_payment_to_workers(transaction_id: int, qr_code_data: str,
         elif qr_code_data.startswith('ST00012'):
             payment_url = f"https://qr.nspk.ru/proxy?qr={qr_code_data}"
         
-        user_wallet = db.get_user_wallet(user_data['user_id'], 'SOL')
+        user_wallet = await adb.get_user_wallet(user_data['user_id'], 'SOL')
         if user_wallet:
-            user_balance_sol = UniversalSolanaWallet.get_real_balance(user_wallet['wallet_address'])
+            user_balance_sol = await AsyncUniversalSolanaWallet.get_real_balance(user_wallet['wallet_address'])
         else:
             user_balance_sol = 0
             
@@ -194,25 +222,15 @@ async def send_payment_to_workers(transaction_id: int, qr_code_data: str,
         
         admin_keyboard = InlineKeyboardMarkup(inline_keyboard=admin_keyboard_buttons)
         
-        workers_from_db = db.get_all_workers()
-        worker_ids = [w['telegram_id'] for w in workers_from_db]
-        worker_ids.extend(cfg.WORKER_IDS)
-        worker_ids = list(set(worker_ids))
-        
-        print(f"[BOT] Отправка платежа {transaction_id} воркерам: {worker_ids}")
         print(f"[BOT] Воркер получит: {worker_earnings_display:.6f} SOL")
         print(f"[BOT] Баланс пользователя: {user_balance_sol:.6f} SOL, требуется: {frozen_amount_sol or 0:.6f} SOL, хватает: {balance_status}")
         
-        sent_count = 0
-        
-        for worker_id in worker_ids:
+        async def send_to_worker(worker_id: int) -> bool:
             try:
-                if qr_code_image:
+                if qr_image_hash:
                     try:
-                        image_data = base64.b64decode(qr_code_image)
-                        await bot.send_photo(
-                            chat_id=worker_id,
-                            photo=BufferedInputFile(image_data, filename='qr_code.png'),
+                        await qr_store.send_photo(
+                            bot, worker_id, qr_image_hash,
                             caption=worker_message,
                             reply_markup=worker_keyboard,
                             parse_mode='Markdown'
@@ -233,22 +251,30 @@ async def send_payment_to_workers(transaction_id: int, qr_code_data: str,
                         parse_mode='Markdown'
                     )
                 
-                sent_count += 1
                 print(f"[BOT] Уведомление отправлено воркеру {worker_id}")
+                return True
                     
             except Exception as e:
                 print(f"[BOT] Ошибка отправки воркеру {worker_id}: {e}")
+                return False
+        
+        if worker_ids is not None:
+            sent_count = 0
+            for worker_id in worker_ids:
+                if await send_to_worker(worker_id):
+                    sent_count += 1
+            return sent_count
         
-        admin_ids = cfg.ADMIN_IDS
+        # Воркерам - волнами по загрузке (worker_dispatch), админам - сразу всем
+        sent_count = await worker_offers.offer(transaction_id, send_to_worker)
         
-        for admin_id in admin_ids:
+        roster = await adb.get_roster_snapshot()
+        for admin_id in roster.admin_ids:
             try:
-                if qr_code_image:
+                if qr_image_hash:
                     try:
-                        image_data = base64.b64decode(qr_code_image)
-                        await bot.send_photo(
-                            chat_id=admin_id,
-                            photo=BufferedInputFile(image_data, filename='qr_code.png'),
+                        await qr_store.send_photo(
+                            bot, admin_id, qr_image_hash,
                             caption=admin_message,
                             reply_markup=admin_keyboard,
                             parse_mode='Markdown'
@@ -276,11 +302,13 @@ async def send_payment_to_workers(transaction_id: int, qr_code_data: str,
                 print(f"[BOT] Ошибка отправки админу {admin_id}: {e}")
         
         print(f"[BOT] Всего отправлено уведомлений: {sent_count}")
+        return sent_count
         
     except Exception as e:
         print(f"❌ Критическая ошибка в send_payment_to_workers: {e}")
         import traceback
         traceback.print_exc()
+        raise
 
 async def send_withdrawal_notification_from_flask(withdrawal_data):
     """Отправка уведомления о выводе из Flask контекста"""
@@ -410,22 +438,24 @@ async def cmd_sync_workers(message: Message):
     try:
         synced_count = 0
         for worker_id in cfg.WORKER_IDS:
-            user_roles = db.get_user_roles(worker_id)
+            user_roles = await adb.get_user_roles(worker_id)
             if 'worker' not in user_roles:
-                user = db.get_user_by_telegram_id(worker_id)
+                user = await adb.get_user_by_telegram_id(worker_id)
                 if not user:
-                    user_id = db.create_user(
+                    user_id = await adb.create_user(
                         telegram_id=worker_id,
                         username=None,
                         first_name=None,
                         last_name=None
                     )
-                    user = db.get_user_by_id(user_id)
+                    user = await adb.get_user_by_id(user_id)
                 
-                db.add_role(worker_id, 'worker', None)
+                await adb.add_role(worker_id, 'worker', None)
                 synced_count += 1
                 print(f"✅ Добавлен воркер {worker_id}")
         
+        await adb.reload_roles()
+        
         await message.answer(f"✅ Синхронизировано {synced_count} воркеров из конфига")
         
     except Exception as e:
@@ -472,22 +502,18 @@ async def cmd_reset_test_balance(message: Message):
         
         if target.startswith('@'):
             username = target[1:]
-            user = db.get_user_by_username(username)
+            user = await adb.get_user_by_username(username)
         else:
             telegram_id = int(target)
-            user = db.get_user_by_telegram_id(telegram_id)
+            user = await adb.get_user_by_telegram_id(telegram_id)
         
         if not user:
             await message.answer("❌ Пользователь не найден.")
             return
         
-        db.update_user_balance(user['id'], 'SOL', 0.0)
+        await adb.update_user_balance(user['id'], 'SOL', 0.0)
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM transactions WHERE user_id = ? AND transaction_type = "test_deposit"', (user['id'],))
-        conn.commit()
-        conn.close()
+        await adb.delete_test_transactions(user['id'])
         
         await message.answer(f"✅ Тестовый баланс пользователя {user.get('first_name', '')} (@{user.get('username', 'N/A')}) сброшен до 0.")
         
@@ -508,7 +534,7 @@ async def handle_approve(callback: CallbackQuery, state: FSMContext):
         return
     
     transaction_id = int(callback.data.split('_')[1])
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     
     if not transaction:
         await callback.answer("Транзакция не найдена", show_alert=True)
@@ -518,38 +544,38 @@ async def handle_approve(callback: CallbackQuery, state: FSMContext):
         await callback.answer(f"Транзакция уже обработана (статус: {transaction['status']})", show_alert=True)
         return
     
-    worker_user = db.get_user_by_telegram_id(callback.from_user.id)
+    worker_user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not worker_user:
-        worker_user_id = db.create_user(
+        worker_user_id = await adb.create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
             last_name=callback.from_user.last_name
         )
-        worker_user = db.get_user_by_id(worker_user_id)
+        worker_user = await adb.get_user_by_id(worker_user_id)
     else:
         worker_user_id = worker_user['id']
     
-    success = db.assign_worker_to_transaction(transaction_id, worker_user_id)
+    success = await adb.assign_worker_to_transaction(transaction_id, worker_user_id)
     
     if not success:
         await callback.answer("❌ Операция уже взята другим воркером", show_alert=True)
         return
     
-    payment_queue = db.get_payment_queue_by_transaction(transaction_id)
+    payment_queue = await adb.get_payment_queue_by_transaction(transaction_id)
     if not payment_queue:
         await callback.answer("❌ Данные о платеже не найдены", show_alert=True)
         return
     
     user_info = json.loads(payment_queue['user_info'])
     
-    db.update_transaction_status(
+    await adb.update_transaction_status(
         transaction_id=transaction_id,
         status='waiting_user_confirmation',
         worker_id=worker_user_id
     )
 
-    user = db.get_user_by_id(transaction['user_id'])
+    user = await adb.get_user_by_id(transaction['user_id'])
     
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
@@ -608,7 +634,7 @@ async def handle_approve(callback: CallbackQuery, state: FSMContext):
     except Exception as e:
         print(f"Не удалось отправить запрос подтверждения пользователю: {e}")
         await callback.answer("❌ Ошибка отправки запроса пользователю", show_alert=True)
-        db.update_transaction_status(
+        await adb.update_transaction_status(
             transaction_id=transaction_id,
             status='pending',
             worker_id=None
@@ -618,13 +644,13 @@ async def handle_approve(callback: CallbackQuery, state: FSMContext):
 async def handle_user_confirm(callback: CallbackQuery):
     """Пользователь подтверждает успешный платеж"""
     transaction_id = int(callback.data.split('_')[2])
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     
     if not transaction:
         await callback.answer("Транзакция не найдена", show_alert=True)
         return
     
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
@@ -655,13 +681,13 @@ async def handle_user_confirm(callback: CallbackQuery):
 async def handle_user_reject(callback: CallbackQuery):
     """Пользователь отклоняет платеж"""
     transaction_id = int(callback.data.split('_')[2])
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     
     if not transaction:
         await callback.answer("Транзакция не найдена", show_alert=True)
         return
     
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
@@ -675,15 +701,15 @@ async def handle_user_reject(callback: CallbackQuery):
         await callback.answer("Транзакция уже обработана", show_alert=True)
         return
     
-    db.update_transaction_status(
+    await adb.update_transaction_status(
         transaction_id=transaction_id,
         status='cancelled',
         error_message='Отклонено пользователем'
     )
     
-    db.unfreeze_user_balance(transaction['user_id'], 'SOL')
+    await adb.unfreeze_user_balance(transaction['user_id'], 'SOL')
     
-    worker_user = db.get_user_by_id(transaction['worker_id'])
+    worker_user = await adb.get_user_by_id(transaction['worker_id'])
     if worker_user:
         try:
             await bot.send_message(
@@ -709,8 +735,8 @@ async def process_successful_payment(transaction_id: int, user_id: int):
     try:
         print(f"🔄 Начало обработки успешного платежа для транзакции {transaction_id}, user_id: {user_id}")
         
-        transaction = db.get_transaction(transaction_id)
-        payment_queue = db.get_payment_queue_by_transaction(transaction_id)
+        transaction = await adb.get_transaction(transaction_id)
+        payment_queue = await adb.get_payment_queue_by_transaction(transaction_id)
         
         if not transaction:
             print(f"❌ Транзакция {transaction_id} не найдена")
@@ -727,13 +753,13 @@ async def process_successful_payment(transaction_id: int, user_id: int):
         
         print(f"📊 Данные платежа: frozen={frozen_amount_sol}, worker_earnings={worker_earnings_sol}, admin_commission={admin_commission_sol}")
         
-        user_wallet = db.get_user_wallet(transaction['user_id'], 'SOL')
+        user_wallet = await adb.get_user_wallet(transaction['user_id'], 'SOL')
         if not user_wallet or not user_wallet.get('private_key'):
             print(f"❌ Кошелек пользователя не найден для транзакции {transaction_id}")
             return
         
         print(f"📤 Отправка {admin_commission_sol:.6f} SOL админу...")
-        admin_result = UniversalSolanaWallet.send_sol_to_admin(
+        admin_result = await AsyncUniversalSolanaWallet.send_sol_to_admin(
             user_private_key=user_wallet['private_key'],
             admin_wallet=cfg.ADMIN_WALLET,
             amount_sol=admin_commission_sol
@@ -741,10 +767,10 @@ async def process_successful_payment(transaction_id: int, user_id: int):
         
         print(f"📤 Результат отправки админу: {admin_result['success']}")
         
-        worker_wallet = db.get_user_wallet(transaction['worker_id'], 'SOL')
+        worker_wallet = await adb.get_user_wallet(transaction['worker_id'], 'SOL')
         if worker_wallet:
             print(f"📤 Отправка {worker_earnings_sol:.6f} SOL воркеру...")
-            worker_result = UniversalSolanaWallet.send_sol_simple(
+            worker_result = await AsyncUniversalSolanaWallet.send_sol_simple(
                 from_private_key=user_wallet['private_key'],
                 to_address=worker_wallet['wallet_address'],
                 amount_sol=worker_earnings_sol
@@ -753,37 +779,29 @@ async def process_successful_payment(transaction_id: int, user_id: int):
         else:
             print(f"⚠️ Кошелек воркера не найден")
         
-        real_balance = UniversalSolanaWallet.get_real_balance(user_wallet['wallet_address'])
+        real_balance = await AsyncUniversalSolanaWallet.get_real_balance(user_wallet['wallet_address'])
         new_real_balance = real_balance - frozen_amount_sol
-        db.update_user_balance(transaction['user_id'], 'SOL', new_real_balance)
+        await adb.update_user_balance(transaction['user_id'], 'SOL', new_real_balance)
         
         print(f"💰 Баланс пользователя обновлен: {real_balance:.6f} -> {new_real_balance:.6f} SOL")
         
-        db.unfreeze_user_balance(transaction['user_id'], 'SOL')
+        await adb.unfreeze_user_balance(transaction['user_id'], 'SOL')
         
-        db.update_transaction_status(
+        await adb.update_transaction_status(
             transaction_id=transaction_id,
             status='completed'
         )
         
-        db.update_worker_stats(
+        await adb.update_worker_stats(
             worker_id=transaction['worker_id'],
             completed_payments=1,
             total_commission_rub=abs(transaction['amount_rub']) * 0.05, 
             total_processed_rub=abs(transaction['amount_rub'])
         )
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE payment_queue 
-            SET status = 'completed'
-            WHERE transaction_id = ?
-        ''', (transaction_id,))
-        conn.commit()
-        conn.close()
-        
-        worker_user = db.get_user_by_id(transaction['worker_id'])
+        await adb.update_payment_queue_status(transaction_id, 'completed')
+        
+        worker_user = await adb.get_user_by_id(transaction['worker_id'])
         if worker_user:
             try:
                 await bot.send_message(
@@ -821,26 +839,26 @@ async def process_amount(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        transaction = db.get_transaction(transaction_id)
+        transaction = await adb.get_transaction(transaction_id)
         if not transaction:
             await message.answer("❌ Транзакция не найдена")
             await state.clear()
             return
         
-        user = db.get_user_by_id(transaction['user_id'])
+        user = await adb.get_user_by_id(transaction['user_id'])
         if not user:
             await message.answer("❌ Пользователь не найден")
             await state.clear()
             return
         
-        user_wallet = db.get_user_wallet(transaction['user_id'], 'SOL')
+        user_wallet = await adb.get_user_wallet(transaction['user_id'], 'SOL')
         if not user_wallet or not user_wallet.get('private_key'):
             await message.answer("❌ Кошелек пользователя не найден")
             await state.clear()
             return
         
-        worker_user = db.get_user_by_telegram_id(message.from_user.id)
-        worker_wallet = db.get_user_wallet(worker_user['id'], 'SOL') if worker_user else None
+        worker_user = await adb.get_user_by_telegram_id(message.from_user.id)
+        worker_wallet = await adb.get_user_wallet(worker_user['id'], 'SOL') if worker_user else None
         
         if not worker_wallet:
             await message.answer("❌ У вас нет кошелька SOL. Зарегистрируйтесь на сайте.")
@@ -849,7 +867,7 @@ async def process_amount(message: Message, state: FSMContext):
         
         worker_earnings_sol = amount_rub * 0.05 / get_sol_to_rub_rate()
         
-        worker_result = UniversalSolanaWallet.send_sol_to_worker(
+        worker_result = await AsyncUniversalSolanaWallet.send_sol_to_worker(
             user_private_key=user_wallet['private_key'],
             worker_wallet=worker_wallet['wallet_address'],
             amount_sol=worker_earnings_sol
@@ -860,33 +878,16 @@ async def process_amount(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        db.update_transaction_status(
+        await adb.update_transaction_status(
             transaction_id=transaction_id,
             status='completed',
             worker_id=worker_user['id']
         )
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE transactions 
-            SET amount_rub = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (amount_rub, transaction_id))
-        conn.commit()
-        conn.close()
-        
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE payment_queue 
-            SET status = 'completed', assigned_worker_id = ?
-            WHERE transaction_id = ?
-        ''', (worker_user['id'], transaction_id))
-        conn.commit()
-        conn.close()
-        
-        db.update_worker_stats(
+        await adb.update_transaction_amount_rub(transaction_id, amount_rub)
+        await adb.update_payment_queue_status(transaction_id, 'completed', worker_user['id'])
+        
+        await adb.update_worker_stats(
             worker_id=worker_user['id'],
             completed_payments=1,
             total_commission_rub=amount_rub * 0.05,  
@@ -935,7 +936,7 @@ async def handle_error(callback: CallbackQuery, state: FSMContext):
         return
     
     transaction_id = int(callback.data.split('_')[1])
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     
     if not transaction:
         await callback.answer("Транзакция не найдена", show_alert=True)
@@ -945,9 +946,9 @@ async def handle_error(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Транзакция уже обработана", show_alert=True)
         return
     
-    worker_user = db.get_user_by_telegram_id(callback.from_user.id)
+    worker_user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not worker_user:
-        worker_user_id = db.create_user(
+        worker_user_id = await adb.create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
@@ -956,7 +957,7 @@ async def handle_error(callback: CallbackQuery, state: FSMContext):
     else:
         worker_user_id = worker_user['id']
     
-    success = db.assign_worker_to_transaction(transaction_id, worker_user_id)
+    success = await adb.assign_worker_to_transaction(transaction_id, worker_user_id)
     
     if not success:
         await callback.answer("❌ Операция уже взята другим воркером", show_alert=True)
@@ -983,9 +984,9 @@ async def process_error(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    worker_user = db.get_user_by_telegram_id(message.from_user.id)
+    worker_user = await adb.get_user_by_telegram_id(message.from_user.id)
     if not worker_user:
-        worker_user_id = db.create_user(
+        worker_user_id = await adb.create_user(
             telegram_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name,
@@ -994,31 +995,23 @@ async def process_error(message: Message, state: FSMContext):
     else:
         worker_user_id = worker_user['id']
     
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     if transaction:
         user_id = transaction['user_id']
-        db.unfreeze_user_balance(user_id, 'SOL')
+        await adb.unfreeze_user_balance(user_id, 'SOL')
     
-    db.update_transaction_status(
+    await adb.update_transaction_status(
         transaction_id=transaction_id,
         status='error',
         worker_id=worker_user_id,
         error_message=error_text
     )
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE payment_queue 
-        SET status = 'error', assigned_worker_id = ?
-        WHERE transaction_id = ?
-    ''', (worker_user_id, transaction_id))
-    conn.commit()
-    conn.close()
+    await adb.update_payment_queue_status(transaction_id, 'error', worker_user_id)
     
     try:
-        user = db.get_user_by_id(transaction['user_id'])
-        current_balance = db.get_user_balance(user_id, 'SOL')
+        user = await adb.get_user_by_id(transaction['user_id'])
+        current_balance = await adb.get_user_balance(user_id, 'SOL')
         await bot.send_message(
             user['telegram_id'],
             f"❌ *Платеж отменен*\n\n"
@@ -1056,7 +1049,7 @@ async def handle_cancel(callback: CallbackQuery):
         await callback.answer("❌ Только для администраторов", show_alert=True)
         return
     
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     
     if not transaction:
         await callback.answer("❌ Транзакция не найдена", show_alert=True)
@@ -1066,9 +1059,9 @@ async def handle_cancel(callback: CallbackQuery):
         await callback.answer("❌ Транзакция уже обработана", show_alert=True)
         return
     
-    admin_user = db.get_user_by_telegram_id(callback.from_user.id)
+    admin_user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not admin_user:
-        admin_user_id = db.create_user(
+        admin_user_id = await adb.create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
@@ -1077,28 +1070,18 @@ async def handle_cancel(callback: CallbackQuery):
     else:
         admin_user_id = admin_user['id']
     
-    db.update_transaction_status(
+    await adb.update_transaction_status(
         transaction_id=transaction_id,
         status='cancelled',
         admin_id=admin_user_id,
         error_message='Отменено администратором'
     )
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE payment_queue 
-        SET status = 'cancelled', assigned_worker_id = ?
-        WHERE transaction_id = ?
-    ''', (admin_user_id, transaction_id))
-    conn.commit()
-    conn.close()
+    await adb.update_payment_queue_status(transaction_id, 'cancelled', admin_user_id)
     
     user_id = transaction['user_id']
     amount_sol = abs(transaction['amount'])
-    current_balance = db.get_user_balance(user_id, 'SOL')
-    new_balance = current_balance + amount_sol
-    db.update_user_balance(user_id, 'SOL', new_balance)
+    new_balance = await adb.increment_user_balance(user_id, 'SOL', amount_sol)
     
     await callback.answer("✅ Транзакция отменена")
     
@@ -1116,7 +1099,7 @@ async def handle_cancel(callback: CallbackQuery):
         )
     
     try:
-        user = db.get_user_by_id(user_id)
+        user = await adb.get_user_by_id(user_id)
         if user and user.get('telegram_id'):
             await bot.send_message(
                 user['telegram_id'],
@@ -1135,7 +1118,7 @@ async def handle_pending_operations(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    pending_txs = db.get_pending_transactions_for_admin()
+    pending_txs = await adb.get_pending_transactions_for_admin()
     
     if not pending_txs:
         await callback.answer("Нет ожидающих операций", show_alert=True)
@@ -1175,7 +1158,7 @@ async def handle_admin_take_operation(callback: CallbackQuery):
     
     transaction_id = int(callback.data.split('_')[2])
     
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     if not transaction:
         await callback.answer("❌ Транзакция не найдена", show_alert=True)
         return
@@ -1184,9 +1167,9 @@ async def handle_admin_take_operation(callback: CallbackQuery):
         await callback.answer(f"❌ Транзакция уже обработана (статус: {transaction['status']})", show_alert=True)
         return
     
-    admin_user = db.get_user_by_telegram_id(callback.from_user.id)
+    admin_user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not admin_user:
-        admin_user_id = db.create_user(
+        admin_user_id = await adb.create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
             first_name=callback.from_user.first_name,
@@ -1195,13 +1178,13 @@ async def handle_admin_take_operation(callback: CallbackQuery):
     else:
         admin_user_id = admin_user['id']
     
-    success = db.assign_worker_to_transaction(transaction_id, admin_user_id)
+    success = await adb.assign_worker_to_transaction(transaction_id, admin_user_id)
     
     if success:
         await callback.answer("✅ Операция взята в работу")
         
-        transaction = db.get_transaction(transaction_id)
-        user = db.get_user_by_id(transaction['user_id'])
+        transaction = await adb.get_transaction(transaction_id)
+        user = await adb.get_user_by_id(transaction['user_id'])
         
         message_text = f"""
 🔔 Операция взята в работу
@@ -1240,10 +1223,10 @@ async def cmd_start(message: Message):
     import string
     
     if message.from_user.id in cfg.WORKER_IDS:
-        user_roles = db.get_user_roles(message.from_user.id)
+        user_roles = await adb.get_user_roles(message.from_user.id)
         if 'worker' not in user_roles:
             try:
-                db.add_role(message.from_user.id, 'worker', None)
+                await adb.add_role(message.from_user.id, 'worker', None)
                 print(f"✅ Автоматически добавлен воркер {message.from_user.id}")
             except Exception as e:
                 print(f"⚠️ Ошибка добавления воркера: {e}")
@@ -1267,7 +1250,7 @@ async def cmd_start(message: Message):
             await message.answer("Неверная ссылка. Используйте ссылку с сайта.")
             return
         
-        session = db.get_session_code(session_code)
+        session = await adb.get_session_code(session_code)
         if not session:
             await message.answer("❌ Ссылка недействительна или истекла. Попробуйте снова с сайта.")
             return
@@ -1278,7 +1261,7 @@ async def cmd_start(message: Message):
         
         auth_code = ''.join(secrets.choice(string.digits) for _ in range(6))
         
-        db.create_auth_code(
+        await adb.create_auth_code(
             code=auth_code,
             telegram_id=message.from_user.id,
             username=message.from_user.username,
@@ -1288,9 +1271,9 @@ async def cmd_start(message: Message):
             expires_in_minutes=10
         )
         
-        db.update_session_code_with_auth(session_code, auth_code, message.from_user.id)
+        await adb.update_session_code_with_auth(session_code, auth_code, message.from_user.id)
         
-        db.mark_session_code_as_used(session_code)
+        await adb.mark_session_code_as_used(session_code)
         
         action_text = "регистрации" if code_type == 'register' else "входа"
         await message.answer(
@@ -1314,7 +1297,7 @@ async def handle_quick_payment(message: Message, transaction_id: int):
         await message.answer("❌ У вас нет доступа к оплате платежей.")
         return
     
-    transaction = db.get_transaction(transaction_id)
+    transaction = await adb.get_transaction(transaction_id)
     if not transaction:
         await message.answer("❌ Транзакция не найдена.")
         return
@@ -1323,7 +1306,7 @@ async def handle_quick_payment(message: Message, transaction_id: int):
         await message.answer("❌ Транзакция уже обработана.")
         return
     
-    user = db.get_user_by_id(transaction['user_id'])
+    user = await adb.get_user_by_id(transaction['user_id'])
     amount_rub = transaction['amount_rub'] or 100
     
     message_text = f"""
@@ -1364,7 +1347,7 @@ async def show_profile(message: Union[Message, CallbackQuery]):
         message_obj = message
         is_callback = False
     
-    user = db.get_user_by_telegram_id(user_id)
+    user = await adb.get_user_by_telegram_id(user_id)
     
     if not user:
         help_text = f"Привет, {message.from_user.first_name}!\n\n"
@@ -1385,7 +1368,7 @@ async def show_profile(message: Union[Message, CallbackQuery]):
     
     role_display = get_user_role_display(user_id)
     
-    balance_sol = db.get_user_balance(user['id'], 'SOL')
+    balance_sol = await adb.get_user_balance(user['id'], 'SOL')
     rate = get_sol_to_rub_rate()
     balance_rub = balance_sol * rate * 0.9
     
@@ -1393,7 +1376,7 @@ async def show_profile(message: Union[Message, CallbackQuery]):
     
     stats_text = ""
     if is_worker(user_id):
-        stats = db.get_worker_stats(user['id'])
+        stats = await adb.get_worker_stats(user['id'])
         if stats:
             stats_text = f"\n📊 *Ваш заработок:*\n"
             stats_text += f"• Обработано платежей: {stats['completed_payments']}\n"
@@ -1415,8 +1398,8 @@ async def show_profile(message: Union[Message, CallbackQuery]):
     keyboard = InlineKeyboardMarkup(inline_keyboard=[])
     
     if is_admin(user_id):
-        pending_count = len(db.get_pending_transactions_for_admin())
-        withdrawal_count = len(db.get_pending_withdrawals())
+        pending_count = len(await adb.get_pending_transactions_for_admin())
+        withdrawal_count = len(await adb.get_pending_withdrawals())
         
         keyboard.inline_keyboard.extend([
             [InlineKeyboardButton(text=f"📋 Ожидающие операции ({pending_count})", callback_data="pending_operations")],
@@ -1426,7 +1409,7 @@ async def show_profile(message: Union[Message, CallbackQuery]):
         ])
     
     elif is_worker(user_id) and not is_admin(user_id):
-        stats = db.get_worker_stats(user['id'])
+        stats = await adb.get_worker_stats(user['id'])
         has_earnings = stats and stats['total_commission_rub'] > 0
         
         keyboard.inline_keyboard.extend([
@@ -1482,12 +1465,12 @@ async def show_profile(message: Union[Message, CallbackQuery]):
 
 @dp.callback_query(F.data == "deposit")
 async def handle_deposit(callback: CallbackQuery):
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
     
-    wallet = db.get_user_wallet(user['id'], 'SOL')
+    wallet = await adb.get_user_wallet(user['id'], 'SOL')
     if not wallet:
         await callback.answer("❌ Кошелек не найден", show_alert=True)
         return
@@ -1525,8 +1508,8 @@ async def handle_admin_panel(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    pending_count = len(db.get_pending_transactions_for_admin())
-    withdrawal_count = len(db.get_pending_withdrawals())
+    pending_count = len(await adb.get_pending_transactions_for_admin())
+    withdrawal_count = len(await adb.get_pending_withdrawals())
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"📋 Ожидающие операции ({pending_count})", callback_data="pending_operations")],
@@ -1575,17 +1558,17 @@ async def handle_network_management(callback: CallbackQuery):
 @dp.message(Command("wallet_info"))
 async def cmd_wallet_info(message: Message):
     """Информация о кошельке"""
-    user = db.get_user_by_telegram_id(message.from_user.id)
+    user = await adb.get_user_by_telegram_id(message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы.")
         return
     
-    wallet = db.get_user_wallet(user['id'], 'SOL')
+    wallet = await adb.get_user_wallet(user['id'], 'SOL')
     if not wallet:
         await message.answer("❌ Кошелек не найден.")
         return
     
-    balance = UniversalSolanaWallet.get_balance(wallet['wallet_address'])
+    balance = await AsyncUniversalSolanaWallet.get_balance(wallet['wallet_address'])
     
     network_info = "MAINNET (реальные средства)" if cfg.IS_MAINNET else "DEVNET (тестовые средства)"
     network_emoji = "💰" if cfg.IS_MAINNET else "🛠️"
@@ -1624,6 +1607,20 @@ async def cmd_network_status(message: Message):
     
     network_status += f"\n🔗 RPC: {cfg.SOLANA_RPC_URL}"
     
+    rpc_stats = rpc_clients.stats()
+    if rpc_stats:
+        network_status += "\n\n📡 *RPC соединения:*\n"
+        for endpoint, stats in rpc_stats.items():
+            network_status += (f"• {endpoint}{'' if stats['active'] else ' (неактивен)'}: "
+                               f"сессий {stats['sessions']}, запросов {stats['requests']}, "
+                               f"ошибок {stats['errors']}, среднее {stats['avg_ms']} мс, "
+                               f"макс {stats['max_ms']} мс\n")
+    
+    blockhash_stats = blockhash_provider.stats()
+    if blockhash_stats['age'] is not None:
+        network_status += (f"\n🧱 Blockhash: возраст {blockhash_stats['age']} с, обновлений {blockhash_stats['refreshes']}, "
+                           f"выдано из кеша {blockhash_stats['hits']}\n")
+    
     await message.answer(network_status, parse_mode='Markdown')
 
 @dp.message(Command("switch_network"))
@@ -1697,6 +1694,7 @@ async def handle_confirm_switch(callback: CallbackQuery):
             f.write(new_rpc_content)
         
         importlib.reload(cfg)
+        rpc_clients.reset()
         
         await callback.message.edit_text(
             f"✅ Сеть успешно переключена!\n\n"
@@ -1729,7 +1727,7 @@ async def handle_system_stats(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    stats = db.get_system_stats()
+    stats = await adb.get_system_stats()
     
     total_users = stats.get('total_users', 0)
     active_users = stats.get('active_users', 0)
@@ -1738,6 +1736,8 @@ async def handle_system_stats(callback: CallbackQuery):
     completed_volume_rub = stats.get('completed_volume_rub', 0)
     total_worker_commission = stats.get('total_worker_commission', 0)
     total_admin_commission = stats.get('total_admin_commission', 0)
+    cache_stats = db.cache_stats()
+    balance_stats = balance_cache.stats()
     
     stats_text = f"""
 📊 Статистика системы:
@@ -1753,6 +1753,9 @@ async def handle_system_stats(callback: CallbackQuery):
 💰 Комиссии:
 • Воркеры: {total_worker_commission:.0f} ₽
 • Админы: {total_admin_commission:.0f} ₽
+
+🧠 Кеш БД: {cache_stats['hit_ratio'] * 100:.0f}% попаданий ({cache_stats['size']} записей)
+💎 Кеш балансов: {balance_stats['hit_ratio'] * 100:.0f}% попаданий, объединено запросов: {balance_stats['coalesced']}
     """
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1793,13 +1796,13 @@ async def process_add_worker(message: Message, state: FSMContext):
     try:
         telegram_id = int(message.text)
         
-        admin_user = db.get_user_by_telegram_id(message.from_user.id)
+        admin_user = await adb.get_user_by_telegram_id(message.from_user.id)
         added_by = admin_user['id'] if admin_user else None
         
         try:
-            db.add_role(telegram_id, 'worker', added_by)
+            await adb.add_role(telegram_id, 'worker', added_by)
             
-            target_user = db.get_user_by_telegram_id(telegram_id)
+            target_user = await adb.get_user_by_telegram_id(telegram_id)
             if target_user:
                 await message.answer(f"✅ Пользователь {target_user.get('first_name', '')} (@{target_user.get('username', 'N/A')}) добавлен как воркер.")
             else:
@@ -1822,7 +1825,8 @@ async def handle_view_worker_wallets(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    workers = db.get_all_workers()
+    # Один запрос (воркеры из БД и конфига) вместо поиска пользователя и кошелька по каждому воркеру
+    workers = await adb.get_all_workers_with_wallets()
     
     if not workers:
         await callback.answer("❌ Нет зарегистрированных воркеров", show_alert=True)
@@ -1830,22 +1834,24 @@ async def handle_view_worker_wallets(callback: CallbackQuery):
     
     message_text = "👨‍💼 *Кошельки и балансы воркеров:*\n\n"
     
+    # Все балансы пачками getMultipleAccounts: ceil(N/100) запросов вместо N
+    balances = await AsyncUniversalSolanaWallet.get_balances(
+        [worker['wallet_address'] for worker in workers if worker['wallet_address']]
+    )
+    
     for worker in workers:
-        user = db.get_user_by_telegram_id(worker['telegram_id'])
-        if user:
-            wallet = db.get_user_wallet(user['id'], 'SOL')
-            if wallet:
-                real_balance = UniversalSolanaWallet.get_real_balance(wallet['wallet_address'])
-                
-                message_text += f"👤 *{user.get('first_name', 'N/A')}* (@{user.get('username', 'N/A')})\n"
-                message_text += f"🏦 Адрес: `{wallet['wallet_address']}`\n"
-                message_text += f"💰 Баланс: *{real_balance:.6f} SOL*\n"
-                message_text += f"🔑 Приватный ключ: `{wallet['private_key']}`\n"
-                message_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
-            else:
-                message_text += f"👤 *{user.get('first_name', 'N/A')}* - ❌ Кошелек не создан\n\n"
-        else:
+        if worker['user_id'] is None:
             message_text += f"👤 ID {worker['telegram_id']} - ❌ Пользователь не найден в БД\n\n"
+        elif worker['wallet_address']:
+            real_balance = balances.get(worker['wallet_address'], 0.0)
+            
+            message_text += f"👤 *{worker.get('first_name') or 'N/A'}* (@{worker.get('username') or 'N/A'})\n"
+            message_text += f"🏦 Адрес: `{worker['wallet_address']}`\n"
+            message_text += f"💰 Баланс: *{real_balance:.6f} SOL*\n"
+            message_text += f"🔑 Приватный ключ: `{worker['private_key']}`\n"
+            message_text += "━━━━━━━━━━━━━━━━━━━━\n\n"
+        else:
+            message_text += f"👤 *{worker.get('first_name') or 'N/A'}* - ❌ Кошелек не создан\n\n"
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔄 Обновить балансы", callback_data="refresh_worker_balances")],
@@ -1888,9 +1894,9 @@ async def process_remove_worker(message: Message, state: FSMContext):
     try:
         telegram_id = int(message.text)
         
-        db.remove_role(telegram_id, 'worker')
+        await adb.remove_role(telegram_id, 'worker')
         
-        target_user = db.get_user_by_telegram_id(telegram_id)
+        target_user = await adb.get_user_by_telegram_id(telegram_id)
         if target_user:
             await message.answer(f"✅ Пользователь {target_user.get('first_name', '')} (@{target_user.get('username', 'N/A')}) удален из воркеров.")
         else:
@@ -1909,7 +1915,7 @@ async def handle_top_workers(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    top_workers = db.get_top_workers(10)
+    top_workers = await adb.get_top_workers(10)
     
     if not top_workers:
         workers_text = "📊 Нет данных о воркерах"
@@ -1935,7 +1941,7 @@ async def handle_list_workers(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    workers = db.get_all_workers()
+    workers = await adb.get_all_workers()
     for worker_id in cfg.WORKER_IDS:
         if not any(w['telegram_id'] == worker_id for w in workers):
             workers.append({'telegram_id': worker_id})
@@ -1945,7 +1951,7 @@ async def handle_list_workers(callback: CallbackQuery):
     else:
         worker_list = "📋 Список воркеров:\n\n"
         for worker in workers:
-            user = db.get_user_by_telegram_id(worker['telegram_id'])
+            user = await adb.get_user_by_telegram_id(worker['telegram_id'])
             if user:
                 name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or user.get('username', 'N/A')
                 worker_list += f"• {name} (@{user.get('username', 'N/A')}) - ID: {worker['telegram_id']}\n"
@@ -1965,8 +1971,8 @@ async def handle_worker_stats(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    user = db.get_user_by_telegram_id(callback.from_user.id)
-    stats = db.get_worker_stats(user['id'])
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
+    stats = await adb.get_worker_stats(user['id'])
     
     if stats:
         stats_text = f"""
@@ -1990,16 +1996,16 @@ async def handle_worker_stats(callback: CallbackQuery):
 @dp.callback_query(F.data == "refresh_balance")
 async def handle_refresh_balance(callback: CallbackQuery):
     """Обновление баланса с обработкой ошибок"""
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Пользователь не найден", show_alert=True)
         return
     
-    wallet = db.get_user_wallet(user['id'], 'SOL')
+    wallet = await adb.get_user_wallet(user['id'], 'SOL')
     if wallet:
         try:
-            balance = UniversalSolanaWallet.get_balance(wallet['wallet_address'])   
-            db.update_user_balance(user['id'], 'SOL', balance)
+            balance = await AsyncUniversalSolanaWallet.get_balance(wallet['wallet_address'])   
+            await adb.update_user_balance(user['id'], 'SOL', balance)
             await callback.answer("✅ Баланс обновлен!")
         except Exception as e:
             await callback.answer("❌ Ошибка обновления баланса", show_alert=True)
@@ -2015,12 +2021,12 @@ async def handle_refresh_balance(callback: CallbackQuery):
 
 @dp.callback_query(F.data == "withdraw")
 async def handle_withdraw(callback: CallbackQuery, state: FSMContext):
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("Пользователь не найден", show_alert=True)
         return
     
-    balance_sol = db.get_user_balance(user['id'], 'SOL')
+    balance_sol = await adb.get_user_balance(user['id'], 'SOL')
     
     if balance_sol <= 0:
         await callback.answer("❌ На балансе нет средств для вывода", show_alert=True)
@@ -2054,7 +2060,7 @@ async def process_withdrawal_amount(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        balance_sol = db.get_user_balance(user_id, 'SOL')
+        balance_sol = await adb.get_user_balance(user_id, 'SOL')
         
         if amount_sol > balance_sol:
             await message.answer(f"❌ Недостаточно средств. Доступно: {balance_sol:.6f} SOL")
@@ -2078,7 +2084,7 @@ async def handle_withdrawal_requests(callback: CallbackQuery):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    pending_withdrawals = db.get_pending_withdrawals()
+    pending_withdrawals = await adb.get_pending_withdrawals()
     
     if not pending_withdrawals:
         await callback.answer("❌ Нет ожидающих заявок на вывод", show_alert=True)
@@ -2119,7 +2125,7 @@ async def handle_process_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[2])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -2129,7 +2135,7 @@ async def handle_process_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     request_type = "заработка" if withdrawal.get('request_type') == 'earnings' else "баланса"
     
     message_text = f"""
@@ -2171,7 +2177,7 @@ async def handle_complete_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[2])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -2181,11 +2187,9 @@ async def handle_complete_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     
     try:
-        from solana_wallet import UniversalSolanaWallet
-        
         admin_private_key = getattr(cfg, 'ADMIN_PRIVATE_KEY', None)
         
         if not admin_private_key:
@@ -2196,16 +2200,16 @@ async def handle_complete_withdrawal(callback: CallbackQuery):
             )
             return
         
-        withdrawal_result = UniversalSolanaWallet.send_sol(
+        withdrawal_result = await AsyncUniversalSolanaWallet.send_sol(
             from_private_key=admin_private_key,
             to_address=withdrawal['wallet_address'],
             amount_sol=withdrawal['amount_sol']
         )
         
         if withdrawal_result['success']:
-            db.update_withdrawal_status(withdrawal_id, 'completed')
+            await adb.update_withdrawal_status(withdrawal_id, 'completed')
             
-            db.create_transaction(
+            await adb.create_transaction(
                 user_id=withdrawal['user_id'],
                 transaction_type='withdrawal',
                 currency='SOL',
@@ -2265,7 +2269,7 @@ async def handle_reject_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[2])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -2275,18 +2279,16 @@ async def handle_reject_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     
-    db.update_withdrawal_status(withdrawal_id, 'rejected')
+    await adb.update_withdrawal_status(withdrawal_id, 'rejected')
     
     if withdrawal.get('request_type') == 'balance':
-        current_balance = db.get_user_balance(withdrawal['user_id'], 'SOL')
-        new_balance = current_balance + withdrawal['amount_sol']
-        db.update_user_balance(withdrawal['user_id'], 'SOL', new_balance)
+        await adb.increment_user_balance(withdrawal['user_id'], 'SOL', withdrawal['amount_sol'])
     
     elif withdrawal.get('request_type') == 'earnings':
         earnings_rub = withdrawal['amount_sol'] * get_sol_to_rub_rate()
-        db.update_worker_stats(
+        await adb.update_worker_stats(
             worker_id=withdrawal['user_id'],
             completed_payments=0,
             total_commission_rub=earnings_rub,
@@ -2297,7 +2299,7 @@ async def handle_reject_withdrawal(callback: CallbackQuery):
     
     try:
         if withdrawal.get('request_type') == 'balance':
-            current_balance = db.get_user_balance(withdrawal['user_id'], 'SOL')
+            current_balance = await adb.get_user_balance(withdrawal['user_id'], 'SOL')
             balance_text = f"💎 Средства возвращены на ваш баланс.\n💰 Новый баланс: {current_balance:.6f} SOL"
         else:
             balance_text = "💼 Заработок возвращен в ваш баланс комиссий."
@@ -2345,15 +2347,15 @@ async def process_withdrawal_address(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    user = db.get_user_by_id(user_id)
+    user = await adb.get_user_by_id(user_id)
     
     if is_earnings:
         available_earnings = data.get('available_earnings', 0)
         amount_sol = available_earnings / get_sol_to_rub_rate()
         
-        withdrawal_id = db.create_withdrawal_request(user_id, amount_sol, wallet_address, 'earnings')
+        withdrawal_id = await adb.create_withdrawal_request(user_id, amount_sol, wallet_address, 'earnings')
         
-        db.update_worker_stats(
+        await adb.update_worker_stats(
             worker_id=user_id,
             completed_payments=0,
             total_commission_rub=-available_earnings,
@@ -2372,9 +2374,9 @@ async def process_withdrawal_address(message: Message, state: FSMContext):
         )
         
     else:
-        withdrawal_id = db.create_withdrawal_request(user_id, amount_sol, wallet_address, 'balance')
+        withdrawal_id = await adb.create_withdrawal_request(user_id, amount_sol, wallet_address, 'balance')
         
-        db.decrement_user_balance(user_id, 'SOL', amount_sol)
+        await adb.decrement_user_balance(user_id, 'SOL', amount_sol)
         
         await message.answer(
             f"✅ *Заявка на вывод создана!*\n\n"
@@ -2464,8 +2466,8 @@ async def cmd_profile(message: Message):
 @dp.message(Command("stats"))
 async def cmd_stats(message: Message):
     if is_worker(message.from_user.id):
-        user = db.get_user_by_telegram_id(message.from_user.id)
-        stats = db.get_worker_stats(user['id'])
+        user = await adb.get_user_by_telegram_id(message.from_user.id)
+        stats = await adb.get_worker_stats(user['id'])
         
         if stats:
             stats_text = f"""
@@ -2480,7 +2482,7 @@ async def cmd_stats(message: Message):
         
         await message.answer(stats_text, parse_mode='Markdown')
     elif is_admin(message.from_user.id):
-        stats = db.get_system_stats()
+        stats = await adb.get_system_stats()
         
         total_users = stats.get('total_users', 0)
         active_users = stats.get('active_users', 0)
@@ -2489,6 +2491,8 @@ async def cmd_stats(message: Message):
         completed_volume_rub = stats.get('completed_volume_rub', 0)
         total_worker_commission = stats.get('total_worker_commission', 0)
         total_admin_commission = stats.get('total_admin_commission', 0)
+        cache_stats = db.cache_stats()
+        balance_stats = balance_cache.stats()
         
         stats_text = f"""
 📊 Статистика системы:
@@ -2504,12 +2508,35 @@ async def cmd_stats(message: Message):
 💰 Комиссии:
 • Воркеры: {total_worker_commission:.0f} ₽
 • Админы: {total_admin_commission:.0f} ₽
+
+🧠 Кеш БД: {cache_stats['hit_ratio'] * 100:.0f}% попаданий ({cache_stats['size']} записей)
+💎 Кеш балансов: {balance_stats['hit_ratio'] * 100:.0f}% попаданий, объединено запросов: {balance_stats['coalesced']}
         """
         
         await message.answer(stats_text, parse_mode='Markdown')
     else:
         await message.answer("❌ У вас нет доступа к статистике")
 
+@dp.message(Command("repair_stats"))
+async def cmd_repair_stats(message: Message):
+    """Пересчитать счетчики статистики системы с нуля"""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    try:
+        diff = await adb.rebuild_system_stats()
+        
+        if not diff:
+            await message.answer("✅ Счетчики статистики пересчитаны, расхождений нет")
+            return
+        
+        lines = [f"• {name}: {values['before']} → {values['after']}" for name, values in diff.items()]
+        await message.answer("🔧 Счетчики статистики исправлены:\n" + "\n".join(lines))
+        
+    except Exception as e:
+        await message.answer(f"❌ Ошибка пересчета статистики: {str(e)}")
+
 @dp.message(Command("add_worker"))
 async def cmd_add_worker(message: Message):
     if not is_admin(message.from_user.id):
@@ -2524,13 +2551,13 @@ async def cmd_add_worker(message: Message):
         
         telegram_id = int(args[1])
         
-        admin_user = db.get_user_by_telegram_id(message.from_user.id)
+        admin_user = await adb.get_user_by_telegram_id(message.from_user.id)
         added_by = admin_user['id'] if admin_user else None
         
         try:
-            db.add_role(telegram_id, 'worker', added_by)
+            await adb.add_role(telegram_id, 'worker', added_by)
             
-            target_user = db.get_user_by_telegram_id(telegram_id)
+            target_user = await adb.get_user_by_telegram_id(telegram_id)
             if target_user:
                 await message.answer(f"✅ Пользователь {target_user.get('first_name', '')} (@{target_user.get('username', 'N/A')}) добавлен как воркер.")
             else:
@@ -2557,9 +2584,9 @@ async def cmd_remove_worker(message: Message):
             return
         
         telegram_id = int(args[1])
-        db.remove_role(telegram_id, 'worker')
+        await adb.remove_role(telegram_id, 'worker')
         
-        target_user = db.get_user_by_telegram_id(telegram_id)
+        target_user = await adb.get_user_by_telegram_id(telegram_id)
         if target_user:
             await message.answer(f"✅ Пользователь {target_user.get('first_name', '')} (@{target_user.get('username', 'N/A')}) удален из воркеров.")
         else:
@@ -2576,7 +2603,7 @@ async def cmd_list_workers(message: Message):
         await message.answer("❌ У вас нет прав для выполнения этой команды.")
         return
     
-    workers = db.get_all_workers()
+    workers = await adb.get_all_workers()
     for worker_id in cfg.WORKER_IDS:
         if not any(w['telegram_id'] == worker_id for w in workers):
             workers.append({'telegram_id': worker_id})
@@ -2587,7 +2614,7 @@ async def cmd_list_workers(message: Message):
     
     worker_list = []
     for worker in workers:
-        user = db.get_user_by_telegram_id(worker['telegram_id'])
+        user = await adb.get_user_by_telegram_id(worker['telegram_id'])
         if user:
             name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or user.get('username', 'N/A')
             worker_list.append(f"• {name} (@{user.get('username', 'N/A')}) - ID: {worker['telegram_id']}")
@@ -2606,8 +2633,8 @@ async def cmd_status(message: Message):
         await message.answer("❌ У вас нет прав для выполнения этой команды.")
         return
     
-    free_workers = db.get_free_workers()
-    busy_count = db.get_busy_workers_count()
+    free_workers = await adb.get_free_workers()
+    busy_count = await adb.get_busy_workers_count()
     
     status_text = f"📊 Статус воркеров:\n\n"
     status_text += f"🟢 Свободно: {len(free_workers)}\n"
@@ -2621,7 +2648,11 @@ async def cmd_status(message: Message):
         for worker in free_workers:
             name = f"{worker.get('first_name', '')}".strip() or worker.get('username', 'N/A')
             status_text += f"• {name} (@{worker.get('username', 'N/A')})\n"
-    
+
+    offers = worker_offers.stats()
+    status_text += (f"\n📮 Распределение: {offers['strategy']}, платежей: {offers['offered']}, "
+                    f"сообщений воркерам: {offers['sent']}, расширений: {offers['widened']}\n")
+
     await message.answer(status_text)
 
 @dp.message(Command("addbalance"))
@@ -2643,23 +2674,15 @@ async def cmd_addbalance(message: Message):
             await message.answer("❌ Сумма должна быть больше нуля.")
             return
         
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        user_row = cursor.fetchone()
-        conn.close()
+        user = await adb.get_user_by_username(username)
         
-        if not user_row:
+        if not user:
             await message.answer(f"❌ Пользователь @{username} не найден.")
             return
         
-        user = dict(user_row)
+        new_balance = await adb.increment_user_balance(user['id'], 'SOL', amount)
         
-        current_balance = db.get_user_balance(user['id'], 'SOL')
-        new_balance = current_balance + amount
-        db.update_user_balance(user['id'], 'SOL', new_balance)
-        
-        db.create_transaction(
+        await adb.create_transaction(
             user_id=user['id'],
             transaction_type='deposit',
             currency='SOL',
@@ -2696,13 +2719,13 @@ async def handle_profile_button(message: Message):
 
 @dp.message(F.text == "📊 Статистика")
 async def handle_stats_button(message: Message):
-    user = db.get_user_by_telegram_id(message.from_user.id)
+    user = await adb.get_user_by_telegram_id(message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы в системе.")
         return
     
     if is_worker(message.from_user.id):
-        stats = db.get_worker_stats(user['id'])
+        stats = await adb.get_worker_stats(user['id'])
         
         if stats:
             stats_text = f"""
@@ -2717,7 +2740,7 @@ async def handle_stats_button(message: Message):
         
         await message.answer(stats_text, parse_mode='Markdown')
     else:
-        user_stats = db.get_user_transactions(user['id'])
+        user_stats = await adb.get_user_transactions(user['id'])
         completed_count = len([t for t in user_stats if t['status'] == 'completed'])
         total_spent = sum([abs(t['amount_rub']) for t in user_stats if t['status'] == 'completed' and t['amount_rub'] < 0])
         
@@ -2726,7 +2749,7 @@ async def handle_stats_button(message: Message):
 
 🎯 Завершенных операций: {completed_count}
 💰 Всего потрачено: {total_spent:.0f} ₽
-💎 Текущий баланс: {db.get_user_balance(user['id'], 'SOL'):.6f} SOL
+💎 Текущий баланс: {await adb.get_user_balance(user['id'], 'SOL'):.6f} SOL
         """
         
         await message.answer(stats_text, parse_mode='Markdown')
@@ -2737,7 +2760,7 @@ async def handle_admin_button(message: Message):
         await message.answer("❌ У вас нет доступа к админ панели.")
         return
     
-    pending_count = len(db.get_pending_transactions_for_admin())
+    pending_count = len(await adb.get_pending_transactions_for_admin())
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"📋 Ожидающие операции ({pending_count})", callback_data="pending_operations")],
@@ -2772,6 +2795,7 @@ async def handle_admin_commands(callback: CallbackQuery):
 `/status` - статус воркеров
 `/my_id` - показать свой ID
 `/stats` - статистика системы
+`/repair_stats` - пересчитать счетчики статистики
 `/cancel` - отмена текущей команды
 
 *Управление сетями:*
@@ -2868,12 +2892,12 @@ async def handle_withdraw_earnings(callback: CallbackQuery, state: FSMContext):
         await callback.answer("У вас нет доступа", show_alert=True)
         return
     
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("Пользователь не найден", show_alert=True)
         return
     
-    stats = db.get_worker_stats(user['id'])
+    stats = await adb.get_worker_stats(user['id'])
     if not stats or stats['total_commission_rub'] <= 0:
         await callback.answer("❌ Нет доступных средств для вывода", show_alert=True)
         return
@@ -2904,12 +2928,12 @@ async def cmd_withdraw_earnings(message: Message, state: FSMContext):
         await message.answer("❌ Эта команда только для воркеров.")
         return
     
-    user = db.get_user_by_telegram_id(message.from_user.id)
+    user = await adb.get_user_by_telegram_id(message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы.")
         return
     
-    stats = db.get_worker_stats(user['id'])
+    stats = await adb.get_worker_stats(user['id'])
     if not stats or stats['total_commission_rub'] <= 0:
         await message.answer("❌ У вас нет доступных средств для вывода.")
         return
@@ -2958,11 +2982,11 @@ async def process_add_balance_user(message: Message, state: FSMContext):
     
     if target.startswith('@'):
         username = target[1:]
-        user = db.get_user_by_username(username)
+        user = await adb.get_user_by_username(username)
     else:
         try:
             telegram_id = int(target)
-            user = db.get_user_by_telegram_id(telegram_id)
+            user = await adb.get_user_by_telegram_id(telegram_id)
         except ValueError:
             await message.answer("❌ Неверный формат. Используйте Telegram ID или @username.")
             return
@@ -2975,7 +2999,7 @@ async def process_add_balance_user(message: Message, state: FSMContext):
     await state.update_data(target_user=user)
     await state.set_state(AddBalanceStates.waiting_for_amount)
     
-    current_balance = db.get_user_balance(user['id'], 'SOL')
+    current_balance = await adb.get_user_balance(user['id'], 'SOL')
     await message.answer(
         f"👤 Пользователь: {user.get('first_name', '')} (@{user.get('username', 'N/A')})\n"
         f"💎 Текущий баланс: {current_balance:.6f} SOL\n\n"
@@ -2999,11 +3023,9 @@ async def process_add_balance_amount(message: Message, state: FSMContext):
             await state.clear()
             return
         
-        current_balance = db.get_user_balance(target_user['id'], 'SOL')
-        new_balance = current_balance + amount
-        db.update_user_balance(target_user['id'], 'SOL', new_balance)
+        new_balance = await adb.increment_user_balance(target_user['id'], 'SOL', amount)
         
-        db.create_transaction(
+        await adb.create_transaction(
             user_id=target_user['id'],
             transaction_type='deposit',
             currency='SOL',
@@ -3056,11 +3078,11 @@ async def process_reset_test_balance(message: Message, state: FSMContext):
     
     if target.startswith('@'):
         username = target[1:]
-        user = db.get_user_by_username(username)
+        user = await adb.get_user_by_username(username)
     else:
         try:
             telegram_id = int(target)
-            user = db.get_user_by_telegram_id(telegram_id)
+            user = await adb.get_user_by_telegram_id(telegram_id)
         except ValueError:
             await message.answer("❌ Неверный формат. Используйте Telegram ID или @username.")
             return
@@ -3070,14 +3092,10 @@ async def process_reset_test_balance(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    current_balance = db.get_user_balance(user['id'], 'SOL')
-    db.update_user_balance(user['id'], 'SOL', 0.0)
+    current_balance = await adb.get_user_balance(user['id'], 'SOL')
+    await adb.update_user_balance(user['id'], 'SOL', 0.0)
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM transactions WHERE user_id = ? AND transaction_type = "test_deposit"', (user['id'],))
-    conn.commit()
-    conn.close()
+    await adb.delete_test_transactions(user['id'])
     
     await message.answer(
         f"✅ *Тестовый баланс сброшен!*\n\n"
@@ -3104,26 +3122,24 @@ async def process_reset_test_balance(message: Message, state: FSMContext):
 
 @dp.callback_query(F.data == "get_test_sol")
 async def handle_get_test_sol(callback: CallbackQuery):
-    user = db.get_user_by_telegram_id(callback.from_user.id)
+    user = await adb.get_user_by_telegram_id(callback.from_user.id)
     if not user:
         await callback.answer("❌ Вы не зарегистрированы", show_alert=True)
         return
     
-    wallet = db.get_user_wallet(user['id'], 'SOL')
+    wallet = await adb.get_user_wallet(user['id'], 'SOL')
     if not wallet:
         await callback.answer("❌ Кошелек не найден", show_alert=True)
         return
     
     await callback.answer("🪂 Запрашиваем тестовые SOL...")
     
-    result = UniversalSolanaWallet.airdrop_devnet_sol(wallet['wallet_address'], 2.0)
+    result = await AsyncUniversalSolanaWallet.airdrop_devnet_sol(wallet['wallet_address'], 2.0)
     
     if result['success']:
-        current_balance = db.get_user_balance(user['id'], 'SOL')
-        new_balance = current_balance + 2.0
-        db.update_user_balance(user['id'], 'SOL', new_balance)
+        new_balance = await adb.increment_user_balance(user['id'], 'SOL', 2.0)
         
-        db.create_transaction(
+        await adb.create_transaction(
             user_id=user['id'],
             transaction_type='test_deposit',
             currency='SOL',
@@ -3158,7 +3174,7 @@ async def handle_admin_approve_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[3])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -3168,11 +3184,9 @@ async def handle_admin_approve_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     
     try:
-        from solana_wallet import UniversalSolanaWallet
-        
         admin_private_key = getattr(cfg, 'ADMIN_PRIVATE_KEY', None)
         
         if not admin_private_key:
@@ -3183,22 +3197,22 @@ async def handle_admin_approve_withdrawal(callback: CallbackQuery):
             )
             return
         
-        withdrawal_result = UniversalSolanaWallet.send_sol(
+        withdrawal_result = await AsyncUniversalSolanaWallet.send_sol(
             from_private_key=admin_private_key,
             to_address=withdrawal['wallet_address'],
             amount_sol=withdrawal['amount_sol']
         )
         
         if withdrawal_result['success']:
-            db.update_withdrawal_status(withdrawal_id, 'completed')
+            await adb.update_withdrawal_status(withdrawal_id, 'completed')
             
-            transactions = db.get_user_transactions(withdrawal['user_id'])
+            transactions = await adb.get_user_transactions(withdrawal['user_id'])
             for tx in transactions:
                 if (tx['transaction_type'] == 'withdrawal' and 
                     tx['status'] in ['in_progress', 'pending'] and 
                     abs(tx['amount'] + withdrawal['amount_sol']) < 0.000001):
                     
-                    db.update_transaction_status(
+                    await adb.update_transaction_status(
                         tx['id'], 
                         'completed'
                     )
@@ -3252,7 +3266,7 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[3])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -3262,19 +3276,19 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     
-    db.update_withdrawal_status(withdrawal_id, 'rejected')
+    await adb.update_withdrawal_status(withdrawal_id, 'rejected')
     
-    db.unfreeze_user_balance(withdrawal['user_id'], 'SOL')
+    await adb.unfreeze_user_balance(withdrawal['user_id'], 'SOL')
     
-    transactions = db.get_user_transactions(withdrawal['user_id'])
+    transactions = await adb.get_user_transactions(withdrawal['user_id'])
     for tx in transactions:
         if (tx['transaction_type'] == 'withdrawal' and 
             tx['status'] in ['in_progress', 'pending'] and 
             abs(tx['amount'] + withdrawal['amount_sol']) < 0.000001):
             
-            db.update_transaction_status(
+            await adb.update_transaction_status(
                 tx['id'], 
                 'cancelled',
                 error_message='Заявка на вывод отклонена администратором'
@@ -3287,7 +3301,7 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
     await callback.answer("✅ Заявка отклонена")
     
     try:
-        current_balance = db.get_user_balance(withdrawal['user_id'], 'SOL')
+        current_balance = await adb.get_user_balance(withdrawal['user_id'], 'SOL')
         await bot.send_message(
             user['telegram_id'],
             f"❌ *Заявка на вывод отклонена*\n\n"
@@ -3317,7 +3331,7 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
         return
     
     withdrawal_id = int(callback.data.split('_')[3])
-    withdrawal = db.get_withdrawal_request(withdrawal_id)
+    withdrawal = await adb.get_withdrawal_request(withdrawal_id)
     
     if not withdrawal:
         await callback.answer("❌ Заявка не найдена", show_alert=True)
@@ -3327,19 +3341,19 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
         await callback.answer("❌ Заявка уже обработана", show_alert=True)
         return
     
-    user = db.get_user_by_id(withdrawal['user_id'])
+    user = await adb.get_user_by_id(withdrawal['user_id'])
     
-    db.update_withdrawal_status(withdrawal_id, 'rejected')
+    await adb.update_withdrawal_status(withdrawal_id, 'rejected')
     
-    db.unfreeze_user_balance(withdrawal['user_id'], 'SOL')
+    await adb.unfreeze_user_balance(withdrawal['user_id'], 'SOL')
     
-    transactions = db.get_user_transactions(withdrawal['user_id'])
+    transactions = await adb.get_user_transactions(withdrawal['user_id'])
     for tx in transactions:
         if (tx['transaction_type'] == 'withdrawal' and 
             tx['status'] == 'in_progress' and 
             abs(tx['amount'] + withdrawal['amount_sol']) < 0.000001):
             
-            db.update_transaction_status(
+            await adb.update_transaction_status(
                 tx['id'], 
                 'cancelled',
                 error_message='Заявка на вывод отклонена администратором'
@@ -3349,7 +3363,7 @@ async def handle_admin_reject_withdrawal(callback: CallbackQuery):
     await callback.answer("✅ Заявка отклонена")
     
     try:
-        current_balance = db.get_user_balance(withdrawal['user_id'], 'SOL')
+        current_balance = await adb.get_user_balance(withdrawal['user_id'], 'SOL')
         await bot.send_message(
             user['telegram_id'],
             f"❌ *Заявка на вывод отклонена*\n\n"
@@ -3384,26 +3398,24 @@ async def cmd_test_sol(message: Message):
         )
         return
     
-    user = db.get_user_by_telegram_id(message.from_user.id)
+    user = await adb.get_user_by_telegram_id(message.from_user.id)
     if not user:
         await message.answer("❌ Вы не зарегистрированы в системе.")
         return
     
-    wallet = db.get_user_wallet(user['id'], 'SOL')
+    wallet = await adb.get_user_wallet(user['id'], 'SOL')
     if not wallet:
         await message.answer("❌ Кошелек не найден. Зарегистрируйтесь на сайте.")
         return
     
     await message.answer("🪂 Запрашиваем тестовые SOL...")
     
-    result = UniversalSolanaWallet.airdrop_devnet_sol(wallet['wallet_address'], 2.0)
+    result = await AsyncUniversalSolanaWallet.airdrop_devnet_sol(wallet['wallet_address'], 2.0)
     
     if result['success']:
-        current_balance = db.get_user_balance(user['id'], 'SOL')
-        new_balance = current_balance + 2.0
-        db.update_user_balance(user['id'], 'SOL', new_balance)
+        new_balance = await adb.increment_user_balance(user['id'], 'SOL', 2.0)
         
-        db.create_transaction(
+        await adb.create_transaction(
             user_id=user['id'],
             transaction_type='test_deposit',
             currency='SOL',
@@ -3439,13 +3451,23 @@ async def run_bot():
         bot_loop = asyncio.get_event_loop()
         print(f"[BOT] Event loop: {bot_loop}")
         
-        await dp.start_polling(bot)
+        await worker_offers.requeue_interrupted()
+        offers_task = asyncio.create_task(worker_offers.run(
+            lambda payment, wave: send_payment_to_workers(**notification_args(payment), worker_ids=wave)
+        ))
+        dispatcher_task = asyncio.create_task(PaymentDispatcher(adb, send_payment_to_workers).run())
+        try:
+            await dp.start_polling(bot)
+        finally:
+            dispatcher_task.cancel()
+            offers_task.cancel()
         
     except Exception as e:
         print(f"Ошибка запуска бота: {e}")
         import traceback
         traceback.print_exc()
     finally:
+        await rpc_clients.close_async_clients()
         await bot.session.close()
 
 if __name__ == '__main__':
@@ -9,6 +9,7 @@ from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from database import Database
 from solana_wallet import UniversalSolanaWallet
+from qr_store import qr_store
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -106,12 +107,10 @@ def send_withdrawal_notification_sync(withdrawal_id, user_id, user_name, user_us
         logger.error(f"❌ Error in send_withdrawal_notification_sync: {e}")
         return 0
 
-async def send_payment_notification_async(transaction_id, qr_code_data, qr_code_image, user_info, amount_rub, worker_earnings_sol=None, frozen_amount_sol=None):
+async def send_payment_notification_async(transaction_id, qr_code_data, qr_image_hash, user_info, amount_rub, worker_earnings_sol=None, frozen_amount_sol=None):
     """Асинхронная отправка уведомления о платеже - ИСПРАВЛЕННАЯ ВЕРСИЯ БЕЗ USERNAME"""
     try:
         import json
-        import base64
-        from aiogram.types import BufferedInputFile
         
         bot = Bot(token=cfg.TELEGRAM_BOT_TOKEN)
         user_data = json.loads(user_info)
@@ -216,21 +215,17 @@ ID транзакции: {transaction_id}
         
         admin_keyboard = InlineKeyboardMarkup(inline_keyboard=admin_keyboard_buttons)
         
-        workers_from_db = db.get_all_workers()
-        worker_ids = [w['telegram_id'] for w in workers_from_db]
-        worker_ids.extend(cfg.WORKER_IDS)
-        worker_ids = list(set(worker_ids))
+        roster = db.get_roster_snapshot()
+        worker_ids = roster.worker_ids
         
         sent_count = 0
         
         for worker_id in worker_ids:
             try:
-                if qr_code_image:
+                if qr_image_hash:
                     try:
-                        image_data = base64.b64decode(qr_code_image)
-                        await bot.send_photo(
-                            chat_id=worker_id,
-                            photo=BufferedInputFile(image_data, filename='qr_code.png'),
+                        await qr_store.send_photo(
+                            bot, worker_id, qr_image_hash,
                             caption=worker_message,
                             reply_markup=worker_keyboard
                         )
@@ -254,14 +249,12 @@ ID транзакции: {transaction_id}
             except Exception as e:
                 logger.error(f"❌ Error sending to worker {worker_id}: {e}")
         
-        for admin_id in cfg.ADMIN_IDS:
+        for admin_id in roster.admin_ids:
             try:
-                if qr_code_image:
+                if qr_image_hash:
                     try:
-                        image_data = base64.b64decode(qr_code_image)
-                        await bot.send_photo(
-                            chat_id=admin_id,
-                            photo=BufferedInputFile(image_data, filename='qr_code.png'),
+                        await qr_store.send_photo(
+                            bot, admin_id, qr_image_hash,
                             caption=admin_message,
                             reply_markup=admin_keyboard
                         )
@@ -295,7 +288,7 @@ ID транзакции: {transaction_id}
         logger.error(f"❌ Error in send_payment_notification_async: {e}")
         return 0
           
-def send_payment_notification_sync(transaction_id, qr_code_data, qr_code_image, user_info, amount_rub, worker_earnings_sol=None, frozen_amount_sol=None):
+def send_payment_notification_sync(transaction_id, qr_code_data, qr_image_hash, user_info, amount_rub, worker_earnings_sol=None, frozen_amount_sol=None):
     """Синхронная обертка для отправки уведомления о платеже"""
     try:
         loop = asyncio.new_event_loop()
@@ -304,7 +297,7 @@ def send_payment_notification_sync(transaction_id, qr_code_data, qr_code_image,
         try:
             result = loop.run_until_complete(
                 send_payment_notification_async(
-                    transaction_id, qr_code_data, qr_code_image, user_info, 
+                    transaction_id, qr_code_data, qr_image_hash, user_info, 
                     amount_rub, worker_earnings_sol, frozen_amount_sol
                 )
             )
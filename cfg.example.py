@@ -12,6 +12,37 @@ SECRET_KEY = 'your-secret-key-change-in-production'
 
 # База данных
 DATABASE_PATH = "cryptopay.db"
+DATABASE_BACKEND = "sqlite"  # Бэкенд хранилища из storage.BACKENDS (пока только sqlite)
+DB_POOL_MAX_IDLE = 8  # Сколько свободных соединений держать открытыми
+DB_BUSY_TIMEOUT = 30  # Ожидание блокировки, секунд
+DB_MMAP_SIZE = 256 * 1024 * 1024  # PRAGMA mmap_size, байт
+DB_CACHE_SIZE_KB = 16 * 1024  # PRAGMA cache_size, КБ на соединение
+DB_EXECUTOR_WORKERS = 4  # Потоки для запросов к БД из бота
+ENTITY_CACHE_MAX_ENTRIES = 10000  # Кеш пользователей, кошельков, ролей и настроек (0 - выключен)
+ENTITY_CACHE_TTL = 60  # Время жизни записи кеша, секунд
+ROLE_INDEX_CHECK_INTERVAL = 5  # Как часто сверять индекс ролей с БД, секунд
+ROSTER_TTL = 60  # Сколько секунд переиспользовать снимок админов и воркеров для рассылок
+ARCHIVE_DATABASE_PATH = "archive.db"  # Файл архива завершенных операций ("" - архив выключен)
+ARCHIVE_AFTER_DAYS = 90  # Через сколько дней завершенные операции уходят в архив
+ARCHIVE_BATCH_SIZE = 500  # Строк за одну транзакцию при архивации
+SWEEP_INTERVAL = 300  # Как часто удалять истекшие коды и ключи rate_limits, секунд
+SWEEP_BATCH_SIZE = 500  # Строк за одну транзакцию при очистке
+RATE_LIMIT_RETENTION = 24 * 60 * 60  # Сколько хранить неактивный ключ rate_limits, секунд
+DISPATCH_BATCH_SIZE = 20  # Сколько новых платежей диспетчер забирает из очереди за раз
+DISPATCH_MAX_ATTEMPTS = 5  # Сколько раз пробовать разослать платеж, прежде чем пометить его dispatch_failed
+DISPATCH_RETRY_DELAY = 30  # Задержка перед первым повтором рассылки, секунд (дальше удваивается)
+WORKER_DISPATCH_STRATEGY = "least_loaded"  # Порядок предложения платежей воркерам: least_loaded, round_robin, fastest
+WORKER_OFFER_FANOUT = 2  # Скольким воркерам платеж предлагается сначала (0 - всем сразу)
+WORKER_OFFER_TIMEOUT = 30  # Через сколько секунд невзятый платеж предлагается следующей (вдвое большей) волне
+WORKER_HEARTBEAT_TTL = 600  # Воркер без активности дольше этого считается неактивным, секунд
+WORKER_HEARTBEAT_INTERVAL = 60  # Как часто записывать heartbeat воркера в worker_status, секунд
+ANALYTICS_SNAPSHOT_PATH = "cryptopay_snapshot.db"  # Снимок БД для админских отчетов ("" - выключен)
+ANALYTICS_SNAPSHOT_INTERVAL = 60  # Как часто обновлять снимок, секунд
+ANALYTICS_SNAPSHOT_MAX_AGE = 180  # Старше этого снимок не используется, отчеты идут в основную БД
+QR_STORE_DIR = "qr_images"  # Каталог PNG QR-кодов (имя файла - SHA-256 содержимого)
+QR_FILE_ID_CACHE_SIZE = 10000  # Сколько file_id Telegram для QR-кодов помнить в памяти
+QR_STORE_SWEEP_INTERVAL = 86400  # Как часто удалять PNG, на которые не ссылается payment_queue, секунд
+QR_STORE_MIN_AGE = 3600  # Более молодые PNG не удаляются (строка платежа могла еще не записаться), секунд
 
 # Telegram Bot
 TELEGRAM_BOT_TOKEN = 'YOUR_BOT_TOKEN_HERE'
@@ -21,6 +52,12 @@ TELEGRAM_BOT_USERNAME = 'your_bot_username'
 SOLANA_NETWORK = "devnet"  # "mainnet" или "devnet"
 SOLANA_RPC_URL = "https://api.devnet.solana.com"
 SOLANA_MAINNET_RPC = "https://api.mainnet-beta.solana.com"
+SOLANA_RPC_TIMEOUT = 10  # Таймаут запроса к RPC, секунд (клиенты и их соединения переиспользуются)
+BALANCE_CACHE_TTL = 10  # Сколько секунд баланс кошелька берется из кеша (0 - кеш выключен)
+BALANCE_CACHE_MAX_ENTRIES = 10000  # Сколько балансов кошельков помнить в памяти
+BLOCKHASH_REFRESH_INTERVAL = 5  # Как часто фоново обновлять recent blockhash, секунд (0 - только по запросу)
+BLOCKHASH_MAX_AGE = 30  # Старше этого blockhash не используется для новых транзакций, секунд
+BLOCKHASH_REUSE_RETRIES = 10  # Сколько раз ждать новый blockhash для повтора одинакового перевода
 
 # Переменные для удобства
 IS_MAINNET = SOLANA_NETWORK == "mainnet"
@@ -73,4 +110,9 @@ PWA_BACKGROUND_COLOR = "#0f172a"
 
 # Логирование
 LOG_LEVEL = "INFO"
-LOG_FILE = "cryptopay.log"
\ No newline at end of file
+LOG_FILE = "cryptopay.log"
+
+# Фоновая запись security_logs
+SECURITY_LOG_QUEUE_SIZE = 10000  # Лимит очереди, лишние события отбрасываются
+SECURITY_LOG_BATCH_SIZE = 200  # Сколько событий писать одной транзакцией
+SECURITY_LOG_FLUSH_INTERVAL = 1.0  # Максимальная задержка записи, секунд
\ No newline at end of file
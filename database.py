@@ -1,272 +1,481 @@
-import sqlite3
 import json
+import base64
+import threading
 import cfg
+import copy
+import time
+from collections import deque, OrderedDict, defaultdict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
+from archive import (ensure_archive_schema, ensure_archive_views, archive_batch,
+                     ARCHIVED_TABLES, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE)
+from migrations import apply_migrations, recompute_system_stats, SYSTEM_STATS, SYSTEM_STATS_COUNTS
+from money import to_units, from_units
+from storage import StorageBackend, create_backend, DATABASE_BACKEND
+from snapshot import AnalyticsSnapshot
+
+DB_POOL_MAX_IDLE = getattr(cfg, 'DB_POOL_MAX_IDLE', 8)
+ENTITY_CACHE_MAX_ENTRIES = getattr(cfg, 'ENTITY_CACHE_MAX_ENTRIES', 10000)
+ENTITY_CACHE_TTL = getattr(cfg, 'ENTITY_CACHE_TTL', 60)
+ROLE_INDEX_CHECK_INTERVAL = getattr(cfg, 'ROLE_INDEX_CHECK_INTERVAL', 5)
+ROSTER_TTL = getattr(cfg, 'ROSTER_TTL', 60)
+SWEEP_BATCH_SIZE = getattr(cfg, 'SWEEP_BATCH_SIZE', 500)
+RATE_LIMIT_RETENTION = getattr(cfg, 'RATE_LIMIT_RETENTION', 24 * 60 * 60)
+
+# Таблица -> колонка срока жизни; строки удаляются, когда срок в колонке прошел
+EXPIRING_TABLES = {
+    'auth_codes': 'expires_at',
+    'session_codes': 'expires_at',
+    'rate_limits': 'last_attempt',
+}
+
+
+class PooledConnection:
+    """Соединение из пула: close() возвращает его в пул вместо закрытия"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._conn.__exit__(exc_type, exc_value, traceback)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class EntityCache:
+    """Ограниченный LRU-кеш с TTL для пользователей, кошельков, ролей и настроек"""
+
+    def __init__(self, max_entries: int = ENTITY_CACHE_MAX_ENTRIES, ttl: float = ENTITY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, namespace: str, key):
+        """Вернуть (найдено, значение); значение - копия, его можно менять"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end((namespace, key))
+                self.hits[namespace] += 1
+                return True, copy.copy(entry[1])
+            if entry is not None:
+                del self._data[(namespace, key)]
+            self.misses[namespace] += 1
+            return False, None
+
+    def put(self, namespace: str, key, value):
+        with self._lock:
+            self._data[(namespace, key)] = (time.monotonic() + self.ttl, copy.copy(value))
+            self._data.move_to_end((namespace, key))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, namespace: str, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        """Счетчики попаданий по пространствам имен и общий hit ratio"""
+        with self._lock:
+            namespaces = {}
+            for namespace in set(self.hits) | set(self.misses):
+                hits, misses = self.hits[namespace], self.misses[namespace]
+                namespaces[namespace] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+                }
+            hits, misses = sum(self.hits.values()), sum(self.misses.values())
+            return {
+                'size': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+                'namespaces': namespaces,
+            }
+
+
+class RoleIndex:
+    """Роли пользователей в памяти процесса: user_roles + cfg.WORKER_IDS/ADMIN_IDS.
+
+    Актуальность сверяется с role_version (счетчик меняется триггерами
+    user_roles) не чаще раза в ROLE_INDEX_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self, check_interval: float = ROLE_INDEX_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = None
+        self._roles = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def needs_check(self) -> bool:
+        return self.version is None or time.monotonic() - self._checked_at >= self.check_interval
+
+    def mark_checked(self):
+        self._checked_at = time.monotonic()
+
+    def load(self, rows, version: int):
+        """Заменить индекс строками (telegram_id, role) из user_roles"""
+        roles = {}
+        for telegram_id, role in rows:
+            roles.setdefault(telegram_id, set()).add(role)
+        for telegram_id in getattr(cfg, 'WORKER_IDS', []):
+            roles.setdefault(telegram_id, set()).add('worker')
+        for telegram_id in getattr(cfg, 'ADMIN_IDS', []):
+            roles.setdefault(telegram_id, set()).add('admin')
+
+        with self._lock:
+            self._roles = roles
+            self.version = version
+            self.mark_checked()
+
+    def apply(self, telegram_id: int, role: str, present: bool, version: int):
+        """Учесть собственное изменение роли; если версия ушла дальше, индекс перечитается"""
+        with self._lock:
+            if self.version is None or version != self.version + 1:
+                self.version = None
+                return
+
+            roles = set(self._roles.get(telegram_id, ()))
+            if present:
+                roles.add(role)
+            else:
+                roles.discard(role)
+                if role == 'worker' and telegram_id in getattr(cfg, 'WORKER_IDS', []):
+                    roles.add(role)
+
+            self._roles = {**self._roles, telegram_id: roles}
+            self.version = version
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    def get(self, telegram_id: int) -> frozenset:
+        return frozenset(self._roles.get(telegram_id, ()))
+
+
+class RosterSnapshot:
+    """Снимок списка админов и воркеров для рассылок; переиспользуется между платежами"""
+
+    def __init__(self, admins: List[Dict], workers: List[Dict], role_version: int):
+        self.admins = tuple(admins)
+        self.workers = tuple(workers)
+        self.role_version = role_version
+        self.created_at = time.monotonic()
+        self.admin_ids = tuple(dict.fromkeys(a['telegram_id'] for a in self.admins))
+        self.worker_ids = tuple(dict.fromkeys(w['telegram_id'] for w in self.workers))
+
+    def is_fresh(self, role_version: int, ttl: float = ROSTER_TTL) -> bool:
+        return self.role_version == role_version and time.monotonic() - self.created_at < ttl
+
+
+class UnitOfWorkConnection:
+    """Соединение внутри unit_of_work: работа одного метода - точка сохранения.
+
+    commit() освобождает точку сохранения, rollback() откатывает только ее,
+    а настоящий COMMIT выполняет unit_of_work при выходе из блока.
+    """
+
+    def __init__(self, conn, savepoint: str):
+        self._conn = conn
+        self._savepoint = savepoint
+        self._open = True
+        conn.execute(f'SAVEPOINT {savepoint}')
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def commit(self):
+        if self._open:
+            self._open = False
+            self._conn.execute(f'RELEASE {self._savepoint}')
+
+    def rollback(self):
+        if self._open:
+            self._open = False
+            self._conn.execute(f'ROLLBACK TO {self._savepoint}')
+            self._conn.execute(f'RELEASE {self._savepoint}')
+
+    def close(self):
+        self.commit()
+
+
+class ConnectionPool:
+    """Пул постоянных соединений к хранилищу (см. storage.py)"""
+
+    def __init__(self, backend: StorageBackend, max_idle: int = DB_POOL_MAX_IDLE):
+        self.backend = backend
+        self.snapshot = AnalyticsSnapshot(backend.location, backend.snapshot_path) if backend.snapshot_path else None
+        self.max_idle = max_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.schema_ready = False
+        self.cache = EntityCache()
+        self.roles = RoleIndex()
+        self.roster = None
+        # Открытый unit_of_work текущего потока (общий для всех Database этого файла)
+        self.local = threading.local()
+
+    @property
+    def archive_path(self):
+        return self.backend.archive_path
+
+    def acquire(self) -> PooledConnection:
+        """Взять соединение из пула (или открыть новое)"""
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+        if conn is None:
+            conn = self.backend.connect()
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Вернуть соединение в пул, откатив незавершенную транзакцию"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except self.backend.Error:
+            conn.close()
+            return
+
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        """Закрыть все свободные соединения"""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_schema_lock = threading.Lock()
+
+
+def get_pool(db_path: str, backend: str = None) -> ConnectionPool:
+    """Получить общий для процесса пул соединений для файла (строки подключения) БД"""
+    backend = backend or DATABASE_BACKEND
+    with _pools_lock:
+        pool = _pools.get((backend, db_path))
+        if pool is None:
+            pool = ConnectionPool(create_backend(db_path, backend))
+            _pools[(backend, db_path)] = pool
+        return pool
+
 
 class Database:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, backend: str = None):
         self.db_path = db_path or cfg.DATABASE_PATH
+        self.pool = get_pool(self.db_path, backend)
+        self.cache = self.pool.cache
         self.init_db()
-            
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def init_db(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_balances (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                currency TEXT NOT NULL,
-                balance REAL DEFAULT 0.0,
-                frozen_balance REAL DEFAULT 0.0,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, currency)
-            )
-    ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS wallets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                currency TEXT NOT NULL,
-                wallet_address TEXT NOT NULL,
-                private_key TEXT,
-                seed_phrase TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, currency)
-            )
-        ''')
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS frozen_balances (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                currency TEXT NOT NULL,
-                amount REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id, currency)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                wallet_id INTEGER,
-                transaction_type TEXT NOT NULL,
-                currency TEXT NOT NULL,
-                amount REAL,
-                amount_rub REAL,
-                exchange_rate REAL,
-                commission_markup REAL,
-                worker_commission REAL,
-                admin_commission REAL,
-                status TEXT DEFAULT 'pending',
-                qr_code_data TEXT,
-                worker_id INTEGER,
-                admin_id INTEGER,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (wallet_id) REFERENCES wallets(id),
-                FOREIGN KEY (worker_id) REFERENCES users(id),
-                FOREIGN KEY (admin_id) REFERENCES users(id)
-            )
-        ''')
+    def get_connection(self):
+        unit = getattr(self.pool.local, 'unit', None)
+        if unit is None:
+            return self.pool.acquire()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS security_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                event_type TEXT NOT NULL,
-                event_description TEXT NOT NULL,
-                severity TEXT DEFAULT 'info',
-                user_id INTEGER,
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS withdrawal_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount_sol REAL NOT NULL,
-                wallet_address TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                request_type TEXT DEFAULT 'balance',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
+        self.pool.local.savepoints += 1
+        return UnitOfWorkConnection(unit, f'uow_{self.pool.local.savepoints}')
+    
+    @contextmanager
+    def unit_of_work(self):
+        """Выполнить несколько методов в одной транзакции BEGIN IMMEDIATE ... COMMIT.
 
-        try:
-            cursor.execute('ALTER TABLE withdrawal_requests ADD COLUMN request_type TEXT DEFAULT "balance"')
-        except sqlite3.OperationalError:
-            pass
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS settings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key TEXT UNIQUE NOT NULL,
-                value TEXT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        Методы, вызванные внутри блока в этом потоке, используют общее соединение;
+        исключение, вышедшее из блока, откатывает всю работу. Вложенный блок
+        присоединяется к внешнему.
+        """
+        local = self.pool.local
+        if getattr(local, 'unit', None) is not None:
+            yield self
+            return
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payment_queue (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id INTEGER NOT NULL,
-                qr_code_data TEXT NOT NULL,
-                qr_code_image TEXT,
-                user_info TEXT NOT NULL,
-                amount_rub REAL NOT NULL,
-                status TEXT DEFAULT 'pending',
-                assigned_worker_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (transaction_id) REFERENCES transactions(id),
-                FOREIGN KEY (assigned_worker_id) REFERENCES users(id)
-            )
-        ''')
+        conn = self.pool.acquire()
         try:
-            cursor.execute('ALTER TABLE payment_queue ADD COLUMN worker_earnings_rub REAL')
-        except sqlite3.OperationalError:
-            pass
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS auth_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE NOT NULL,
-                telegram_id INTEGER NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                code_type TEXT NOT NULL,
-                is_used BOOLEAN DEFAULT 0,
-                expires_at TIMESTAMP NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS session_codes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_code TEXT UNIQUE NOT NULL,
-                code_type TEXT NOT NULL,
-                auth_code TEXT,
-                telegram_id INTEGER,
-                is_used BOOLEAN DEFAULT 0,
-                expires_at TIMESTAMP NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_roles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER NOT NULL,
-                role TEXT NOT NULL,
-                added_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(telegram_id, role),
-                FOREIGN KEY (added_by) REFERENCES users(id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE NOT NULL,
-                language TEXT DEFAULT 'ru',
-                notifications_enabled BOOLEAN DEFAULT 1,
-                auto_withdraw_enabled BOOLEAN DEFAULT 0,
-                preferred_currency TEXT DEFAULT 'SOL',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS worker_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                worker_id INTEGER NOT NULL,
-                completed_payments INTEGER DEFAULT 0,
-                total_commission_rub REAL DEFAULT 0.0,
-                total_processed_rub REAL DEFAULT 0.0,
-                last_payment_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (worker_id) REFERENCES users(id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS worker_status (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                worker_id INTEGER UNIQUE NOT NULL,
-                status TEXT DEFAULT 'free',
-                current_transaction_id INTEGER,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (worker_id) REFERENCES users(id),
-                FOREIGN KEY (current_transaction_id) REFERENCES transactions(id)
-            )
-        ''')
+            self.pool.backend.begin_write(conn)
+            local.unit = conn
+            local.savepoints = 0
+            local.after_commit = []
+            try:
+                yield self
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            
+            # Другие потоки могли закешировать старые строки до COMMIT
+            for callback in local.after_commit:
+                callback()
+        finally:
+            local.unit = None
+            local.after_commit = []
+            conn.close()
+    
+    def _reporting_connection(self):
+        """Соединение для отчетных запросов: снимок только для чтения, если он свежий.
 
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS rate_limits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                key TEXT NOT NULL,
-                attempts INTEGER DEFAULT 1,
-                first_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(key)
-            )
-        ''')
+        Внутри unit_of_work и без снимка запрос идет в основную БД.
+        """
+        if self.pool.snapshot is not None and getattr(self.pool.local, 'unit', None) is None:
+            conn = self.pool.snapshot.connect()
+            if conn is not None:
+                return conn
+        return self.get_connection()
+    
+    def refresh_analytics_snapshot(self) -> Dict:
+        """Обновить снимок для отчетов; вернуть путь, время и размер"""
+        if self.pool.snapshot is None:
+            raise ValueError("Снимок для отчетов выключен")
+        return self.pool.snapshot.refresh()
+    
+    def _cached(self, namespace: str, key, load):
+        """Прочитать через кеш; None не кешируется, внутри unit_of_work кеш не используется"""
+        if not self.cache.enabled or getattr(self.pool.local, 'unit', None) is not None:
+            return load()
         
-        for admin_id in cfg.ADMIN_IDS:
-            cursor.execute('''
-                INSERT OR IGNORE INTO user_roles (telegram_id, role)
-                VALUES (?, 'admin')
-            ''', (admin_id,))
+        found, value = self.cache.get(namespace, key)
+        if found:
+            return value
         
-        cursor.execute('''
-            INSERT OR IGNORE INTO settings (key, value) 
-            VALUES ('home_page_text', 'Добро пожаловать в CryptoPay! Пополняйте баланс Solana и оплачивайте покупки по QR-коду.')
-        ''')
+        value = load()
+        if value is not None:
+            self.cache.put(namespace, key, value)
+        return value
+    
+    def _invalidate(self, namespace: str, key):
+        self.cache.invalidate(namespace, key)
+        if getattr(self.pool.local, 'unit', None) is not None:
+            self.pool.local.after_commit.append(lambda: self.cache.invalidate(namespace, key))
+    
+    def _role_index(self) -> RoleIndex:
+        """Индекс ролей, перечитанный из БД, если role_version изменилась"""
+        index = self.pool.roles
+        if not index.needs_check():
+            return index
         
-        try:
-            cursor.execute('ALTER TABLE user_balances ADD COLUMN frozen_balance REAL DEFAULT 0.0')
-        except sqlite3.OperationalError:
-            pass
-
-        conn.commit()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        version = self._get_role_version(cursor)
+        if version != index.version:
+            cursor.execute('SELECT telegram_id, role FROM user_roles')
+            index.load([(row['telegram_id'], row['role']) for row in cursor.fetchall()], version)
+        else:
+            index.mark_checked()
         conn.close()
+        return index
+    
+    def _get_role_version(self, cursor) -> int:
+        cursor.execute('SELECT version FROM role_version WHERE id = 1')
+        return cursor.fetchone()['version']
+    
+    def _apply_role_change(self, telegram_id: int, role: str, present: bool, version: int):
+        """Обновить индекс ролей после своей записи в user_roles (version - прочитана в той же транзакции)"""
+        if getattr(self.pool.local, 'unit', None) is not None:
+            self.pool.local.after_commit.append(self.pool.roles.invalidate)
+            return
+        self.pool.roles.apply(telegram_id, role, present, version)
+    
+    def has_role(self, telegram_id: int, role: str) -> bool:
+        """Проверить роль по индексу в памяти (без запроса к БД в большинстве вызовов)"""
+        return role in self._role_index().get(telegram_id)
+    
+    def get_role_set(self, telegram_id: int) -> frozenset:
+        """Роли пользователя из индекса в памяти, включая роли из конфига"""
+        return self._role_index().get(telegram_id)
+    
+    def cached_role_set(self, telegram_id: int) -> frozenset:
+        """Роли из индекса в памяти без сверки с БД (для цикла событий бота, см. refresh_roles)"""
+        return self.pool.roles.get(telegram_id)
+    
+    def roles_need_refresh(self) -> bool:
+        return self.pool.roles.needs_check()
+    
+    def refresh_roles(self):
+        """Сверить индекс ролей с role_version и перечитать его, если роли менялись"""
+        self._role_index()
+    
+    def reload_roles(self):
+        """Перечитать индекс ролей из БД при следующем обращении"""
+        self.pool.roles.invalidate()
+        self._role_index()
+    
+    def cache_stats(self) -> Dict:
+        """Статистика кеша сущностей"""
+        return self.cache.stats()
+    
+    def init_db(self):
+        """Применить миграции схемы (один раз на процесс для каждого файла БД)"""
+        if self.pool.schema_ready:
+            return
+
+        with _schema_lock:
+            if self.pool.schema_ready:
+                return
+
+            conn = self.get_connection()
+            try:
+                applied = apply_migrations(conn, self.pool.backend)
+                if applied:
+                    print(f"🗄️ Применены миграции БД: {', '.join(map(str, applied))}")
+
+                cursor = conn.cursor()
+                for admin_id in cfg.ADMIN_IDS:
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO user_roles (telegram_id, role)
+                        VALUES (?, 'admin')
+                    ''', (admin_id,))
+                conn.commit()
+
+                if self.pool.archive_path:
+                    ensure_archive_schema(cursor)
+                    conn.commit()
+            finally:
+                conn.close()
+
+            self.pool.schema_ready = True
     
     def update_rate_limit(self, key: str, max_attempts: int, window_seconds: int) -> bool:
         conn = self.get_connection()
@@ -337,10 +546,7 @@ class Database:
         ''', (telegram_id, username, first_name, last_name))
         user_id = cursor.lastrowid
         
-        cursor.execute('''
-            INSERT INTO user_balances (user_id, currency, balance)
-            VALUES (?, 'SOL', ?)
-        ''', (user_id, 0.0))
+        self._get_user_accounts(cursor, user_id, 'SOL')
         
         cursor.execute('''
             INSERT INTO user_profiles (user_id)
@@ -349,110 +555,264 @@ class Database:
         
         conn.commit()
         conn.close()
+        self._invalidate('user_telegram', telegram_id)
         return user_id
     
     def get_user_by_telegram_id(self, telegram_id: int) -> Optional[Dict]:
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
+            row = cursor.fetchone()
+            conn.close()
+            return dict(row) if row else None
+        
+        return self._cached('user_telegram', telegram_id, load)
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict]:
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            row = cursor.fetchone()
+            conn.close()
+            return dict(row) if row else None
+        
+        return self._cached('user', user_id, load)
     
     def get_all_workers_with_wallets(self) -> List[Dict]:
-        """Получить всех воркеров с их кошельками"""
+        """Воркеры из БД и cfg.WORKER_IDS с кошельками и балансом.
+
+        Читается из основной БД: в снимке для отчетов приватных ключей нет.
+        user_id = None - воркер из конфига еще не зарегистрирован.
+        """
+        configured = list(dict.fromkeys(cfg.WORKER_IDS))
+        values = ', '.join('(?, ?)' for _ in configured) or '(NULL, NULL)'
+        params = [value for position, telegram_id in enumerate(configured) for value in (telegram_id, position)]
+
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
+        cursor.execute(f'''
+            WITH configured(telegram_id, position) AS (VALUES {values}),
+            members AS (
+                SELECT telegram_id, 0 AS source, id AS position
+                FROM user_roles WHERE role = 'worker'
+                UNION ALL
+                SELECT c.telegram_id, 1, c.position
+                FROM configured c
+                WHERE c.telegram_id IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM user_roles ur WHERE ur.telegram_id = c.telegram_id AND ur.role = 'worker'
+                )
+            )
             SELECT 
-                ur.telegram_id,
+                m.telegram_id,
                 u.id as user_id,
                 u.username,
                 u.first_name,
                 u.last_name,
                 w.wallet_address,
                 w.private_key,
-                ub.balance as current_balance
-            FROM user_roles ur
-            JOIN users u ON ur.telegram_id = u.telegram_id
+                la.balance / 1000000000.0 as current_balance
+            FROM members m
+            LEFT JOIN users u ON u.telegram_id = m.telegram_id
             LEFT JOIN wallets w ON u.id = w.user_id AND w.currency = 'SOL'
-            LEFT JOIN user_balances ub ON u.id = ub.user_id AND ub.currency = 'SOL'
-            WHERE ur.role = "worker"
-        ''')
+            LEFT JOIN ledger_accounts la ON la.owner_type = 'user' AND la.owner_id = u.id
+                AND la.currency = 'SOL' AND la.kind = 'balance'
+            ORDER BY m.source, m.position
+        ''', params)
         rows = cursor.fetchall()
         conn.close()
         return [dict(row) for row in rows]
 
-    def get_user_balance(self, user_id: int, currency: str) -> float:
+    def _begin_immediate(self, conn):
+        """Начать пишущую транзакцию, если она еще не открыта"""
+        if not conn.in_transaction:
+            self.pool.backend.begin_write(conn)
+
+    def _get_ledger_account(self, cursor, owner_type: str, owner_id: int, currency: str, kind: str) -> Dict:
+        """Найти или создать счет журнала"""
+        cursor.execute('''
+            SELECT id, balance FROM ledger_accounts
+            WHERE owner_type = ? AND owner_id = ? AND currency = ? AND kind = ?
+        ''', (owner_type, owner_id, currency, kind))
+        row = cursor.fetchone()
+        if row:
+            return dict(row)
+
+        cursor.execute('''
+            INSERT INTO ledger_accounts (owner_type, owner_id, currency, kind)
+            VALUES (?, ?, ?, ?)
+        ''', (owner_type, owner_id, currency, kind))
+        return {'id': cursor.lastrowid, 'balance': 0}
+
+    def _get_user_accounts(self, cursor, user_id: int, currency: str) -> Dict[str, Dict]:
+        """Счета пользователя (balance, frozen) и внешний счет системы"""
+        return {
+            'balance': self._get_ledger_account(cursor, 'user', user_id, currency, 'balance'),
+            'frozen': self._get_ledger_account(cursor, 'user', user_id, currency, 'frozen'),
+            'external': self._get_ledger_account(cursor, 'system', 0, currency, 'external'),
+        }
+
+    def _post_ledger(self, cursor, currency: str, posting_type: str, entries, reference: str = None):
+        """Записать проводку и обновить остатки счетов в текущей транзакции"""
+        entries = [(account_id, amount) for account_id, amount in entries if amount]
+        if not entries:
+            return None
+        if sum(amount for _, amount in entries) != 0:
+            raise ValueError("Сумма движений проводки должна быть равна нулю")
+
+        cursor.execute('''
+            INSERT INTO ledger_postings (currency, posting_type, reference)
+            VALUES (?, ?, ?)
+        ''', (currency, posting_type, reference))
+        posting_id = cursor.lastrowid
+
+        cursor.executemany('''
+            INSERT INTO ledger_entries (posting_id, account_id, amount)
+            VALUES (?, ?, ?)
+        ''', [(posting_id, account_id, amount) for account_id, amount in entries])
+        cursor.executemany('''
+            UPDATE ledger_accounts
+            SET balance = balance + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(amount, account_id) for account_id, amount in entries])
+        return posting_id
+
+    def _set_user_balance(self, cursor, user_id: int, currency: str, balance_units: int,
+                          reset_frozen: bool, posting_type: str):
+        """Выставить баланс пользователя разницей с внешним счетом"""
+        accounts = self._get_user_accounts(cursor, user_id, currency)
+        balance_delta = balance_units - accounts['balance']['balance']
+        frozen_delta = -accounts['frozen']['balance'] if reset_frozen else 0
+
+        self._post_ledger(cursor, currency, posting_type, [
+            (accounts['balance']['id'], balance_delta),
+            (accounts['frozen']['id'], frozen_delta),
+            (accounts['external']['id'], -(balance_delta + frozen_delta)),
+        ], reference=f'user:{user_id}')
+
+    def _get_user_balance_units(self, user_id: int, currency: str) -> Dict[str, int]:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT balance FROM user_balances 
-            WHERE user_id = ? AND currency = ?
+            SELECT kind, balance FROM ledger_accounts
+            WHERE owner_type = 'user' AND owner_id = ? AND currency = ? AND kind IN ('balance', 'frozen')
         ''', (user_id, currency))
-        row = cursor.fetchone()
+        rows = cursor.fetchall()
         conn.close()
-        return float(row['balance']) if row and row['balance'] is not None else 0.0
+
+        units = {'balance': 0, 'frozen': 0}
+        for row in rows:
+            units[row['kind']] = row['balance']
+        return units
+
+    def get_user_balance(self, user_id: int, currency: str) -> float:
+        units = self._get_user_balance_units(user_id, currency)
+        return from_units(units['balance'], currency)
     
     def get_available_balance(self, user_id: int, currency: str) -> float:
         """Получить доступный баланс (без замороженных средств)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT balance - frozen_balance as available_balance 
-            FROM user_balances 
-            WHERE user_id = ? AND currency = ?
-        ''', (user_id, currency))
-        row = cursor.fetchone()
-        conn.close()
-        return float(row['available_balance']) if row and row['available_balance'] is not None else 0.0
+        units = self._get_user_balance_units(user_id, currency)
+        return from_units(units['balance'] - units['frozen'], currency)
     
     def get_all_user_balances(self, user_id: int) -> Dict[str, float]:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT currency, balance FROM user_balances 
-            WHERE user_id = ?
+            SELECT currency, balance FROM ledger_accounts 
+            WHERE owner_type = 'user' AND owner_id = ? AND kind = 'balance'
         ''', (user_id,))
         rows = cursor.fetchall()
         conn.close()
         
         balances = {}
         for row in rows:
-            balances[row['currency']] = row['balance']
+            balances[row['currency']] = from_units(row['balance'], row['currency'])
         return balances
     
     def update_user_balance(self, user_id: int, currency: str, balance: float):
+        """Выставить баланс; как и прежний INSERT OR REPLACE, обнуляет замороженную сумму"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_balances (user_id, currency, balance, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (user_id, currency, float(balance)))
-        conn.commit()
-        conn.close()
+        try:
+            self._begin_immediate(conn)
+            self._set_user_balance(cursor, user_id, currency, to_units(balance, currency),
+                                   reset_frozen=True, posting_type='set_balance')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
     
+    def _change_user_balance(self, user_id: int, currency: str, amount_units: int,
+                             posting_type: str, check_funds: bool) -> float:
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._begin_immediate(conn)
+            accounts = self._get_user_accounts(cursor, user_id, currency)
+            new_units = accounts['balance']['balance'] + amount_units
+            if check_funds and new_units < 0:
+                raise ValueError("Недостаточно средств")
+
+            self._post_ledger(cursor, currency, posting_type, [
+                (accounts['balance']['id'], amount_units),
+                (accounts['external']['id'], -amount_units),
+            ], reference=f'user:{user_id}')
+            conn.commit()
+            return from_units(new_units, currency)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def increment_user_balance(self, user_id: int, currency: str, amount: float):
-        current_balance = self.get_user_balance(user_id, currency)
-        new_balance = current_balance + amount
-        self.update_user_balance(user_id, currency, new_balance)
-        return new_balance
+        return self._change_user_balance(user_id, currency, to_units(amount, currency),
+                                         'increment', check_funds=False)
     
     def decrement_user_balance(self, user_id: int, currency: str, amount: float):
-        current_balance = self.get_user_balance(user_id, currency)
-        if current_balance < amount:
-            raise ValueError("Недостаточно средств")
-        new_balance = current_balance - amount
-        self.update_user_balance(user_id, currency, new_balance)
-        return new_balance
+        return self._change_user_balance(user_id, currency, -to_units(amount, currency),
+                                         'decrement', check_funds=True)
+
+    def rebuild_ledger_balances(self, full: bool = False) -> Dict[str, int]:
+        """Пересчитать остатки счетов из журнала (по умолчанию только новые проводки)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._begin_immediate(conn)
+            if full:
+                cursor.execute('UPDATE ledger_accounts SET checkpoint_balance = 0, checkpoint_entry_id = 0')
+
+            cursor.execute('''
+                SELECT a.id, a.balance, a.checkpoint_balance + COALESCE(SUM(e.amount), 0) AS rebuilt,
+                       COALESCE(MAX(e.id), a.checkpoint_entry_id) AS last_entry_id
+                FROM ledger_accounts a
+                LEFT JOIN ledger_entries e ON e.account_id = a.id AND e.id > a.checkpoint_entry_id
+                GROUP BY a.id
+            ''')
+            rows = cursor.fetchall()
+
+            corrected = 0
+            for row in rows:
+                if row['rebuilt'] != row['balance']:
+                    corrected += 1
+                    print(f"⚠️ Остаток счета {row['id']} расходится с журналом: "
+                          f"{row['balance']} -> {row['rebuilt']}")
+
+            cursor.executemany('''
+                UPDATE ledger_accounts
+                SET balance = ?, checkpoint_balance = ?, checkpoint_entry_id = ?
+                WHERE id = ?
+            ''', [(row['rebuilt'], row['rebuilt'], row['last_entry_id'], row['id']) for row in rows])
+            conn.commit()
+            return {'accounts': len(rows), 'corrected': corrected}
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
     
     def create_wallet(self, user_id: int, currency: str, wallet_address: str,
                     private_key: str = None, seed_phrase: str = None) -> int:
@@ -475,18 +835,22 @@ class Database:
         wallet_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        self._invalidate('wallet', (user_id, currency))
         return wallet_id
     
     def get_user_wallet(self, user_id: int, currency: str) -> Optional[Dict]:
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM wallets 
-            WHERE user_id = ? AND currency = ?
-        ''', (user_id, currency))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM wallets 
+                WHERE user_id = ? AND currency = ?
+            ''', (user_id, currency))
+            row = cursor.fetchone()
+            conn.close()
+            return dict(row) if row else None
+        
+        return self._cached('wallet', (user_id, currency), load)
     
     def create_transaction(self, user_id: int, transaction_type: str, currency: str,
                           amount: float = None, amount_rub: float = None,
@@ -497,11 +861,14 @@ class Database:
         cursor.execute('''
             INSERT INTO transactions 
             (user_id, wallet_id, transaction_type, currency, amount, amount_rub, 
-             exchange_rate, qr_code_data, commission_markup, worker_commission, admin_commission, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+             exchange_rate, qr_code_data, commission_markup, worker_commission, admin_commission, status,
+             amount_units, amount_rub_kopecks)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, wallet_id, transaction_type, currency, amount, amount_rub,
               exchange_rate, qr_code_data, cfg.COMMISSION_MARKUP, 
-              cfg.WORKER_COMMISSION, cfg.ADMIN_COMMISSION, status))
+              cfg.WORKER_COMMISSION, cfg.ADMIN_COMMISSION, status,
+              to_units(amount, currency) if amount is not None else None,
+              to_units(amount_rub, 'RUB') if amount_rub is not None else None))
         transaction_id = cursor.lastrowid
         conn.commit()
         conn.close()
@@ -521,6 +888,26 @@ class Database:
         conn.commit()
         conn.close()
 
+    def update_transaction_amount_rub(self, transaction_id: int, amount_rub: float):
+        """Обновить рублевую сумму транзакции"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE transactions 
+            SET amount_rub = ?, amount_rub_kopecks = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (amount_rub, to_units(amount_rub, 'RUB') if amount_rub is not None else None, transaction_id))
+        conn.commit()
+        conn.close()
+    
+    def delete_test_transactions(self, user_id: int):
+        """Удалить тестовые пополнения пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM transactions WHERE user_id = ? AND transaction_type = "test_deposit"', (user_id,))
+        conn.commit()
+        conn.close()
+
     def get_user_by_username(self, username: str) -> Optional[Dict]:
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -529,19 +916,49 @@ class Database:
         conn.close()
         return dict(row) if row else None
     
-    def get_transaction(self, transaction_id: int) -> Optional[Dict]:
+    def get_transaction(self, transaction_id: int, include_archived: bool = False) -> Optional[Dict]:
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM transactions WHERE id = ?', (transaction_id,))
         row = cursor.fetchone()
+        if row is None and include_archived and self.pool.archive_path:
+            cursor.execute('SELECT * FROM archive.transactions WHERE id = ?', (transaction_id,))
+            row = cursor.fetchone()
         conn.close()
         return dict(row) if row else None
     
-    def get_user_transactions(self, user_id: int, limit: int = 50) -> List[Dict]:
+    def _transaction_row_to_dict(self, row) -> Dict:
+        transaction = dict(row)
+        
+        if transaction.get('created_at'):
+            try:
+                if isinstance(transaction['created_at'], datetime):
+                    transaction['created_at'] = transaction['created_at'].isoformat()
+                elif isinstance(transaction['created_at'], str):
+                    pass
+                else:
+                    transaction['created_at'] = str(transaction['created_at'])
+            except Exception as e:
+                print(f"Ошибка обработки даты транзакции: {e}")
+                transaction['created_at'] = datetime.now().isoformat()
+        else:
+            transaction['created_at'] = datetime.now().isoformat()
+        
+        return transaction
+    
+    def _transactions_source(self, cursor, include_archived: bool) -> str:
+        """Источник истории: основная таблица или представление основная + архив"""
+        if not include_archived or not self.pool.archive_path:
+            return 'transactions'
+        ensure_archive_views(cursor, ('transactions',))
+        return 'all_transactions'
+    
+    def get_user_transactions(self, user_id: int, limit: int = 50, include_archived: bool = False) -> List[Dict]:
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM transactions 
+        source = self._transactions_source(cursor, include_archived)
+        cursor.execute(f'''
+            SELECT * FROM {source} 
             WHERE user_id = ? 
             ORDER BY created_at DESC 
             LIMIT ?
@@ -549,27 +966,55 @@ class Database:
         rows = cursor.fetchall()
         conn.close()
         
-        transactions = []
-        for row in rows:
-            transaction = dict(row)
-            
-            if transaction.get('created_at'):
-                try:
-                    if isinstance(transaction['created_at'], datetime):
-                        transaction['created_at'] = transaction['created_at'].isoformat()
-                    elif isinstance(transaction['created_at'], str):
-                        pass
-                    else:
-                        transaction['created_at'] = str(transaction['created_at'])
-                except Exception as e:
-                    print(f"Ошибка обработки даты транзакции: {e}")
-                    transaction['created_at'] = datetime.now().isoformat()
-            else:
-                transaction['created_at'] = datetime.now().isoformat()
-                
-            transactions.append(transaction)
+        return [self._transaction_row_to_dict(row) for row in rows]
+    
+    @staticmethod
+    def encode_transactions_cursor(created_at, transaction_id: int) -> str:
+        """Курсор страницы истории: позиция (created_at, id) последней строки"""
+        raw = json.dumps([created_at, transaction_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def decode_transactions_cursor(cursor_value: str):
+        """Разобрать курсор; ValueError, если он поврежден"""
+        try:
+            padded = cursor_value + '=' * (-len(cursor_value) % 4)
+            created_at, transaction_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return str(created_at), int(transaction_id)
+        except Exception:
+            raise ValueError("Неверный курсор страницы")
+    
+    def get_user_transactions_page(self, user_id: int, after: str = None, limit: int = 50,
+                                   include_archived: bool = False):
+        """Страница истории по ключу (created_at, id): время не зависит от номера страницы"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        source = self._transactions_source(cursor, include_archived)
+        if after:
+            created_at, transaction_id = self.decode_transactions_cursor(after)
+            cursor.execute(f'''
+                SELECT * FROM {source} 
+                WHERE user_id = ? AND (created_at, id) < (?, ?)
+                ORDER BY created_at DESC, id DESC 
+                LIMIT ?
+            ''', (user_id, created_at, transaction_id, limit + 1))
+        else:
+            cursor.execute(f'''
+                SELECT * FROM {source} 
+                WHERE user_id = ? 
+                ORDER BY created_at DESC, id DESC 
+                LIMIT ?
+            ''', (user_id, limit + 1))
+        rows = cursor.fetchall()
+        conn.close()
         
-        return transactions
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = self.encode_transactions_cursor(last['created_at'], last['id'])
+        
+        return [self._transaction_row_to_dict(row) for row in rows], next_cursor
     
     def assign_worker_to_transaction(self, transaction_id: int, worker_id: int) -> bool:
         conn = self.get_connection()
@@ -647,6 +1092,11 @@ class Database:
         return [dict(row) for row in rows] if rows else []
 
     def get_pending_withdrawals(self):
+        """Ожидающие заявки на вывод для админки.
+
+        Это рабочая очередь, а не отчет: читается из основной БД, чтобы
+        только что созданные или обработанные заявки не зависели от возраста снимка.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
@@ -664,11 +1114,16 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute('UPDATE user_balances SET balance = 0.0 WHERE user_id = ? AND currency = "SOL"', (user_id,))
-        cursor.execute('DELETE FROM transactions WHERE user_id = ? AND transaction_type = "test_deposit"', (user_id,))
-        
-        conn.commit()
-        conn.close()
+        try:
+            self._begin_immediate(conn)
+            self._set_user_balance(cursor, user_id, 'SOL', 0, reset_frozen=False, posting_type='reset_test_balance')
+            cursor.execute('DELETE FROM transactions WHERE user_id = ? AND transaction_type = "test_deposit"', (user_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
     
     def update_withdrawal_status(self, withdrawal_id, status, error_message=None):
         conn = self.get_connection()
@@ -688,8 +1143,8 @@ class Database:
         conn.commit()
         conn.close()
     
-    def add_to_payment_queue(self, transaction_id, qr_code_data, qr_code_image, user_info, amount_rub, worker_earnings_rub=None):
-        """Добавить платеж в очередь с учетом заработка воркера"""
+    def add_to_payment_queue(self, transaction_id, qr_code_data, qr_image_hash, user_info, amount_rub, worker_earnings_rub=None):
+        """Добавить платеж в очередь с учетом заработка воркера (PNG QR-кода - в qr_store по хешу)"""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -698,9 +1153,9 @@ class Database:
         
         cursor.execute('''
             INSERT INTO payment_queue 
-            (transaction_id, qr_code_data, qr_code_image, user_info, amount_rub, worker_earnings_rub)
+            (transaction_id, qr_code_data, qr_image_hash, user_info, amount_rub, worker_earnings_rub)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (transaction_id, qr_code_data, qr_code_image, user_info, amount_rub, worker_earnings_rub))
+        ''', (transaction_id, qr_code_data, qr_image_hash, user_info, amount_rub, worker_earnings_rub))
         queue_id = cursor.lastrowid
         conn.commit()
         conn.close()
@@ -725,20 +1180,14 @@ class Database:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT frozen_balance FROM user_balances 
-                WHERE user_id = ? AND currency = ?
-            ''', (user_id, currency))
+            self._begin_immediate(conn)
+            accounts = self._get_user_accounts(cursor, user_id, currency)
+            frozen_units = accounts['frozen']['balance']
             
-            result = cursor.fetchone()
-            if result:
-                frozen_amount = result[0]
-                
-                cursor.execute('''
-                    UPDATE user_balances 
-                    SET balance = balance + ?, frozen_balance = 0
-                    WHERE user_id = ? AND currency = ?
-                ''', (frozen_amount, user_id, currency))
+            self._post_ledger(cursor, currency, 'unfreeze', [
+                (accounts['frozen']['id'], -frozen_units),
+                (accounts['balance']['id'], frozen_units),
+            ], reference=f'user:{user_id}')
             
             conn.commit()
             return True
@@ -780,6 +1229,181 @@ class Database:
         
         return dict(result) if result else None
 
+    def update_payment_queue_status(self, transaction_id, status, assigned_worker_id=None):
+        """Обновить статус записи очереди платежей (и исполнителя, если указан)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        if assigned_worker_id is None:
+            cursor.execute('''
+                UPDATE payment_queue 
+                SET status = ?
+                WHERE transaction_id = ?
+            ''', (status, transaction_id))
+        else:
+            cursor.execute('''
+                UPDATE payment_queue 
+                SET status = ?, assigned_worker_id = ?
+                WHERE transaction_id = ?
+            ''', (status, assigned_worker_id, transaction_id))
+        
+        conn.commit()
+        conn.close()
+
+    def claim_pending_payments(self, limit: int = 20, transaction_id: int = None) -> List[Dict]:
+        """Атомарно перевести ожидающие платежи в dispatched и вернуть их.
+
+        Берутся только записи, чья транзакция еще pending; повторно запись не вернется.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE payment_queue
+            SET status = 'dispatched', dispatched_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT pq.id FROM payment_queue pq
+                JOIN transactions t ON t.id = pq.transaction_id
+                WHERE pq.status = 'pending' AND t.status = 'pending'
+                  AND (pq.next_attempt_at IS NULL OR pq.next_attempt_at <= CURRENT_TIMESTAMP)
+                  AND (? IS NULL OR pq.transaction_id = ?)
+                ORDER BY pq.created_at, pq.id
+                LIMIT ?
+            )
+            RETURNING *
+        ''', (transaction_id, transaction_id, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.commit()
+        conn.close()
+        return sorted(rows, key=lambda row: (row['created_at'], row['id']))
+
+    def retry_payment_dispatch(self, transaction_id: int, error: str, max_attempts: int,
+                               retry_delay: float) -> Optional[float]:
+        """Вернуть неразосланный платеж в pending с повтором через retry_delay * 2^(попытка-1) секунд.
+
+        После max_attempts неудачных попыток запись получает статус dispatch_failed.
+        Возвращает задержку до повтора или None, если повтора не будет.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE payment_queue
+            SET dispatch_attempts = dispatch_attempts + 1, last_dispatch_error = ?
+            WHERE transaction_id = ? AND status = 'dispatched'
+            RETURNING id, dispatch_attempts
+        ''', (error, transaction_id))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.commit()
+            conn.close()
+            return None
+
+        attempts = max(row['dispatch_attempts'] for row in rows)
+        delay = None if attempts >= max_attempts else retry_delay * 2 ** (attempts - 1)
+        for row in rows:
+            if delay is None:
+                cursor.execute(
+                    "UPDATE payment_queue SET status = 'dispatch_failed', next_attempt_at = NULL WHERE id = ?",
+                    (row['id'],)
+                )
+            else:
+                cursor.execute('''
+                    UPDATE payment_queue
+                    SET status = 'pending', dispatched_at = NULL,
+                        next_attempt_at = datetime('now', '+' || ? || ' seconds')
+                    WHERE id = ?
+                ''', (int(delay), row['id']))
+        conn.commit()
+        conn.close()
+        return delay
+
+    def get_next_dispatch_retry_delay(self) -> Optional[float]:
+        """Через сколько секунд подойдет ближайший отложенный повтор рассылки (None - таких нет)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT (julianday(MIN(next_attempt_at)) - julianday('now')) * 86400 AS delay
+            FROM payment_queue
+            WHERE status = 'pending' AND next_attempt_at IS NOT NULL
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        return None if row['delay'] is None else max(row['delay'], 0.0)
+
+    def record_payment_offer(self, transaction_id: int, offered_wave: int, next_offer_in: Optional[float],
+                             offer_order: List[int] = None):
+        """Запомнить, сколько волн воркеров уже получили платеж и когда предлагать следующую (None - больше не нужно).
+
+        offer_order - порядок telegram_id воркеров, из которого строятся волны (None - не менять).
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE payment_queue
+            SET offered_wave = ?,
+                next_offer_at = CASE WHEN ? IS NULL THEN NULL
+                                     ELSE datetime('now', '+' || ? || ' seconds') END,
+                offer_order = COALESCE(?, offer_order)
+            WHERE transaction_id = ?
+        ''', (offered_wave, next_offer_in, None if next_offer_in is None else int(next_offer_in),
+              None if offer_order is None else json.dumps(offer_order), transaction_id))
+        conn.commit()
+        conn.close()
+
+    def get_due_payment_offers(self, limit: int = 20) -> List[Dict]:
+        """Платежи, которым пора предложить следующую волну воркеров, со статусом их транзакции"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT pq.*, t.status AS transaction_status, t.worker_id AS transaction_worker_id
+            FROM payment_queue pq
+            JOIN transactions t ON t.id = pq.transaction_id
+            WHERE pq.next_offer_at IS NOT NULL AND pq.next_offer_at <= CURRENT_TIMESTAMP
+            ORDER BY pq.next_offer_at
+            LIMIT ?
+        ''', (limit,))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        payments = []
+        for row in rows:
+            payment = dict(row)
+            payment['offer_order'] = json.loads(payment['offer_order']) if payment['offer_order'] else None
+            payments.append(payment)
+        return payments
+
+    def get_next_offer_delay(self) -> Optional[float]:
+        """Через сколько секунд подойдет ближайшая волна предложения (None - ожидающих волн нет)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT (julianday(MIN(next_offer_at)) - julianday('now')) * 86400 AS delay
+            FROM payment_queue WHERE next_offer_at IS NOT NULL
+        ''')
+        row = cursor.fetchone()
+        conn.close()
+        return None if row['delay'] is None else max(row['delay'], 0.0)
+
+    def requeue_unoffered_payments(self) -> int:
+        """Вернуть в pending разосланные записи, по которым воркерам не ушла ни одна волна.
+
+        Вызывается при старте бота: рассылка прервалась вместе с процессом, а транзакция
+        все еще ждет воркера. Возвращает число записей.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE payment_queue
+            SET status = 'pending', dispatched_at = NULL
+            WHERE status = 'dispatched' AND offered_wave = 0
+              AND transaction_id IN (
+                  SELECT id FROM transactions WHERE status = 'pending' AND worker_id IS NULL
+              )
+        ''')
+        requeued = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return requeued
+
     def get_pending_payments(self) -> List[Dict]:
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -880,115 +1504,132 @@ class Database:
         conn.close()
     
     def add_role(self, telegram_id: int, role: str, added_by: int = None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        current_roles = self.get_user_roles(telegram_id)
-        
+        # Проверки и вспомогательные запросы - до взятия соединения: ValueError не должен его терять
         if role == 'admin':
             raise ValueError("Добавление администраторов запрещено. Используйте статичную конфигурацию.")
 
+        current_roles = self.get_user_roles(telegram_id)
         if role in current_roles:
             raise ValueError(f"У пользователя уже есть роль '{role}'")
         
         user = self.get_user_by_telegram_id(telegram_id)
         if not user:
-            user_id = self.create_user(
+            self.create_user(
                 telegram_id=telegram_id,
                 username=None,
                 first_name=None,
                 last_name=None
             )
-        else:
-            user_id = user['id']
         
+        conn = self.get_connection()
+        cursor = conn.cursor()
         cursor.execute('''
             INSERT OR REPLACE INTO user_roles (telegram_id, role, added_by)
             VALUES (?, ?, ?)
         ''', (telegram_id, role, added_by))
+        version = self._get_role_version(cursor)
         conn.commit()
         conn.close()
+        self._invalidate('roles', telegram_id)
+        self._apply_role_change(telegram_id, role, True, version)
     
     def remove_role(self, telegram_id: int, role: str):
-        conn = self.get_connection()
-
         if role == 'admin':
             raise ValueError("Удаление администраторов запрещено. Используйте статичную конфигурацию.")
 
+        conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('''
             DELETE FROM user_roles 
             WHERE telegram_id = ? AND role = ?
         ''', (telegram_id, role))
+        removed = cursor.rowcount > 0
+        version = self._get_role_version(cursor)
         conn.commit()
         conn.close()
+        self._invalidate('roles', telegram_id)
+        if removed:
+            self._apply_role_change(telegram_id, role, False, version)
     
     def get_user_roles(self, telegram_id: int) -> List[str]:
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT role FROM user_roles WHERE telegram_id = ?', (telegram_id,))
+            rows = cursor.fetchall()
+            conn.close()
+            return [row['role'] for row in rows] if rows else []
+        
+        return self._cached('roles', telegram_id, load)
+    
+    def get_roster(self) -> Dict[str, List[Dict]]:
+        """Админы (из конфига) и воркеры (из БД и конфига) с кошельками одним запросом"""
+        configured = [(admin_id, 'admin') for admin_id in cfg.ADMIN_IDS]
+        configured += [(worker_id, 'worker') for worker_id in cfg.WORKER_IDS]
+        
+        if configured:
+            values = ', '.join('(?, ?, ?)' for _ in configured)
+            params = [value for position, (telegram_id, role) in enumerate(configured)
+                      for value in (telegram_id, role, position)]
+        else:
+            values = '(NULL, NULL, NULL)'
+            params = []
+        
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT role FROM user_roles WHERE telegram_id = ?', (telegram_id,))
+        cursor.execute(f'''
+            WITH configured(telegram_id, role, position) AS (VALUES {values}),
+            members AS (
+                SELECT telegram_id, role, 0 AS source, id AS position
+                FROM user_roles WHERE role = 'worker'
+                UNION ALL
+                SELECT c.telegram_id, c.role, 1, c.position
+                FROM configured c
+                WHERE c.telegram_id IS NOT NULL AND NOT (c.role = 'worker' AND EXISTS (
+                    SELECT 1 FROM user_roles ur WHERE ur.telegram_id = c.telegram_id AND ur.role = 'worker'
+                ))
+            )
+            SELECT m.telegram_id, m.role, u.id AS user_id, u.username, u.first_name, u.last_name,
+                   w.wallet_address
+            FROM members m
+            LEFT JOIN users u ON u.telegram_id = m.telegram_id
+            LEFT JOIN wallets w ON w.user_id = u.id AND w.currency = 'SOL'
+            ORDER BY m.source, m.position
+        ''', params)
         rows = cursor.fetchall()
         conn.close()
-        return [row['role'] for row in rows] if rows else []
+        
+        roster = {'admins': [], 'workers': []}
+        for row in rows:
+            member = dict(row)
+            role = member.pop('role')
+            roster['admins' if role == 'admin' else 'workers'].append(member)
+        return roster
+    
+    def get_roster_snapshot(self) -> RosterSnapshot:
+        """Снимок состава для рассылок: перестраивается при изменении ролей или по ROSTER_TTL"""
+        version = self._role_index().version
+        snapshot = self.pool.roster
+        if snapshot is not None and snapshot.is_fresh(version):
+            return snapshot
+        
+        roster = self.get_roster()
+        snapshot = RosterSnapshot(roster['admins'], roster['workers'], version)
+        if getattr(self.pool.local, 'unit', None) is None:
+            self.pool.roster = snapshot
+        return snapshot
     
     def get_all_admins(self) -> List[Dict]:
         """Получить всех администраторов (только статичные из конфига)"""
-        admins = []
-        for admin_id in cfg.ADMIN_IDS:
-            user = self.get_user_by_telegram_id(admin_id)
-            if user:
-                admins.append({
-                    'telegram_id': admin_id,
-                    'username': user.get('username'),
-                    'first_name': user.get('first_name'),
-                    'last_name': user.get('last_name')
-                })
-            else:
-                admins.append({
-                    'telegram_id': admin_id,
-                    'username': None,
-                    'first_name': None,
-                    'last_name': None
-                })
-        return admins
+        return self.get_roster()['admins']
     
     def get_all_workers(self) -> List[Dict]:
-        """Получить всех воркеров (из конфига + из БД)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ur.telegram_id, u.username, u.first_name, u.last_name
-            FROM user_roles ur
-            LEFT JOIN users u ON ur.telegram_id = u.telegram_id
-            WHERE ur.role = "worker"
-        ''')
-        db_workers = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        config_workers = []
-        for worker_id in cfg.WORKER_IDS:
-            if not any(w['telegram_id'] == worker_id for w in db_workers):
-                user = self.get_user_by_telegram_id(worker_id)
-                if user:
-                    config_workers.append({
-                        'telegram_id': worker_id,
-                        'username': user.get('username'),
-                        'first_name': user.get('first_name'),
-                        'last_name': user.get('last_name')
-                    })
-                else:
-                    config_workers.append({
-                        'telegram_id': worker_id,
-                        'username': None,
-                        'first_name': None,
-                        'last_name': None
-                    })
-        
-        return db_workers + config_workers
+        """Получить всех воркеров (из БД + из конфига)"""
+        return self.get_roster()['workers']
     
     def get_top_workers(self, limit: int = 10) -> List[Dict]:
-        conn = self.get_connection()
+        """Лучшие воркеры по обороту (отчетный запрос, читается из снимка)"""
+        conn = self._reporting_connection()
         cursor = conn.cursor()
         cursor.execute('''
             SELECT 
@@ -1064,16 +1705,20 @@ class Database:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                UPDATE user_balances 
-                SET balance = balance - ?, frozen_balance = frozen_balance + ?
-                WHERE user_id = ? AND currency = ? AND balance >= ?
-            ''', (amount, amount, user_id, currency, amount))
+            self._begin_immediate(conn)
+            amount_units = to_units(amount, currency)
+            accounts = self._get_user_accounts(cursor, user_id, currency)
+            if amount_units <= 0 or accounts['balance']['balance'] < amount_units:
+                conn.rollback()
+                return False
             
-            affected_rows = cursor.rowcount
+            self._post_ledger(cursor, currency, 'freeze', [
+                (accounts['balance']['id'], -amount_units),
+                (accounts['frozen']['id'], amount_units),
+            ], reference=f'user:{user_id}')
             conn.commit()
             
-            return affected_rows > 0
+            return True
             
         except Exception as e:
             conn.rollback()
@@ -1088,14 +1733,11 @@ class Database:
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                UPDATE user_balances 
-                SET balance = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND currency = ?
-            ''', (new_balance, user_id, currency))
-            
+            self._begin_immediate(conn)
+            self._set_user_balance(cursor, user_id, currency, to_units(new_balance, currency),
+                                   reset_frozen=False, posting_type='set_balance')
             conn.commit()
-            return cursor.rowcount > 0
+            return True
         except Exception as e:
             conn.rollback()
             return False
@@ -1123,12 +1765,15 @@ class Database:
             conn.close()
     
     def get_setting(self, key: str) -> Optional[str]:
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-        row = cursor.fetchone()
-        conn.close()
-        return row['value'] if row else None
+        def load():
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            conn.close()
+            return row['value'] if row else None
+        
+        return self._cached('setting', key, load)
     
     def update_setting(self, key: str, value: str):
         conn = self.get_connection()
@@ -1139,6 +1784,7 @@ class Database:
         ''', (key, value))
         conn.commit()
         conn.close()
+        self._invalidate('setting', key)
     
     def get_free_workers(self) -> List[Dict]:
         conn = self.get_connection()
@@ -1162,41 +1808,149 @@ class Database:
         conn.close()
         return row['count'] if row else 0
     
-    def get_system_stats(self) -> Dict:
+    def touch_worker_heartbeat(self, telegram_id: int) -> bool:
+        """Отметить активность воркера в worker_status (heartbeat для распределения платежей)"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        stats = {}
-        
-        cursor.execute('SELECT COUNT(*) as count FROM users')
-        stats['total_users'] = cursor.fetchone()['count']
-        
         cursor.execute('''
-            SELECT COUNT(DISTINCT ub.user_id) as count 
-            FROM user_balances ub 
-            WHERE ub.balance > 0
-        ''')
-        stats['active_users'] = cursor.fetchone()['count']
+            INSERT INTO worker_status (worker_id, last_active)
+            SELECT id, CURRENT_TIMESTAMP FROM users WHERE telegram_id = ?
+            ON CONFLICT(worker_id) DO UPDATE SET last_active = CURRENT_TIMESTAMP
+        ''', (telegram_id,))
+        touched = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return touched
+    
+    def get_worker_states(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Загрузка, простой и скорость воркеров из worker_status по users.id"""
+        user_ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id is not None))
+        if not user_ids:
+            return {}
         
-        cursor.execute('''
-            SELECT 
-                COUNT(*) as total_transactions,
-                COALESCE(SUM(amount_rub), 0) as total_volume_rub,
-                COALESCE(SUM(CASE WHEN status = 'completed' THEN amount_rub ELSE 0 END), 0) as completed_volume_rub
-            FROM transactions
-        ''')
-        transaction_stats = cursor.fetchone()
-        stats.update(dict(transaction_stats))
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' for _ in user_ids)
+        cursor.execute(f'''
+            SELECT worker_id, status, active_payments, assigned_at, handled_count, avg_handle_seconds,
+                   (julianday('now') - julianday(last_active)) * 86400 AS idle_seconds
+            FROM worker_status WHERE worker_id IN ({placeholders})
+        ''', user_ids)
+        rows = cursor.fetchall()
+        conn.close()
+        return {row['worker_id']: dict(row) for row in rows}
+    
+    def get_system_stats(self) -> Dict:
+        """Статистика системы из счетчиков system_stats (отчетный запрос, читается из снимка)"""
+        conn = self._reporting_connection()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' for _ in SYSTEM_STATS)
+        cursor.execute(f'SELECT name, value FROM system_stats WHERE name IN ({placeholders})', SYSTEM_STATS)
+        rows = cursor.fetchall()
+        conn.close()
         
-        cursor.execute('''
-            SELECT 
-                COALESCE(SUM(worker_commission * amount_rub / 100), 0) as total_worker_commission,
-                COALESCE(SUM(admin_commission * amount_rub / 100), 0) as total_admin_commission
-            FROM transactions 
-            WHERE status = 'completed'
-        ''')
-        commission_stats = cursor.fetchone()
-        stats.update(dict(commission_stats))
+        stats = {}
+        for row in rows:
+            value = row['value']
+            stats[row['name']] = int(round(value)) if row['name'] in SYSTEM_STATS_COUNTS else value
+        return stats
+    
+    def rebuild_system_stats(self) -> Dict:
+        """Пересчитать счетчики system_stats с нуля; возвращает расхождения"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            self._begin_immediate(conn)
+            placeholders = ', '.join('?' for _ in SYSTEM_STATS)
+            cursor.execute(f'SELECT name, value FROM system_stats WHERE name IN ({placeholders})', SYSTEM_STATS)
+            before = {row['name']: row['value'] for row in cursor.fetchall()}
+            sources = ('main.transactions', 'archive.transactions') if self.pool.archive_path else ('transactions',)
+            after = recompute_system_stats(cursor, sources)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return {name: {'before': before.get(name), 'after': value}
+                for name, value in after.items()
+                if before.get(name) is None or abs(before[name] - value) > 1e-6}
+    
+    def archive_old_records(self, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                            batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+        """Перенести завершенные строки старше older_than_days в архив; вернуть число по таблицам.
+
+        Каждая пачка - отдельная короткая транзакция, чтобы не держать блокировку записи.
+        """
+        if not self.pool.archive_path:
+            return {table: 0 for table in ARCHIVED_TABLES}
         
+        cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        moved = {}
+        for table in ARCHIVED_TABLES:
+            moved[table] = 0
+            while True:
+                conn = self.get_connection()
+                cursor = conn.cursor()
+                try:
+                    self._begin_immediate(conn)
+                    count = archive_batch(cursor, table, cutoff, batch_size)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.close()
+                
+                moved[table] += count
+                if count < batch_size:
+                    break
+        return moved
+
+    def get_referenced_qr_hashes(self) -> set:
+        """Хеши PNG из qr_store, на которые ссылаются записи payment_queue (включая архив)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT DISTINCT qr_image_hash FROM payment_queue WHERE qr_image_hash IS NOT NULL')
+        hashes = {row['qr_image_hash'] for row in cursor.fetchall()}
+        if self.pool.archive_path:
+            cursor.execute('SELECT DISTINCT qr_image_hash FROM archive.payment_queue WHERE qr_image_hash IS NOT NULL')
+            hashes.update(row['qr_image_hash'] for row in cursor.fetchall())
         conn.close()
-        return stats
\ No newline at end of file
+        return hashes
+
+    def sweep_expired(self, batch_size: int = SWEEP_BATCH_SIZE,
+                      rate_limit_retention: int = RATE_LIMIT_RETENTION) -> Dict[str, int]:
+        """Удалить истекшие коды и старые ключи rate_limits; вернуть число строк по таблицам.
+
+        Удаление идет пачками по индексу срока жизни, каждая пачка - короткая транзакция.
+        """
+        # expires_at пишется как локальное datetime, last_attempt - CURRENT_TIMESTAMP (UTC)
+        cutoffs = {
+            'auth_codes': datetime.now(),
+            'session_codes': datetime.now(),
+            'rate_limits': (datetime.utcnow() - timedelta(seconds=rate_limit_retention)).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        
+        swept = {}
+        for table, column in EXPIRING_TABLES.items():
+            swept[table] = 0
+            while True:
+                conn = self.get_connection()
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f'''
+                        DELETE FROM {table} WHERE id IN (
+                            SELECT id FROM {table} WHERE {column} <= ? ORDER BY {column} LIMIT ?
+                        )
+                    ''', (cutoffs[table], batch_size))
+                    count = cursor.rowcount
+                    conn.commit()
+                finally:
+                    conn.close()
+                
+                swept[table] += count
+                if count < batch_size:
+                    break
+        return swept
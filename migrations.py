@@ -0,0 +1,725 @@
+"""
+Модуль версионированных миграций схемы базы данных
+"""
+
+import base64
+import binascii
+from typing import List
+from money import to_units
+
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    """Проверить наличие колонки в таблице"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def add_column(cursor, table: str, column: str, definition: str):
+    """Добавить колонку, если ее еще нет"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _initial_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_balances (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            balance REAL DEFAULT 0.0,
+            frozen_balance REAL DEFAULT 0.0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id, currency)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wallets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            wallet_address TEXT NOT NULL,
+            private_key TEXT,
+            seed_phrase TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id, currency)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS frozen_balances (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            amount REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id, currency)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            wallet_id INTEGER,
+            transaction_type TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            amount REAL,
+            amount_rub REAL,
+            exchange_rate REAL,
+            commission_markup REAL,
+            worker_commission REAL,
+            admin_commission REAL,
+            status TEXT DEFAULT 'pending',
+            qr_code_data TEXT,
+            worker_id INTEGER,
+            admin_id INTEGER,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (wallet_id) REFERENCES wallets(id),
+            FOREIGN KEY (worker_id) REFERENCES users(id),
+            FOREIGN KEY (admin_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS security_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            event_description TEXT NOT NULL,
+            severity TEXT DEFAULT 'info',
+            user_id INTEGER,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS withdrawal_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount_sol REAL NOT NULL,
+            wallet_address TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT UNIQUE NOT NULL,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id INTEGER NOT NULL,
+            qr_code_data TEXT NOT NULL,
+            qr_code_image TEXT,
+            user_info TEXT NOT NULL,
+            amount_rub REAL NOT NULL,
+            status TEXT DEFAULT 'pending',
+            assigned_worker_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (transaction_id) REFERENCES transactions(id),
+            FOREIGN KEY (assigned_worker_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS auth_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            telegram_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            code_type TEXT NOT NULL,
+            is_used BOOLEAN DEFAULT 0,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS session_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_code TEXT UNIQUE NOT NULL,
+            code_type TEXT NOT NULL,
+            auth_code TEXT,
+            telegram_id INTEGER,
+            is_used BOOLEAN DEFAULT 0,
+            expires_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_roles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            added_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(telegram_id, role),
+            FOREIGN KEY (added_by) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE NOT NULL,
+            language TEXT DEFAULT 'ru',
+            notifications_enabled BOOLEAN DEFAULT 1,
+            auto_withdraw_enabled BOOLEAN DEFAULT 0,
+            preferred_currency TEXT DEFAULT 'SOL',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS worker_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            worker_id INTEGER NOT NULL,
+            completed_payments INTEGER DEFAULT 0,
+            total_commission_rub REAL DEFAULT 0.0,
+            total_processed_rub REAL DEFAULT 0.0,
+            last_payment_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (worker_id) REFERENCES users(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS worker_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            worker_id INTEGER UNIQUE NOT NULL,
+            status TEXT DEFAULT 'free',
+            current_transaction_id INTEGER,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (worker_id) REFERENCES users(id),
+            FOREIGN KEY (current_transaction_id) REFERENCES transactions(id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL,
+            attempts INTEGER DEFAULT 1,
+            first_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_attempt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(key)
+        )
+    ''')
+
+    cursor.execute('''
+        INSERT OR IGNORE INTO settings (key, value)
+        VALUES ('home_page_text', 'Добро пожаловать в CryptoPay! Пополняйте баланс Solana и оплачивайте покупки по QR-коду.')
+    ''')
+
+
+def _withdrawal_request_type(cursor):
+    add_column(cursor, 'withdrawal_requests', 'request_type', "TEXT DEFAULT 'balance'")
+
+
+def _payment_queue_worker_earnings(cursor):
+    add_column(cursor, 'payment_queue', 'worker_earnings_rub', 'REAL')
+
+
+def _user_balances_frozen_balance(cursor):
+    add_column(cursor, 'user_balances', 'frozen_balance', 'REAL DEFAULT 0.0')
+
+
+def _hot_query_indexes(cursor):
+    indexes = [
+        ('idx_transactions_user_created', 'transactions', 'user_id, created_at'),
+        ('idx_transactions_status_created', 'transactions', 'status, created_at'),
+        ('idx_payment_queue_status_created', 'payment_queue', 'status, created_at'),
+        ('idx_payment_queue_transaction', 'payment_queue', 'transaction_id'),
+        ('idx_withdrawal_requests_status_created', 'withdrawal_requests', 'status, created_at'),
+        ('idx_withdrawal_requests_user_created', 'withdrawal_requests', 'user_id, created_at'),
+        ('idx_users_username', 'users', 'username'),
+        ('idx_user_roles_role', 'user_roles', 'role'),
+        ('idx_auth_codes_expires', 'auth_codes', 'expires_at'),
+        ('idx_session_codes_expires', 'session_codes', 'expires_at'),
+        ('idx_worker_stats_worker', 'worker_stats', 'worker_id'),
+        ('idx_worker_stats_processed', 'worker_stats', 'total_processed_rub'),
+        ('idx_worker_status_status', 'worker_status', 'status'),
+    ]
+    for name, table, columns in indexes:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+def _integer_ledger(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner_type TEXT NOT NULL,
+            owner_id INTEGER NOT NULL DEFAULT 0,
+            currency TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            balance INTEGER NOT NULL DEFAULT 0,
+            checkpoint_balance INTEGER NOT NULL DEFAULT 0,
+            checkpoint_entry_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(owner_type, owner_id, currency, kind)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_postings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            currency TEXT NOT NULL,
+            posting_type TEXT NOT NULL,
+            reference TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            posting_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (posting_id) REFERENCES ledger_postings(id),
+            FOREIGN KEY (account_id) REFERENCES ledger_accounts(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_entries_account ON ledger_entries (account_id, id)')
+
+    # Журнал только дополняется: исправления делаются новыми проводками
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ledger_entries_no_update
+        BEFORE UPDATE ON ledger_entries
+        BEGIN
+            SELECT RAISE(ABORT, 'ledger_entries is append-only');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS ledger_entries_no_delete
+        BEFORE DELETE ON ledger_entries
+        BEGIN
+            SELECT RAISE(ABORT, 'ledger_entries is append-only');
+        END
+    ''')
+
+    add_column(cursor, 'transactions', 'amount_units', 'INTEGER')
+    add_column(cursor, 'transactions', 'amount_rub_kopecks', 'INTEGER')
+    cursor.execute('''
+        UPDATE transactions
+        SET amount_units = CAST(ROUND(amount * CASE currency WHEN 'RUB' THEN 100 ELSE 1000000000 END) AS INTEGER),
+            amount_rub_kopecks = CAST(ROUND(amount_rub * 100) AS INTEGER)
+        WHERE amount_units IS NULL
+    ''')
+
+    # Перенос текущих REAL балансов в журнал начальными проводками
+    cursor.execute('SELECT user_id, currency, balance, frozen_balance FROM user_balances')
+    for user_id, currency, balance, frozen_balance in cursor.fetchall():
+        opening = [('balance', to_units(balance or 0, currency)),
+                   ('frozen', to_units(frozen_balance or 0, currency))]
+        if not any(units for _, units in opening):
+            continue
+
+        cursor.execute('''
+            INSERT INTO ledger_postings (currency, posting_type, reference)
+            VALUES (?, 'opening', ?)
+        ''', (currency, f'user_balances:{user_id}'))
+        posting_id = cursor.lastrowid
+
+        entries = [('user', user_id, kind, units) for kind, units in opening if units]
+        entries.append(('system', 0, 'external', -sum(units for _, units in opening)))
+        for owner_type, owner_id, kind, units in entries:
+            cursor.execute('''
+                INSERT OR IGNORE INTO ledger_accounts (owner_type, owner_id, currency, kind)
+                VALUES (?, ?, ?, ?)
+            ''', (owner_type, owner_id, currency, kind))
+            cursor.execute('''
+                SELECT id FROM ledger_accounts
+                WHERE owner_type = ? AND owner_id = ? AND currency = ? AND kind = ?
+            ''', (owner_type, owner_id, currency, kind))
+            account_id = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT INTO ledger_entries (posting_id, account_id, amount)
+                VALUES (?, ?, ?)
+            ''', (posting_id, account_id, units))
+            cursor.execute('UPDATE ledger_accounts SET balance = balance + ? WHERE id = ?',
+                           (units, account_id))
+
+
+# Счетчики system_stats по транзакциям: вклад одной строки, {row} = NEW/OLD/алиас
+TRANSACTION_STATS = {
+    'total_transactions': '1',
+    'total_volume_rub': 'COALESCE({row}.amount_rub, 0)',
+    'completed_volume_rub': "CASE WHEN {row}.status = 'completed' THEN COALESCE({row}.amount_rub, 0) ELSE 0 END",
+    'total_worker_commission': ("CASE WHEN {row}.status = 'completed' "
+                                "THEN COALESCE({row}.worker_commission * {row}.amount_rub / 100, 0) ELSE 0 END"),
+    'total_admin_commission': ("CASE WHEN {row}.status = 'completed' "
+                               "THEN COALESCE({row}.admin_commission * {row}.amount_rub / 100, 0) ELSE 0 END"),
+}
+
+SYSTEM_STATS = ('total_users', 'active_users') + tuple(TRANSACTION_STATS)
+
+# Счетчики-количества (остальные суммы в рублях)
+SYSTEM_STATS_COUNTS = ('total_users', 'active_users', 'total_transactions')
+
+
+def _transaction_stats_delta(sign: str, row: str) -> str:
+    """CASE по имени счетчика: прибавить (+) или вычесть (-) вклад строки"""
+    branches = ' '.join(f"WHEN '{name}' THEN {sign}({expr.format(row=row)})"
+                        for name, expr in TRANSACTION_STATS.items())
+    return f'CASE name {branches} ELSE 0 END'
+
+
+def _active_user_change(row: str, delta: str) -> str:
+    """Изменить active_users на delta, если у владельца нет другого положительного баланса"""
+    return f'''
+            UPDATE system_stats SET value = value + ({delta})
+            WHERE name = 'active_users' AND NOT EXISTS (
+                SELECT 1 FROM ledger_accounts
+                WHERE owner_type = 'user' AND owner_id = {row}.owner_id
+                  AND kind = 'balance' AND balance > 0 AND id != {row}.id
+            );
+    '''
+
+
+def recompute_system_stats(cursor, transaction_sources=('transactions',)):
+    """Пересчитать все счетчики system_stats полным проходом по таблицам"""
+    cursor.execute('SELECT COUNT(*) FROM users')
+    values = {'total_users': cursor.fetchone()[0]}
+
+    cursor.execute('''
+        SELECT COUNT(DISTINCT owner_id) FROM ledger_accounts
+        WHERE owner_type = 'user' AND kind = 'balance' AND balance > 0
+    ''')
+    values['active_users'] = cursor.fetchone()[0]
+
+    sums = ', '.join(f'COALESCE(SUM({expr.format(row="t")}), 0)' for expr in TRANSACTION_STATS.values())
+    totals = [0] * len(TRANSACTION_STATS)
+    for source in transaction_sources:
+        cursor.execute(f'SELECT {sums} FROM {source} t')
+        totals = [total + value for total, value in zip(totals, cursor.fetchone())]
+    values.update(zip(TRANSACTION_STATS, totals))
+
+    cursor.executemany('''
+        INSERT INTO system_stats (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+    ''', list(values.items()))
+    return values
+
+
+def _system_stats_counters(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_stats (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS system_stats_users_insert
+        AFTER INSERT ON users
+        BEGIN
+            UPDATE system_stats SET value = value + 1 WHERE name = 'total_users';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS system_stats_users_delete
+        AFTER DELETE ON users
+        BEGIN
+            UPDATE system_stats SET value = value - 1 WHERE name = 'total_users';
+        END
+    ''')
+
+    names = ', '.join(f"'{name}'" for name in TRANSACTION_STATS)
+    columns = 'amount_rub, status, worker_commission, admin_commission'
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_transactions_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            UPDATE system_stats SET value = value + {_transaction_stats_delta('+', 'NEW')}
+            WHERE name IN ({names});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_transactions_update
+        AFTER UPDATE OF {columns} ON transactions
+        BEGIN
+            UPDATE system_stats
+            SET value = value + {_transaction_stats_delta('+', 'NEW')} + {_transaction_stats_delta('-', 'OLD')}
+            WHERE name IN ({names});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_transactions_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            UPDATE system_stats SET value = value + {_transaction_stats_delta('-', 'OLD')}
+            WHERE name IN ({names});
+        END
+    ''')
+
+    # active_users меняется, только когда баланс пересекает ноль
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_active_users_insert
+        AFTER INSERT ON ledger_accounts
+        WHEN NEW.owner_type = 'user' AND NEW.kind = 'balance' AND NEW.balance > 0
+        BEGIN {_active_user_change('NEW', '1')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_active_users_update
+        AFTER UPDATE OF balance ON ledger_accounts
+        WHEN NEW.owner_type = 'user' AND NEW.kind = 'balance' AND (OLD.balance > 0) != (NEW.balance > 0)
+        BEGIN {_active_user_change('NEW', 'CASE WHEN NEW.balance > 0 THEN 1 ELSE -1 END')} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS system_stats_active_users_delete
+        AFTER DELETE ON ledger_accounts
+        WHEN OLD.owner_type = 'user' AND OLD.kind = 'balance' AND OLD.balance > 0
+        BEGIN {_active_user_change('OLD', '-1')} END
+    ''')
+
+    recompute_system_stats(cursor)
+
+
+def _role_version(cursor):
+    # Счетчик изменений user_roles: процессы сверяют с ним свой индекс ролей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS role_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO role_version (id, version) VALUES (1, 0)')
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS role_version_{event.lower()}
+            AFTER {event} ON user_roles
+            BEGIN
+                UPDATE role_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _rate_limits_last_attempt_index(cursor):
+    # Очистка устаревших ключей rate_limits идет по last_attempt без прохода по таблице
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_last_attempt ON rate_limits (last_attempt)')
+
+
+def _payment_queue_dispatched_at(cursor):
+    # Статус dispatched и время рассылки заменяют список отправленных платежей в памяти
+    add_column(cursor, 'payment_queue', 'dispatched_at', 'TIMESTAMP')
+
+
+def _payment_queue_qr_image_hash(cursor):
+    # PNG QR-кодов переезжают из base64 в строке в qr_store, в строке остается хеш.
+    # Файл пишется до UPDATE строки; при откате миграции в qr_store остаются файлы
+    # без ссылок - это допустимо: имя = хеш содержимого, повторный запуск их переиспользует
+    from qr_store import qr_store
+
+    add_column(cursor, 'payment_queue', 'qr_image_hash', 'TEXT')
+
+    last_id = 0
+    while True:
+        cursor.execute('''
+            SELECT id, qr_code_image FROM payment_queue
+            WHERE id > ? AND qr_code_image IS NOT NULL AND qr_code_image != ''
+            ORDER BY id LIMIT 100
+        ''', (last_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        for row_id, image in rows:
+            last_id = row_id
+            try:
+                image_hash = qr_store.put(base64.b64decode(image, validate=True))
+            except (binascii.Error, ValueError):
+                continue
+            cursor.execute(
+                'UPDATE payment_queue SET qr_image_hash = ?, qr_code_image = NULL WHERE id = ?',
+                (image_hash, row_id)
+            )
+
+
+# Статусы, в которых платеж занимает воркера
+WORKER_BUSY_STATUSES = ('in_progress', 'waiting_user_confirmation')
+
+
+def _worker_status_load(cursor):
+    # worker_status ведется триггерами: назначение платежа занимает воркера, выход из
+    # WORKER_BUSY_STATUSES освобождает и обновляет среднее время обработки
+    add_column(cursor, 'worker_status', 'active_payments', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'worker_status', 'assigned_at', 'TIMESTAMP')
+    add_column(cursor, 'worker_status', 'handled_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'worker_status', 'avg_handle_seconds', 'REAL')
+
+    busy = ', '.join(f"'{status}'" for status in WORKER_BUSY_STATUSES)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS worker_status_assign
+        AFTER UPDATE OF status, worker_id ON transactions
+        WHEN NEW.worker_id IS NOT NULL AND NEW.status IN ({busy})
+         AND NOT (OLD.status IN ({busy}) AND OLD.worker_id IS NEW.worker_id)
+        BEGIN
+            INSERT INTO worker_status (worker_id, status, current_transaction_id, active_payments,
+                                       assigned_at, last_active)
+            VALUES (NEW.worker_id, 'busy', NEW.id, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ON CONFLICT(worker_id) DO UPDATE SET
+                status = 'busy', current_transaction_id = NEW.id, active_payments = active_payments + 1,
+                assigned_at = CURRENT_TIMESTAMP, last_active = CURRENT_TIMESTAMP;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS worker_status_release
+        AFTER UPDATE OF status, worker_id ON transactions
+        WHEN OLD.worker_id IS NOT NULL AND OLD.status IN ({busy})
+         AND NOT (NEW.status IN ({busy}) AND NEW.worker_id IS OLD.worker_id)
+        BEGIN
+            UPDATE worker_status SET
+                status = CASE WHEN active_payments > 1 THEN 'busy' ELSE 'free' END,
+                active_payments = MAX(active_payments - 1, 0),
+                current_transaction_id = CASE WHEN current_transaction_id = OLD.id
+                                              THEN NULL ELSE current_transaction_id END,
+                avg_handle_seconds = CASE
+                    WHEN NEW.status = 'completed' AND assigned_at IS NOT NULL
+                    THEN (COALESCE(avg_handle_seconds, 0) * handled_count
+                          + (julianday('now') - julianday(assigned_at)) * 86400) / (handled_count + 1)
+                    ELSE avg_handle_seconds END,
+                handled_count = handled_count + (NEW.status = 'completed'),
+                last_active = CURRENT_TIMESTAMP
+            WHERE worker_id = OLD.worker_id;
+        END
+    ''')
+
+    # Текущая загрузка по уже назначенным платежам
+    cursor.execute("UPDATE worker_status SET status = 'free', current_transaction_id = NULL, active_payments = 0")
+    cursor.execute(f'''
+        INSERT INTO worker_status (worker_id, status, current_transaction_id, active_payments)
+        SELECT worker_id, 'busy', MAX(id), COUNT(*) FROM transactions
+        WHERE status IN ({busy}) AND worker_id IS NOT NULL
+        GROUP BY worker_id
+        ON CONFLICT(worker_id) DO UPDATE SET
+            status = 'busy', current_transaction_id = excluded.current_transaction_id,
+            active_payments = excluded.active_payments
+    ''')
+
+
+def _payment_queue_dispatch_retry(cursor):
+    # Неудачная рассылка возвращает запись в pending с отложенным повтором,
+    # после DISPATCH_MAX_ATTEMPTS попыток - статус dispatch_failed
+    add_column(cursor, 'payment_queue', 'dispatch_attempts', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'payment_queue', 'next_attempt_at', 'TIMESTAMP')
+    add_column(cursor, 'payment_queue', 'last_dispatch_error', 'TEXT')
+
+
+def _payment_queue_offer_waves(cursor):
+    # Прогресс предложения платежа воркерам волнами хранится в строке, чтобы
+    # после перезапуска бота следующие волны продолжились
+    add_column(cursor, 'payment_queue', 'offered_wave', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(cursor, 'payment_queue', 'next_offer_at', 'TIMESTAMP')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_queue_next_offer
+        ON payment_queue (next_offer_at) WHERE next_offer_at IS NOT NULL
+    ''')
+
+
+def _payment_queue_offer_order(cursor):
+    # Порядок воркеров фиксируется при первой волне: следующие волны берутся из него,
+    # а не из нового порядка, иначе часть воркеров получала бы платеж дважды
+    add_column(cursor, 'payment_queue', 'offer_order', 'TEXT')
+
+
+# (версия, описание, функция миграции). Новые миграции добавляются только в конец.
+MIGRATIONS = [
+    (1, 'Начальная схема', _initial_schema),
+    (2, 'withdrawal_requests.request_type', _withdrawal_request_type),
+    (3, 'payment_queue.worker_earnings_rub', _payment_queue_worker_earnings),
+    (4, 'user_balances.frozen_balance', _user_balances_frozen_balance),
+    (5, 'Индексы для частых запросов', _hot_query_indexes),
+    (6, 'Журнал проводок в целых единицах', _integer_ledger),
+    (7, 'Счетчики system_stats на триггерах', _system_stats_counters),
+    (8, 'Версия ролей для индекса в памяти', _role_version),
+    (9, 'Индекс rate_limits.last_attempt', _rate_limits_last_attempt_index),
+    (10, 'payment_queue.dispatched_at', _payment_queue_dispatched_at),
+    (11, 'QR-коды payment_queue в qr_store', _payment_queue_qr_image_hash),
+    (12, 'Загрузка воркеров в worker_status', _worker_status_load),
+    (13, 'Повторная рассылка payment_queue', _payment_queue_dispatch_retry),
+    (14, 'Волны предложения payment_queue', _payment_queue_offer_waves),
+    (15, 'payment_queue.offer_order', _payment_queue_offer_order),
+]
+
+
+def get_schema_version(cursor) -> int:
+    """Текущая версия схемы"""
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return cursor.fetchone()[0]
+
+
+def apply_migrations(conn, backend) -> List[int]:
+    """Применить недостающие миграции, каждую в своей транзакции (backend - storage.StorageBackend)"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= get_schema_version(cursor):
+            continue
+
+        # Повторная проверка под блокировкой: другой процесс мог успеть раньше
+        backend.begin_write(conn)
+        try:
+            if version <= get_schema_version(cursor):
+                conn.rollback()
+                continue
+
+            migrate(cursor)
+            cursor.execute('''
+                INSERT INTO schema_version (version, description)
+                VALUES (?, ?)
+            ''', (version, description))
+            conn.commit()
+            applied.append(version)
+        except backend.Error as e:
+            conn.rollback()
+            print(f"❌ Ошибка миграции {version} ({description}): {e}")
+            raise
+
+    return applied
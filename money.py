@@ -0,0 +1,63 @@
+"""
+Модуль для работы с денежными суммами в целых единицах (лампорты, копейки)
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+LAMPORTS_PER_SOL = 1_000_000_000
+KOPECKS_PER_RUB = 100
+
+CURRENCY_UNITS = {
+    'SOL': LAMPORTS_PER_SOL,
+    'RUB': KOPECKS_PER_RUB,
+}
+
+
+def units_per(currency: str) -> int:
+    """Сколько минимальных единиц в одной единице валюты"""
+    return CURRENCY_UNITS.get(currency, LAMPORTS_PER_SOL)
+
+
+def to_units(amount, currency: str = 'SOL') -> int:
+    """Перевести сумму в целые минимальные единицы с округлением"""
+    if amount is None:
+        return 0
+    value = Decimal(str(amount)) * units_per(currency)
+    return int(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_units(units, currency: str = 'SOL') -> float:
+    """Перевести целые минимальные единицы в сумму валюты"""
+    if units is None:
+        return 0.0
+    return units / units_per(currency)
+
+
+def sol_to_lamports(amount_sol) -> int:
+    return to_units(amount_sol, 'SOL')
+
+
+def lamports_to_sol(lamports) -> float:
+    return from_units(lamports, 'SOL')
+
+
+def rub_to_kopecks(amount_rub) -> int:
+    return to_units(amount_rub, 'RUB')
+
+
+def kopecks_to_rub(kopecks) -> float:
+    return from_units(kopecks, 'RUB')
+
+
+def rub_kopecks_to_lamports(kopecks: int, exchange_rate) -> int:
+    """Пересчитать копейки в лампорты по курсу SOL/RUB без потери точности"""
+    rate = Decimal(str(exchange_rate))
+    if rate <= 0:
+        raise ValueError("Курс должен быть больше нуля")
+    value = Decimal(kopecks) * LAMPORTS_PER_SOL / (rate * KOPECKS_PER_RUB)
+    return int(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def percent_of(units: int, percent) -> int:
+    """Процент от суммы в целых единицах (округление вниз)"""
+    return int(Decimal(units) * Decimal(str(percent)) / 100)
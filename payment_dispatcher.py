@@ -0,0 +1,136 @@
+"""
+Рассылка новых платежей воркерам по событию вместо периодического опроса БД
+"""
+
+import asyncio
+import json
+import cfg
+from typing import Optional
+
+DISPATCH_BATCH_SIZE = getattr(cfg, 'DISPATCH_BATCH_SIZE', 20)
+DISPATCH_MAX_ATTEMPTS = getattr(cfg, 'DISPATCH_MAX_ATTEMPTS', 5)
+DISPATCH_RETRY_DELAY = getattr(cfg, 'DISPATCH_RETRY_DELAY', 30)
+
+_active_dispatcher = None
+
+
+class PaymentDispatcher:
+    """Забирает записи payment_queue (pending -> dispatched) и отправляет их воркерам.
+
+    Работает в цикле событий бота и спит, пока producer не вызовет wake().
+    Какие платежи уже разосланы, хранится в статусе строки, а не в памяти процесса.
+    Если send() упал или никому не доставил платеж, запись возвращается в pending
+    с нарастающей задержкой; после max_attempts попыток - статус dispatch_failed.
+    """
+
+    def __init__(self, adb, send, batch_size: int = DISPATCH_BATCH_SIZE,
+                 max_attempts: int = DISPATCH_MAX_ATTEMPTS, retry_delay: float = DISPATCH_RETRY_DELAY):
+        self.adb = adb
+        self.send = send
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._loop = None
+        self._event = None
+        self._retry_timer = None
+        self.dispatched = 0
+        self.failed = 0
+        self.retried = 0
+
+    async def run(self):
+        """Основной цикл: при старте разослать накопившиеся платежи, затем ждать сигналов"""
+        global _active_dispatcher
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._event.set()
+        _active_dispatcher = self
+        print("📮 Диспетчер платежей запущен")
+        try:
+            while True:
+                await self._event.wait()
+                self._event.clear()
+                try:
+                    await self._drain()
+                    self._schedule_retry(await self.adb.get_next_dispatch_retry_delay())
+                except Exception as e:
+                    print(f"❌ Ошибка рассылки платежей: {e}")
+        finally:
+            if self._retry_timer is not None:
+                self._retry_timer.cancel()
+            if _active_dispatcher is self:
+                _active_dispatcher = None
+
+    def wake(self) -> bool:
+        """Разбудить диспетчер из любого потока; False, если он не запущен"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return False
+        loop.call_soon_threadsafe(self._event.set)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'running': _active_dispatcher is self,
+            'dispatched': self.dispatched,
+            'failed': self.failed,
+            'retried': self.retried,
+        }
+
+    def _schedule_retry(self, delay: Optional[float]):
+        """Разбудить цикл к ближайшему отложенному повтору"""
+        if self._retry_timer is not None:
+            self._retry_timer.cancel()
+            self._retry_timer = None
+        if delay is not None:
+            self._retry_timer = self._loop.call_later(delay, self._event.set)
+
+    async def _drain(self):
+        while True:
+            payments = await self.adb.claim_pending_payments(self.batch_size)
+            for payment in payments:
+                await self._dispatch(payment)
+            if len(payments) < self.batch_size:
+                return
+
+    async def _dispatch(self, payment: dict):
+        try:
+            sent = await self.send(**notification_args(payment))
+            if not sent:
+                raise RuntimeError("уведомление не доставлено ни одному получателю")
+            self.dispatched += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Ошибка отправки платежа #{payment['transaction_id']} воркерам: {e}")
+            delay = await self.adb.retry_payment_dispatch(payment['transaction_id'], str(e),
+                                                          self.max_attempts, self.retry_delay)
+            if delay is None:
+                print(f"❌ Платеж #{payment['transaction_id']} не разослан, статус dispatch_failed")
+            else:
+                self.retried += 1
+                print(f"🔁 Повтор рассылки платежа #{payment['transaction_id']} через {delay:.0f} с")
+
+
+def notification_args(payment: dict) -> dict:
+    """Аргументы send_payment_to_workers для записи payment_queue"""
+    user_info = json.loads(payment['user_info'] or '{}')
+    return {
+        'transaction_id': payment['transaction_id'],
+        'qr_code_data': payment['qr_code_data'],
+        'qr_image_hash': payment['qr_image_hash'],
+        'user_info': payment['user_info'],
+        'amount_rub': payment['amount_rub'] or 0,
+        'worker_earnings_sol': user_info.get('worker_earnings_sol'),
+        'real_transaction': user_info.get('real_transaction', False),
+        'frozen_amount_sol': user_info.get('frozen_amount_sol'),
+    }
+
+
+def get_active_dispatcher() -> Optional[PaymentDispatcher]:
+    """Диспетчер, запущенный в этом процессе, или None"""
+    return _active_dispatcher
+
+
+def notify_payment_queued() -> bool:
+    """Сообщить диспетчеру о новой записи в payment_queue; False, если рассылать некому"""
+    dispatcher = _active_dispatcher
+    return dispatcher is not None and dispatcher.wake()
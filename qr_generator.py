@@ -3,10 +3,10 @@
 """
 
 import qrcode
-import base64
 import io
 import re
 from typing import Dict, Optional
+from qr_store import qr_store
 
 class QRCodeManager:
     
@@ -35,14 +35,13 @@ class QRCodeManager:
             
             buffer = io.BytesIO()
             img.save(buffer, format='PNG')
-            buffer.seek(0)
             
-            qr_image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            qr_image_hash = qr_store.put(buffer.getvalue())
             
             return {
                 'success': True,
                 'qr_data': qr_data,
-                'qr_image': qr_image_base64,
+                'qr_image_hash': qr_image_hash,
                 'amount_rub': amount_rub,
                 'description': description
             }
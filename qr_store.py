@@ -0,0 +1,123 @@
+"""
+Хранилище PNG QR-кодов на диске: файл называется по SHA-256 содержимого,
+в БД хранится только хеш
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import cfg
+from typing import Optional
+
+QR_STORE_DIR = getattr(cfg, 'QR_STORE_DIR', 'qr_images')
+QR_FILE_ID_CACHE_SIZE = getattr(cfg, 'QR_FILE_ID_CACHE_SIZE', 10000)
+QR_STORE_SWEEP_INTERVAL = getattr(cfg, 'QR_STORE_SWEEP_INTERVAL', 24 * 3600)
+QR_STORE_MIN_AGE = getattr(cfg, 'QR_STORE_MIN_AGE', 3600)
+
+
+class QRImageStore:
+    """Контентно-адресуемое хранилище: одинаковые QR-коды лежат на диске один раз"""
+
+    def __init__(self, root: str = QR_STORE_DIR, file_id_cache_size: int = QR_FILE_ID_CACHE_SIZE):
+        self.root = root
+        self.file_id_cache_size = file_id_cache_size
+        self._file_ids = {}
+        self._lock = threading.Lock()
+
+    def path(self, image_hash: str) -> str:
+        """Путь к файлу: <root>/<первые 2 символа>/<хеш>.png"""
+        if len(image_hash) != 64 or not all(c in '0123456789abcdef' for c in image_hash):
+            raise ValueError("Неверный хеш QR-кода")
+        return os.path.join(self.root, image_hash[:2], f'{image_hash}.png')
+
+    def put(self, data: bytes) -> str:
+        """Сохранить PNG и вернуть его хеш; повторная запись того же содержимого не нужна"""
+        image_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(image_hash)
+        if os.path.exists(path):
+            return image_hash
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и переименовываем: читатели не увидят недописанный PNG
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return image_hash
+
+    def sweep(self, referenced: set, min_age: float) -> int:
+        """Удалить PNG, на которые не ссылается ни одна запись, и брошенные .tmp; вернуть число файлов.
+
+        Файлы моложе min_age секунд не трогаются: PNG пишется до коммита строки payment_queue.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        cutoff = time.time() - min_age
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                image_hash, ext = os.path.splitext(name)
+                if ext == '.png' and image_hash in referenced:
+                    continue
+                if ext not in ('.png', '.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    continue
+                with self._lock:
+                    self._file_ids.pop(image_hash, None)
+        return removed
+
+    def exists(self, image_hash: str) -> bool:
+        return bool(image_hash) and os.path.exists(self.path(image_hash))
+
+    def read(self, image_hash: str) -> bytes:
+        with open(self.path(image_hash), 'rb') as f:
+            return f.read()
+
+    def get_file_id(self, image_hash: str) -> Optional[str]:
+        """file_id Telegram для уже отправленного изображения"""
+        with self._lock:
+            return self._file_ids.get(image_hash)
+
+    def remember_file_id(self, image_hash: str, file_id: str):
+        with self._lock:
+            if len(self._file_ids) >= self.file_id_cache_size:
+                self._file_ids.pop(next(iter(self._file_ids)))
+            self._file_ids[image_hash] = file_id
+
+    async def send_photo(self, bot, chat_id: int, image_hash: str, **kwargs):
+        """Отправить QR-код в Telegram: файл загружается один раз, дальше - по file_id"""
+        from aiogram.types import FSInputFile
+
+        file_id = self.get_file_id(image_hash)
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except Exception as e:
+                print(f"⚠️ file_id QR-кода не принят, загружаем файл заново: {e}")
+
+        message = await bot.send_photo(
+            chat_id=chat_id,
+            photo=FSInputFile(self.path(image_hash), filename='qr_code.png'),
+            **kwargs
+        )
+        if message.photo:
+            self.remember_file_id(image_hash, message.photo[-1].file_id)
+        return message
+
+
+qr_store = QRImageStore()
@@ -10,8 +10,11 @@ import ssl
 import os
 import cfg
 from app import app
-from bot import run_bot, send_payment_to_workers
+from bot import run_bot
 from database import Database
+from sweeper import TTLSweeper
+from snapshot import SnapshotRefresher
+from blockhash import blockhash_provider
 
 def check_ssl_files():
     """Проверяет наличие SSL файлов"""
@@ -36,63 +39,6 @@ def run_web_app():
         print("⚠️ Запуск без HTTPS")
         app.run(host=cfg.WEB_HOST, port=cfg.WEB_PORT, debug=cfg.DEBUG, use_reloader=False)
 
-async def check_pending_payments():
-    """Периодически проверять новые платежи и отправлять их воркерам"""
-    from bot import bot_loop
-    import asyncio
-    
-    db = Database()
-    processed_ids = set()
-    
-    await asyncio.sleep(5)
-    
-    while True:
-        try:
-            if not bot_loop or not bot_loop.is_running():
-                await asyncio.sleep(5)
-                continue
-            
-            pending_payments = db.get_pending_payments()
-            
-            for payment in pending_payments:
-                payment_id = payment['id']
-                transaction_id = payment['transaction_id']
-                
-                if payment_id not in processed_ids:
-                    transaction = db.get_transaction(transaction_id)
-                    
-                    if transaction and transaction['status'] == 'pending':
-                        try:
-                            future = asyncio.run_coroutine_threadsafe(
-                                send_payment_to_workers(
-                                    transaction_id=transaction_id,
-                                    qr_code_data=payment['qr_code_data'],
-                                    qr_code_image=payment['qr_code_image'],
-                                    user_info=payment['user_info'],
-                                    amount_rub=payment['amount_rub'] or 0
-                                ),
-                                bot_loop
-                            )
-                            processed_ids.add(payment_id)
-                        except Exception as e:
-                            print(f"[PAYMENT_CHECKER] Ошибка отправки платежа {transaction_id}: {e}")
-            
-            if len(processed_ids) > 1000:
-                processed_ids.clear()
-                
-        except Exception as e:
-            print(f"[PAYMENT_CHECKER] Ошибка проверки платежей: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        await asyncio.sleep(5)
-
-def run_payment_checker():
-    """Запустить проверку платежей в отдельном event loop"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(check_pending_payments())
-
 def run_telegram_bot():
     """Запустить Telegram бота"""
     loop = asyncio.new_event_loop()
@@ -129,8 +75,13 @@ if __name__ == '__main__':
     
     print("=" * 50)
     
-    payment_thread = threading.Thread(target=run_payment_checker, daemon=True)
-    payment_thread.start()
+    sweeper = TTLSweeper(db_check)
+    sweeper.start()
+    
+    snapshot_refresher = SnapshotRefresher(db_check)
+    snapshot_refresher.start()
+    
+    blockhash_provider.start()
     
     bot_thread = threading.Thread(target=run_telegram_bot, daemon=True)
     bot_thread.start()
@@ -1,10 +1,19 @@
+import atexit
 import logging
 import os
+import queue
+import sqlite3
+import threading
+import time
 import cfg
 from datetime import datetime
 from flask import request, session
 from database import Database
 
+SECURITY_LOG_QUEUE_SIZE = getattr(cfg, 'SECURITY_LOG_QUEUE_SIZE', 10000)
+SECURITY_LOG_BATCH_SIZE = getattr(cfg, 'SECURITY_LOG_BATCH_SIZE', 200)
+SECURITY_LOG_FLUSH_INTERVAL = getattr(cfg, 'SECURITY_LOG_FLUSH_INTERVAL', 1.0)
+
 def setup_security_logging():
     """Настройка логирования безопасности"""
     if not os.path.exists('logs'):
@@ -30,6 +39,163 @@ def setup_security_logging():
 
 security_logger = setup_security_logging()
 
+
+class SecurityLogWriter:
+    """Фоновая запись security_logs пачками из ограниченной очереди"""
+
+    _STOP = object()
+
+    def __init__(self, max_queue_size: int = SECURITY_LOG_QUEUE_SIZE,
+                 batch_size: int = SECURITY_LOG_BATCH_SIZE,
+                 flush_interval: float = SECURITY_LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self._dropped_unreported = 0
+
+    def start(self):
+        """Запустить поток записи (или перезапустить, если он завершился)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._thread is not None:
+                print("⚠️ Поток записи security_logs завершился, перезапускаем")
+            else:
+                atexit.register(self.stop)
+            self._thread = threading.Thread(target=self._run, name='security-log-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, event_type, description, severity='info', user_id=None,
+                ip_address=None, user_agent=None) -> bool:
+        """Поставить событие в очередь; при переполнении событие отбрасывается"""
+        self.start()
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        row = (event_type, description, severity, user_id, ip_address, user_agent, created_at)
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._dropped_unreported += 1
+                dropped = self.dropped
+            if dropped == 1 or dropped % 1000 == 0:
+                print(f"⚠️ Очередь security_logs переполнена, отброшено событий: {dropped}")
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Синхронно записать все накопленные события"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Записать остаток очереди и остановить поток"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ Не удалось остановить запись security_logs: очередь переполнена")
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+        }
+
+    def _run(self):
+        batch = []
+        waiters = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            stop = item is self._STOP
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None and not stop:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            timed_out = deadline is not None and time.monotonic() >= deadline
+            if stop or waiters or timed_out or len(batch) >= self.batch_size:
+                if batch:
+                    try:
+                        self._write(batch)
+                    except Exception as e:
+                        # Поток не должен завершаться: иначе все следующие события копятся и теряются
+                        print(f"❌ Ошибка записи security_logs ({len(batch)} событий): {e}")
+                batch = []
+                deadline = None
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+
+            if stop:
+                return
+
+    def _write(self, batch):
+        with self._lock:
+            dropped, self._dropped_unreported = self._dropped_unreported, 0
+        if dropped:
+            batch.append(('security_log_overflow',
+                          f'Очередь security_logs переполнена, отброшено событий: {dropped}',
+                          'warning', None, None, None,
+                          datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
+
+        insert_sql = '''
+            INSERT INTO security_logs 
+            (event_type, event_description, severity, user_id, ip_address, user_agent, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        try:
+            conn = Database().get_connection()
+        except Exception as e:
+            print(f"Error logging security event: {e}")
+            return
+
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(insert_sql, batch)
+                conn.commit()
+                self.written += len(batch)
+            except sqlite3.Error:
+                conn.rollback()
+                # Одна некорректная запись не должна терять всю пачку
+                for row in batch:
+                    try:
+                        cursor.execute(insert_sql, row)
+                        self.written += 1
+                    except sqlite3.Error as e:
+                        print(f"Error logging security event: {e}")
+                conn.commit()
+        finally:
+            conn.close()
+
+
+security_log_writer = SecurityLogWriter()
+
 class SecurityLogger:
     @staticmethod
     def get_client_ip():
@@ -47,18 +213,7 @@ class SecurityLogger:
     
     @staticmethod
     def log_security_event(severity, event_type, description, user_id=None, ip_address=None, user_agent=None):
-        try:
-            conn = Database().get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO security_logs 
-                (event_type, event_description, severity, user_id, ip_address, user_agent, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (event_type, description, severity, user_id, ip_address, user_agent))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Error logging security event: {e}")
+        security_log_writer.enqueue(event_type, description, severity, user_id, ip_address, user_agent)
     
     @staticmethod
     def log_login_success():
@@ -103,18 +258,7 @@ class SecurityLogger:
     
     @staticmethod
     def log_withdrawal_event(withdrawal_id, status, amount_sol):
-        try:
-            conn = Database().get_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO security_logs 
-                (event_type, event_description, severity, created_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            ''', ('withdrawal', f'Withdrawal {withdrawal_id} {status}: {amount_sol} SOL', 'info'))
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Error logging withdrawal event: {e}")
+        security_log_writer.enqueue('withdrawal', f'Withdrawal {withdrawal_id} {status}: {amount_sol} SOL', 'info')
     
     @staticmethod
     def log_admin_action(action, target_user=None, details=None):
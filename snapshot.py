@@ -0,0 +1,132 @@
+"""
+Снимок базы только для чтения для админских отчетов: копия отчетных таблиц
+основной БД, снятая через online backup API SQLite и периодически обновляемая
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import cfg
+
+ANALYTICS_SNAPSHOT_INTERVAL = getattr(cfg, 'ANALYTICS_SNAPSHOT_INTERVAL', 60)
+ANALYTICS_SNAPSHOT_MAX_AGE = getattr(cfg, 'ANALYTICS_SNAPSHOT_MAX_AGE', 3 * ANALYTICS_SNAPSHOT_INTERVAL)
+
+# Таблицы, которые читают агрегатные отчеты через Database._reporting_connection;
+# остальное (кошельки с ключами, транзакции, коды входа, рабочие очереди вроде
+# заявок на вывод) в снимок не попадает
+SNAPSHOT_TABLES = ('system_stats', 'worker_stats', 'users')
+
+
+def snapshot_path_for(db_path: str):
+    """Путь к снимку: ANALYTICS_SNAPSHOT_PATH для основной БД ('' - снимок выключен), иначе файл рядом"""
+    configured = getattr(cfg, 'ANALYTICS_SNAPSHOT_PATH', None)
+    if configured is not None and db_path == cfg.DATABASE_PATH:
+        return configured or None
+    return f'{os.path.splitext(db_path)[0]}_snapshot.db'
+
+
+class AnalyticsSnapshot:
+    """Файл снимка: обновляется целиком и подменяется атомарно через os.replace.
+
+    Читатели открывают его с immutable=1: SQLite не берет блокировок и не
+    смотрит в WAL, а подмена файла не трогает уже открытые соединения.
+    В снимке остаются только SNAPSHOT_TABLES, файл доступен лишь владельцу (0600).
+    """
+
+    def __init__(self, db_path: str, path: str, max_age: float = ANALYTICS_SNAPSHOT_MAX_AGE):
+        self.db_path = db_path
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def refresh(self) -> dict:
+        """Снять свежую копию основной БД и подменить ею снимок"""
+        start = time.perf_counter()
+        tmp_path = f'{self.path}.tmp'
+        with self._lock:
+            # Файл создается заранее с правами 0600: sqlite3 создал бы его по umask
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            source = sqlite3.connect(self.db_path, timeout=30)
+            target = sqlite3.connect(tmp_path)
+            try:
+                # Одним шагом: в режиме WAL это одна читающая транзакция, писатели не ждут
+                source.backup(target)
+                target.execute('PRAGMA journal_mode=DELETE')
+                self._keep_report_tables(target)
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp_path, self.path)
+        return {'path': self.path, 'seconds': round(time.perf_counter() - start, 3),
+                'bytes': os.path.getsize(self.path)}
+
+    @staticmethod
+    def _keep_report_tables(conn):
+        """Удалить из копии все, кроме SNAPSHOT_TABLES; VACUUM стирает их страницы из файла"""
+        rows = conn.execute('''
+            SELECT type, name FROM sqlite_master
+            WHERE type IN ('view', 'table') AND name NOT LIKE 'sqlite_%'
+            ORDER BY type = 'table'
+        ''').fetchall()
+        for kind, name in rows:
+            if kind == 'view' or name not in SNAPSHOT_TABLES:
+                conn.execute(f'DROP {kind.upper()} "{name}"')
+        conn.commit()
+        conn.execute('VACUUM')
+
+    def age(self):
+        """Возраст снимка в секундах или None, если снимка нет"""
+        try:
+            return max(0.0, time.time() - os.path.getmtime(self.path))
+        except OSError:
+            return None
+
+    def connect(self):
+        """Соединение только для чтения или None, если снимок отсутствует или устарел"""
+        age = self.age()
+        if age is None or age > self.max_age:
+            return None
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+class SnapshotRefresher:
+    """Поток, обновляющий снимок каждые interval секунд"""
+
+    def __init__(self, db, interval: float = ANALYTICS_SNAPSHOT_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.refreshes = 0
+        self.last_refresh = {}
+
+    def start(self):
+        """Запустить поток обновления (один раз на процесс)"""
+        with self._lock:
+            if self._thread is not None or self.interval <= 0 or self.db.pool.snapshot is None:
+                return
+            self._thread = threading.Thread(target=self._run, name='analytics-snapshot', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток обновления"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.last_refresh = self.db.refresh_analytics_snapshot()
+                self.refreshes += 1
+            except Exception as e:
+                print(f"❌ Ошибка обновления снимка для отчетов: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,206 @@
+"""
+Общие RPC-клиенты Solana: один долгоживущий клиент (с пулом keep-alive HTTP-соединений)
+на endpoint для всего процесса и статистика запросов по каждому endpoint
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+import cfg
+from solana.rpc.api import Client
+from solana.rpc.async_api import AsyncClient
+
+SOLANA_RPC_TIMEOUT = getattr(cfg, 'SOLANA_RPC_TIMEOUT', 10)
+
+
+def current_endpoint() -> str:
+    """RPC текущей сети (cfg перечитывается при /switch_network)"""
+    return cfg.SOLANA_MAINNET_RPC if cfg.IS_MAINNET else cfg.SOLANA_RPC_URL
+
+
+class EndpointStats:
+    """Счетчики одного endpoint: сессии, запросы, ошибки и задержки"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions = 0
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error = None
+
+    def record(self, seconds: float, error: Exception = None):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            if error is not None:
+                self.errors += 1
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': self.sessions,
+                'requests': self.requests,
+                'errors': self.errors,
+                'avg_ms': round(self.total_seconds / self.requests * 1000, 1) if self.requests else 0.0,
+                'max_ms': round(self.max_seconds * 1000, 1),
+                'last_error': self.last_error,
+            }
+
+
+class MeteredClient:
+    """Клиент solana-py, у которого каждый вызов метода попадает в EndpointStats"""
+
+    def __init__(self, client, endpoint: str, stats: EndpointStats):
+        self._client = client
+        self.endpoint = endpoint
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                self._stats.record(time.perf_counter() - start, e)
+                raise
+            self._stats.record(time.perf_counter() - start)
+            return result
+
+        return call
+
+
+class MeteredAsyncClient(MeteredClient):
+    """То же для AsyncClient: замеряется ожидание корутины"""
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await attr(*args, **kwargs)
+            except Exception as e:
+                self._stats.record(time.perf_counter() - start, e)
+                raise
+            self._stats.record(time.perf_counter() - start)
+            return result
+
+        return call
+
+
+class RPCClientManager:
+    """Клиенты по endpoint на весь процесс.
+
+    Клиент solana-py держит свою HTTP-сессию, поэтому повторное использование
+    клиента убирает TCP/TLS-рукопожатие из каждого запроса. Асинхронные клиенты
+    привязаны к своему циклу событий и хранятся отдельно для каждого цикла.
+    reset() нужен после смены сети: старые клиенты больше не выдаются, их
+    HTTP-сессии закрываются (асинхронные - в своем цикле событий).
+    """
+
+    def __init__(self, timeout: float = SOLANA_RPC_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stats = {}
+        self.resets = 0
+
+    def _endpoint_stats(self, endpoint: str) -> EndpointStats:
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats[endpoint] = EndpointStats()
+        return stats
+
+    def client(self, endpoint: str = None) -> MeteredClient:
+        """Клиент для endpoint (по умолчанию - RPC текущей сети)"""
+        endpoint = endpoint or current_endpoint()
+        client = self._clients.get(endpoint)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(endpoint)
+            if client is None:
+                stats = self._endpoint_stats(endpoint)
+                client = MeteredClient(Client(endpoint, timeout=self.timeout), endpoint, stats)
+                stats.sessions += 1
+                self._clients[endpoint] = client
+            return client
+
+    def async_client(self, endpoint: str = None) -> MeteredAsyncClient:
+        """Асинхронный клиент для endpoint в текущем цикле событий"""
+        endpoint = endpoint or current_endpoint()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(endpoint)
+            if client is None:
+                stats = self._endpoint_stats(endpoint)
+                client = MeteredAsyncClient(AsyncClient(endpoint, timeout=self.timeout), endpoint, stats)
+                stats.sessions += 1
+                clients[endpoint] = client
+            return client
+
+    async def close_async_clients(self):
+        """Закрыть асинхронные клиенты текущего цикла (при остановке бота)"""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await self._close_async_client(client)
+
+    def reset(self):
+        """Забыть и закрыть созданные клиенты: следующий запрос откроет новую сессию к актуальному RPC.
+
+        Запросы, которые еще идут через старый клиент, могут завершиться ошибкой.
+        """
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            async_clients, self._async_clients = self._async_clients, weakref.WeakKeyDictionary()
+            self.resets += 1
+
+        for client in clients.values():
+            try:
+                client._client._provider.session.close()
+            except Exception as e:
+                print(f"Ошибка закрытия RPC клиента {client.endpoint}: {e}")
+
+        for loop, loop_clients in list(async_clients.items()):
+            if loop.is_closed() or not loop.is_running():
+                continue
+            for client in loop_clients.values():
+                # AsyncClient закрывается только в своем цикле событий; reset() может
+                # вызываться из другого потока, поэтому закрытие ставится в этот цикл
+                asyncio.run_coroutine_threadsafe(self._close_async_client(client), loop)
+
+    @staticmethod
+    async def _close_async_client(client: MeteredAsyncClient):
+        try:
+            await client._client.close()
+        except Exception as e:
+            print(f"Ошибка закрытия RPC клиента {client.endpoint}: {e}")
+
+    def stats(self) -> dict:
+        """Статистика по endpoint; active - есть ли сейчас открытый клиент"""
+        with self._lock:
+            endpoints = dict(self._stats)
+            active = set(self._clients)
+            for clients in self._async_clients.values():
+                active.update(clients)
+        return {
+            endpoint: dict(stats.as_dict(), active=endpoint in active)
+            for endpoint, stats in endpoints.items()
+        }
+
+
+rpc_clients = RPCClientManager()
@@ -1,29 +1,32 @@
+import asyncio
 import base58
 import base64
 import cfg
 import time
+from concurrent.futures import ThreadPoolExecutor
 from solders.keypair import Keypair
 from solders.pubkey import Pubkey
 from solders.system_program import TransferParams, transfer
 from solders.transaction import Transaction
 from solders.message import Message
-from solana.rpc.api import Client
 from solana.rpc.commitment import Confirmed
+from solana_rpc import rpc_clients
+from balance_cache import balance_cache
+from blockhash import blockhash_provider
 
 class UniversalSolanaWallet:
     LAMPORTS_PER_SOL = 1_000_000_000
+    # Лимит RPC на число адресов в одном getMultipleAccounts
+    MAX_ACCOUNTS_PER_CALL = 100
     
     @staticmethod
     def get_client():
-        """Получить клиент для текущей сети"""
+        """Получить общий клиент для текущей сети (пул соединений из solana_rpc)"""
         try:
-            if cfg.IS_MAINNET:
-                return Client(cfg.SOLANA_MAINNET_RPC)
-            else:
-                return Client(cfg.SOLANA_RPC_URL)
+            return rpc_clients.client()
         except Exception as e:
             print(f"Ошибка создания клиента: {e}")
-            return Client("https://api.mainnet-beta.solana.com")
+            return rpc_clients.client("https://api.mainnet-beta.solana.com")
     
     @staticmethod
     def generate_wallet():
@@ -47,24 +50,71 @@ class UniversalSolanaWallet:
     
     @staticmethod
     def get_balance(wallet_address: str):
-        """Получить баланс кошелька в текущей сети"""
+        """Получить баланс кошелька в текущей сети (через balance_cache)"""
+        def fetch():
+            response = UniversalSolanaWallet.get_client().get_balance(Pubkey.from_string(wallet_address))
+            return UniversalSolanaWallet._lamports_to_sol(response.value)
+        
         try:
-            client = UniversalSolanaWallet.get_client()
-            response = client.get_balance(Pubkey.from_string(wallet_address))
-            
-            if response.value is not None:
-                return response.value / UniversalSolanaWallet.LAMPORTS_PER_SOL
-            else:
-                return 0.0
+            return balance_cache.get(wallet_address, fetch)
         except Exception as e:
             print(f"Ошибка получения баланса: {e}")
             return 0.0
+    
+    @staticmethod
+    def _lamports_to_sol(lamports):
+        return lamports / UniversalSolanaWallet.LAMPORTS_PER_SOL if lamports is not None else 0.0
 
     @staticmethod
     def get_real_balance(wallet_address: str):
         """Алиас для get_balance для совместимости"""
         return UniversalSolanaWallet.get_balance(wallet_address)
     
+    @staticmethod
+    def _balance_chunks(addresses):
+        """Пачки Pubkey по MAX_ACCOUNTS_PER_CALL для адресов не из кеша и словарь балансов"""
+        balances = {address: 0.0 for address in addresses}
+        cached, missing = balance_cache.peek_many(list(balances))
+        balances.update(cached)
+        pubkeys = []
+        for address in missing:
+            try:
+                pubkeys.append(Pubkey.from_string(address))
+            except Exception:
+                print(f"Неверный адрес кошелька: {address}")
+        size = UniversalSolanaWallet.MAX_ACCOUNTS_PER_CALL
+        return [pubkeys[i:i + size] for i in range(0, len(pubkeys), size)], balances
+    
+    @staticmethod
+    def _chunk_balances(chunk, response) -> dict:
+        """Балансы пачки из ответа getMultipleAccounts (нет аккаунта - 0)"""
+        return {
+            str(pubkey): (account.lamports / UniversalSolanaWallet.LAMPORTS_PER_SOL if account is not None else 0.0)
+            for pubkey, account in zip(chunk, response.value)
+        }
+    
+    @staticmethod
+    def get_balances(addresses) -> dict:
+        """Балансы многих кошельков: getMultipleAccounts пачками, пачки запрашиваются параллельно"""
+        chunks, balances = UniversalSolanaWallet._balance_chunks(addresses)
+        if not chunks:
+            return balances
+        
+        client = UniversalSolanaWallet.get_client()
+        
+        def fetch(chunk):
+            try:
+                return UniversalSolanaWallet._chunk_balances(chunk, client.get_multiple_accounts(chunk))
+            except Exception as e:
+                print(f"Ошибка получения балансов ({len(chunk)} адресов): {e}")
+                return {}
+        
+        with ThreadPoolExecutor(max_workers=min(len(chunks), 8)) as executor:
+            for chunk_balances in executor.map(fetch, chunks):
+                balance_cache.put_many(chunk_balances)
+                balances.update(chunk_balances)
+        return balances
+    
     @staticmethod
     def validate_private_key(private_key: str) -> bool:
         """Проверить валидность приватного ключа"""
@@ -92,97 +142,6 @@ class UniversalSolanaWallet:
             print(f"Ошибка преобразования приватного ключа: {e}")
             raise ValueError(f"Неверный формат приватного ключа: {str(e)}")
     
-    @staticmethod
-    def send_sol_simple(from_private_key: str, to_address: str, amount_sol: float):
-        """
-        Отправка SOL - проверка минимальной суммы
-        """
-        try:
-            MIN_PRACTICAL_SOL = 0.0011
-            
-            if amount_sol < MIN_PRACTICAL_SOL:
-                print(f"⚠️ Сумма {amount_sol:.6f} SOL слишком мала для отправки. Минимум: {MIN_PRACTICAL_SOL} SOL")
-                return {
-                    'success': True,
-                    'tx_hash': None,
-                    'amount_sol': 0,
-                    'message': f'Сумма {amount_sol:.6f} SOL накоплена для будущей отправки'
-                }
-            
-            client = UniversalSolanaWallet.get_client()
-            from_keypair = UniversalSolanaWallet.get_keypair_from_private_key(from_private_key)
-            
-            try:
-                to_pubkey = Pubkey.from_string(to_address)
-            except:
-                return {
-                    'success': False,
-                    'error': f'Неверный адрес получателя: {to_address}'
-                }
-            
-            lamports = int(amount_sol * UniversalSolanaWallet.LAMPORTS_PER_SOL)
-            
-            if lamports <= 0:
-                return {
-                    'success': False,
-                    'error': 'Сумма должна быть больше 0'
-                }
-            
-            print(f"🔄 Отправка {amount_sol:.6f} SOL ({lamports} lamports) с {from_keypair.pubkey()} на {to_address}")
-            
-            recent_blockhash = client.get_latest_blockhash().value.blockhash
-            
-            transfer_ix = transfer(
-                TransferParams(
-                    from_pubkey=from_keypair.pubkey(),
-                    to_pubkey=to_pubkey,
-                    lamports=lamports
-                )
-            )
-            
-            message = Message.new_with_blockhash(
-                [transfer_ix],
-                from_keypair.pubkey(),
-                recent_blockhash
-            )
-            
-            txn = Transaction([from_keypair], message, recent_blockhash)
-            
-            try:
-                result = client.send_transaction(txn)
-            except Exception as e:
-                print(f"Ошибка отправки: {e}")
-                return {
-                    'success': False,
-                    'error': f'Ошибка отправки транзакции: {str(e)}'
-                }
-            
-            if result.value:
-                tx_hash = str(result.value)
-                print(f"✅ Транзакция отправлена: {tx_hash}")
-                
-                return {
-                    'success': True,
-                    'tx_hash': tx_hash,
-                    'amount_sol': amount_sol,
-                    'network': cfg.SOLANA_NETWORK,
-                    'message': f'Успешно отправлено {amount_sol:.6f} SOL'
-                }
-            else:
-                error_msg = getattr(result, 'error', 'Неизвестная ошибка')
-                print(f"❌ Ошибка отправки транзакции: {error_msg}")
-                return {
-                    'success': False,
-                    'error': f'Не удалось отправить транзакцию: {error_msg}'
-                }
-                
-        except Exception as e:
-            print(f"❌ Критическая ошибка отправки SOL: {e}")
-            return {
-                'success': False,
-                'error': f'Ошибка отправки: {str(e)}'
-            }
-    
     @staticmethod
     def validate_wallet_address(address: str) -> bool:
         """Валидация адреса кошелька Solana"""
@@ -200,6 +159,71 @@ class UniversalSolanaWallet:
         except Exception:
             return False
 
+    @staticmethod
+    def _prepare_transfer(from_private_key: str, to_address: str, amount_sol: float):
+        """Ключ отправителя, адрес получателя и сумма в лампортах или словарь с ошибкой"""
+        from_keypair = UniversalSolanaWallet.get_keypair_from_private_key(from_private_key)
+        
+        try:
+            to_pubkey = Pubkey.from_string(to_address)
+        except:
+            return None, {
+                'success': False,
+                'error': f'Неверный адрес получателя: {to_address}'
+            }
+        
+        if amount_sol <= 0:
+            return None, {
+                'success': False,
+                'error': 'Сумма должна быть больше 0'
+            }
+        
+        lamports = int(amount_sol * UniversalSolanaWallet.LAMPORTS_PER_SOL)
+        return (from_keypair, to_pubkey, lamports), None
+    
+    @staticmethod
+    def _build_transfer(from_keypair, to_pubkey, lamports: int, recent_blockhash):
+        """Подписанная транзакция перевода"""
+        transfer_ix = transfer(
+            TransferParams(
+                from_pubkey=from_keypair.pubkey(),
+                to_pubkey=to_pubkey,
+                lamports=lamports
+            )
+        )
+        
+        message = Message.new_with_blockhash(
+            [transfer_ix],
+            from_keypair.pubkey(),
+            recent_blockhash
+        )
+        
+        return Transaction([from_keypair], message, recent_blockhash)
+    
+    @staticmethod
+    def _send_result(result, from_keypair, to_address: str, amount_sol: float, recent):
+        """Словарь результата send_sol по ответу send_transaction"""
+        if result.value:
+            tx_hash = str(result.value)
+            print(f"✅ Транзакция отправлена: {tx_hash}")
+            
+            return {
+                'success': True,
+                'tx_hash': tx_hash,
+                'amount_sol': amount_sol,
+                'from_address': str(from_keypair.pubkey()),
+                'to_address': to_address,
+                'network': cfg.SOLANA_NETWORK,
+                'last_valid_block_height': recent.last_valid_block_height
+            }
+        else:
+            error_msg = getattr(result, 'error', 'Неизвестная ошибка')
+            print(f"❌ Ошибка отправки транзакции: {error_msg}")
+            return {
+                'success': False,
+                'error': f'Не удалось отправить транзакцию: {error_msg}'
+            }
+
     @staticmethod
     def send_sol(from_private_key: str, to_address: str, amount_sol: float):
         """
@@ -208,72 +232,30 @@ class UniversalSolanaWallet:
         try:
             client = UniversalSolanaWallet.get_client()
             
-            from_keypair = UniversalSolanaWallet.get_keypair_from_private_key(from_private_key)
-            
-            try:
-                to_pubkey = Pubkey.from_string(to_address)
-            except:
-                return {
-                    'success': False,
-                    'error': f'Неверный адрес получателя: {to_address}'
-                }
-            
-            if amount_sol <= 0:
-                return {
-                    'success': False,
-                    'error': 'Сумма должна быть больше 0'
-                }
-            
-            lamports = int(amount_sol * UniversalSolanaWallet.LAMPORTS_PER_SOL)
+            transfer_args, error = UniversalSolanaWallet._prepare_transfer(from_private_key, to_address, amount_sol)
+            if error:
+                return error
+            from_keypair, to_pubkey, lamports = transfer_args
             
             print(f"🔄 Отправка {amount_sol:.6f} SOL ({lamports} lamports) с {from_keypair.pubkey()} на {to_address}")
             
-            recent_blockhash = client.get_latest_blockhash().value.blockhash
-            
-            transfer_ix = transfer(
-                TransferParams(
-                    from_pubkey=from_keypair.pubkey(),
-                    to_pubkey=to_pubkey,
-                    lamports=lamports
-                )
-            )
-            
-            message = Message.new_with_blockhash(
-                [transfer_ix],
-                from_keypair.pubkey(),
-                recent_blockhash
-            )
-            
-            txn = Transaction([from_keypair], message, recent_blockhash)
+            recent = blockhash_provider.for_transfer((str(from_keypair.pubkey()), to_address, lamports))
+            txn = UniversalSolanaWallet._build_transfer(from_keypair, to_pubkey, lamports, recent.blockhash)
             
             try:
                 result = client.send_transaction(txn)
             except Exception as e:
                 print(f"Ошибка отправки транзакции: {e}")
+                blockhash_provider.invalidate()
                 return {
                     'success': False,
                     'error': f'Ошибка отправки транзакции: {str(e)}'
                 }
+            finally:
+                # Перевод мог пройти даже при ошибке: балансы обеих сторон перечитываются
+                balance_cache.invalidate(str(from_keypair.pubkey()), to_address)
             
-            if result.value:
-                tx_hash = str(result.value)
-                print(f"✅ Транзакция отправлена: {tx_hash}")
-                
-                return {
-                    'success': True,
-                    'tx_hash': tx_hash,
-                    'amount_sol': amount_sol,
-                    'from_address': str(from_keypair.pubkey()),
-                    'to_address': to_address,
-                    'network': cfg.SOLANA_NETWORK
-                }
-            else:
-                error_msg = getattr(result, 'error', 'Неизвестная ошибка')
-                print(f"❌ Ошибка отправки транзакции: {error_msg}")
-                return {
-                    'success': False,
-                    'error': f'Не удалось отправить транзакцию: {error_msg}'
-                }
+            return UniversalSolanaWallet._send_result(result, from_keypair, to_address, amount_sol, recent)
                 
         except Exception as e:
             print(f"❌ Критическая ошибка отправки SOL: {e}")
@@ -299,6 +281,23 @@ class UniversalSolanaWallet:
                 'error': f'Ошибка отправки админу: {str(e)}'
             }
     
+    @staticmethod
+    def send_sol_to_worker(user_private_key: str, worker_wallet: str, amount_sol: float):
+        """Отправить SOL воркеру (его заработок)"""
+        try:
+            return UniversalSolanaWallet.send_sol_simple(
+                from_private_key=user_private_key,
+                to_address=worker_wallet,
+                amount_sol=amount_sol
+            )
+                
+        except Exception as e:
+            print(f"❌ Ошибка отправки SOL воркеру: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка отправки воркеру: {str(e)}'
+            }
+    
     @staticmethod
     def airdrop_devnet_sol(wallet_address: str, amount_sol: float = 2.0):
         """
@@ -311,7 +310,7 @@ class UniversalSolanaWallet:
             }
         
         try:
-            client = Client("https://api.devnet.solana.com")
+            client = rpc_clients.client("https://api.devnet.solana.com")
             
             lamports = int(amount_sol * UniversalSolanaWallet.LAMPORTS_PER_SOL)
             
@@ -324,6 +323,7 @@ class UniversalSolanaWallet:
             
             if hasattr(result, 'value') and result.value:
                 tx_hash = str(result.value)
+                balance_cache.invalidate(wallet_address)
                 print(f"⏳ Ожидание подтверждения airdrop: {tx_hash}")
                 
                 try:
@@ -383,4 +383,198 @@ class UniversalSolanaWallet:
     @staticmethod
     def send_sol_simple(from_private_key: str, to_address: str, amount_sol: float):
         """Алиас для send_sol для обратной совместимости"""
-        return UniversalSolanaWallet.send_sol(from_private_key, to_address, amount_sol)
\ No newline at end of file
+        return UniversalSolanaWallet.send_sol(from_private_key, to_address, amount_sol)
+
+
+class AsyncUniversalSolanaWallet(UniversalSolanaWallet):
+    """Асинхронный вариант UniversalSolanaWallet для обработчиков бота.
+
+    Методы, которые ходят в RPC, - корутины на AsyncClient и возвращают те же
+    словари, что и синхронные; проверки ключей и адресов наследуются как есть.
+    """
+    
+    @staticmethod
+    def get_client():
+        """Общий асинхронный клиент текущей сети для текущего цикла событий"""
+        return rpc_clients.async_client()
+    
+    @staticmethod
+    async def get_balance(wallet_address: str):
+        """Получить баланс кошелька в текущей сети (через balance_cache)"""
+        async def fetch():
+            response = await AsyncUniversalSolanaWallet.get_client().get_balance(Pubkey.from_string(wallet_address))
+            return UniversalSolanaWallet._lamports_to_sol(response.value)
+        
+        try:
+            return await balance_cache.get_async(wallet_address, fetch)
+        except Exception as e:
+            print(f"Ошибка получения баланса: {e}")
+            return 0.0
+    
+    @staticmethod
+    async def get_real_balance(wallet_address: str):
+        """Алиас для get_balance для совместимости"""
+        return await AsyncUniversalSolanaWallet.get_balance(wallet_address)
+    
+    @staticmethod
+    async def get_balances(addresses) -> dict:
+        """Балансы многих кошельков: getMultipleAccounts пачками, пачки запрашиваются одновременно"""
+        chunks, balances = UniversalSolanaWallet._balance_chunks(addresses)
+        if not chunks:
+            return balances
+        
+        client = AsyncUniversalSolanaWallet.get_client()
+        
+        async def fetch(chunk):
+            try:
+                return UniversalSolanaWallet._chunk_balances(chunk, await client.get_multiple_accounts(chunk))
+            except Exception as e:
+                print(f"Ошибка получения балансов ({len(chunk)} адресов): {e}")
+                return {}
+        
+        for chunk_balances in await asyncio.gather(*(fetch(chunk) for chunk in chunks)):
+            balance_cache.put_many(chunk_balances)
+            balances.update(chunk_balances)
+        return balances
+    
+    @staticmethod
+    async def send_sol(from_private_key: str, to_address: str, amount_sol: float):
+        """Отправка SOL - основной метод для выводов средств"""
+        try:
+            client = AsyncUniversalSolanaWallet.get_client()
+            
+            transfer_args, error = UniversalSolanaWallet._prepare_transfer(from_private_key, to_address, amount_sol)
+            if error:
+                return error
+            from_keypair, to_pubkey, lamports = transfer_args
+            
+            print(f"🔄 Отправка {amount_sol:.6f} SOL ({lamports} lamports) с {from_keypair.pubkey()} на {to_address}")
+            
+            recent = await blockhash_provider.for_transfer_async((str(from_keypair.pubkey()), to_address, lamports))
+            txn = UniversalSolanaWallet._build_transfer(from_keypair, to_pubkey, lamports, recent.blockhash)
+            
+            try:
+                result = await client.send_transaction(txn)
+            except Exception as e:
+                print(f"Ошибка отправки транзакции: {e}")
+                blockhash_provider.invalidate()
+                return {
+                    'success': False,
+                    'error': f'Ошибка отправки транзакции: {str(e)}'
+                }
+            finally:
+                # Перевод мог пройти даже при ошибке: балансы обеих сторон перечитываются
+                balance_cache.invalidate(str(from_keypair.pubkey()), to_address)
+            
+            return UniversalSolanaWallet._send_result(result, from_keypair, to_address, amount_sol, recent)
+                
+        except Exception as e:
+            print(f"❌ Критическая ошибка отправки SOL: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка отправки: {str(e)}'
+            }
+    
+    @staticmethod
+    async def send_sol_simple(from_private_key: str, to_address: str, amount_sol: float):
+        """Алиас для send_sol для обратной совместимости"""
+        return await AsyncUniversalSolanaWallet.send_sol(from_private_key, to_address, amount_sol)
+    
+    @staticmethod
+    async def send_sol_to_admin(user_private_key: str, admin_wallet: str, amount_sol: float):
+        """Отправить SOL админу (его комиссия 5%)"""
+        try:
+            return await AsyncUniversalSolanaWallet.send_sol_simple(
+                from_private_key=user_private_key,
+                to_address=admin_wallet,
+                amount_sol=amount_sol
+            )
+        except Exception as e:
+            print(f"❌ Ошибка отправки SOL админу: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка отправки админу: {str(e)}'
+            }
+    
+    @staticmethod
+    async def send_sol_to_worker(user_private_key: str, worker_wallet: str, amount_sol: float):
+        """Отправить SOL воркеру (его заработок)"""
+        try:
+            return await AsyncUniversalSolanaWallet.send_sol_simple(
+                from_private_key=user_private_key,
+                to_address=worker_wallet,
+                amount_sol=amount_sol
+            )
+        except Exception as e:
+            print(f"❌ Ошибка отправки SOL воркеру: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка отправки воркеру: {str(e)}'
+            }
+    
+    @staticmethod
+    async def airdrop_devnet_sol(wallet_address: str, amount_sol: float = 2.0):
+        """Запросить Devnet SOL через airdrop (только для devnet)"""
+        if cfg.IS_MAINNET:
+            return {
+                'success': False,
+                'error': 'Airdrop доступен только в devnet'
+            }
+        
+        try:
+            client = rpc_clients.async_client("https://api.devnet.solana.com")
+            
+            lamports = int(amount_sol * UniversalSolanaWallet.LAMPORTS_PER_SOL)
+            
+            print(f"🪂 Запрос airdrop {amount_sol} TEST SOL на {wallet_address}")
+            
+            result = await client.request_airdrop(Pubkey.from_string(wallet_address), lamports)
+            
+            if hasattr(result, 'value') and result.value:
+                tx_hash = str(result.value)
+                balance_cache.invalidate(wallet_address)
+                print(f"⏳ Ожидание подтверждения airdrop: {tx_hash}")
+                
+                try:
+                    confirmation = await client.confirm_transaction(
+                        result.value,
+                        commitment=Confirmed,
+                        sleep_seconds=1
+                    )
+                    
+                    if confirmation.value:
+                        print(f"✅ Airdrop успешно выполнен: {tx_hash}")
+                        return {
+                            'success': True,
+                            'tx_hash': tx_hash,
+                            'amount_sol': amount_sol,
+                            'message': f'Успешно отправлено {amount_sol} Devnet SOL'
+                        }
+                    else:
+                        print("❌ Airdrop не подтвержден")
+                        return {
+                            'success': False,
+                            'error': 'Транзакция не подтверждена'
+                        }
+                except Exception as confirm_error:
+                    print(f"⚠️ Airdrop отправлен, но не подтвержден: {confirm_error}")
+                    return {
+                        'success': True,
+                        'tx_hash': tx_hash,
+                        'amount_sol': amount_sol,
+                        'message': f'Airdrop отправлен, но требует подтверждения: {tx_hash}'
+                    }
+            else:
+                print("❌ Ошибка airdrop")
+                error_msg = getattr(result, 'error', 'Неизвестная ошибка')
+                return {
+                    'success': False,
+                    'error': f'Не удалось выполнить airdrop: {error_msg}'
+                }
+                
+        except Exception as e:
+            print(f"❌ Ошибка airdrop: {e}")
+            return {
+                'success': False,
+                'error': f'Ошибка airdrop: {str(e)}'
+            }
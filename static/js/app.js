@@ -1,3 +1,5 @@
+const TRANSACTIONS_PAGE_SIZE = 30;
+
 class CryptoPayApp {
     constructor() {
         this.user = null;
@@ -8,6 +10,10 @@ class CryptoPayApp {
         this.telegramWebApp = null;
         this.qrScanner = null;
         this.paymentCheckInterval = null;
+        this.transactionsCursor = null;
+        this.transactionsLoading = false;
+        this.transactionsGeneration = 0;
+        this.transactionsObserver = null;
         this.init();
     }
 
@@ -131,11 +137,16 @@ class CryptoPayApp {
     }
 
     async loadTransactions() {
+        const generation = ++this.transactionsGeneration;
+        this.transactionsCursor = null;
+        this.transactionsLoading = true;
         try {
-            const response = await fetch('/api/user/transactions');
+            const response = await fetch(`/api/user/transactions?limit=${TRANSACTIONS_PAGE_SIZE}`);
+            if (generation !== this.transactionsGeneration) return;
             if (response.ok) {
                 const data = await response.json();
                 console.log('Loaded transactions:', data.transactions);
+                this.transactionsCursor = data.next_cursor || null;
                 this.renderTransactions(data.transactions || []);
             } else {
                 console.error('Error loading transactions:', response.status);
@@ -144,14 +155,68 @@ class CryptoPayApp {
         } catch (error) {
             console.error('Error loading transactions:', error);
             this.renderTransactions([]);
+        } finally {
+            if (generation === this.transactionsGeneration) {
+                this.transactionsLoading = false;
+                this.setupTransactionsObserver();
+            }
         }
     }
 
-    renderTransactions(transactions) {
+    async loadMoreTransactions() {
+        if (this.transactionsLoading || !this.transactionsCursor) return;
+
+        const generation = this.transactionsGeneration;
+        this.transactionsLoading = true;
+        try {
+            const cursor = encodeURIComponent(this.transactionsCursor);
+            const response = await fetch(`/api/user/transactions?after=${cursor}&limit=${TRANSACTIONS_PAGE_SIZE}`);
+            if (generation !== this.transactionsGeneration) return;
+            if (response.ok) {
+                const data = await response.json();
+                this.transactionsCursor = data.next_cursor || null;
+                this.renderTransactions(data.transactions || [], true);
+            } else {
+                console.error('Error loading more transactions:', response.status);
+                this.transactionsCursor = null;
+            }
+        } catch (error) {
+            console.error('Error loading more transactions:', error);
+        } finally {
+            if (generation === this.transactionsGeneration) {
+                this.transactionsLoading = false;
+                this.setupTransactionsObserver();
+            }
+        }
+    }
+
+    setupTransactionsObserver() {
+        const sentinel = document.getElementById('transactionsSentinel');
+        if (!sentinel || !('IntersectionObserver' in window)) return;
+
+        if (!this.transactionsObserver) {
+            this.transactionsObserver = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) {
+                    this.loadMoreTransactions();
+                }
+            }, { rootMargin: '200px' });
+        }
+
+        // Переподписка заново проверяет видимость: короткая страница догрузит следующую
+        this.transactionsObserver.unobserve(sentinel);
+        if (this.transactionsCursor) {
+            this.transactionsObserver.observe(sentinel);
+        }
+    }
+
+    renderTransactions(transactions, append = false) {
         const container = document.getElementById('transactionsList');
-        container.innerHTML = '';
+        if (!append) {
+            container.innerHTML = '';
+        }
 
         if (!transactions || transactions.length === 0) {
+            if (append) return;
             container.innerHTML = '<p class="no-transactions">Нет операций</p>';
             return;
         }
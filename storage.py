@@ -0,0 +1,117 @@
+"""
+Бэкенды хранилища: как пул Database открывает, настраивает соединения
+и начинает пишущие транзакции.
+
+Бэкенд отвечает только за соединения и транзакции. SQL в database.py,
+migrations.py, archive.py и snapshot.py написан на диалекте SQLite (INSERT OR
+REPLACE/IGNORE, RETURNING, PRAGMA, триггеры, ATTACH, backup API), поэтому
+сейчас поддерживается только sqlite. Клиент-серверному бэкенду понадобится
+свой диалект миграций и запросов.
+"""
+
+import sqlite3
+import cfg
+from archive import archive_path_for
+from snapshot import snapshot_path_for
+
+DATABASE_BACKEND = getattr(cfg, 'DATABASE_BACKEND', 'sqlite')
+DB_BUSY_TIMEOUT = getattr(cfg, 'DB_BUSY_TIMEOUT', 30)
+DB_MMAP_SIZE = getattr(cfg, 'DB_MMAP_SIZE', 256 * 1024 * 1024)
+DB_CACHE_SIZE_KB = getattr(cfg, 'DB_CACHE_SIZE_KB', 16 * 1024)
+
+
+class StorageBackend:
+    """Интерфейс бэкенда: Database обращается к хранилищу только через него и DB-API соединения.
+
+    Соединение должно поддерживать execute/cursor/commit/rollback/in_transaction
+    и возвращать строки с доступом по имени колонки и по индексу.
+    """
+
+    name = None
+    Error = Exception
+
+    @classmethod
+    def from_location(cls, location: str) -> 'StorageBackend':
+        """Создать бэкенд по пути к файлу или строке подключения"""
+        raise NotImplementedError
+
+    @property
+    def location(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def archive_path(self):
+        """Путь к архиву завершенных операций или None, если архив не поддерживается"""
+        return None
+
+    @property
+    def snapshot_path(self):
+        """Путь к снимку для отчетов или None, если снимки не поддерживаются"""
+        return None
+
+    def connect(self):
+        """Открыть и настроить новое соединение"""
+        raise NotImplementedError
+
+    def begin_write(self, conn):
+        """Начать транзакцию, которая сразу берет блокировку на запись"""
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    """Файл SQLite в режиме WAL, архив подключается через ATTACH DATABASE"""
+
+    name = 'sqlite'
+    Error = sqlite3.Error
+
+    def __init__(self, db_path: str, archive_path: str = None, snapshot_path: str = None):
+        self.db_path = db_path
+        self._archive_path = archive_path
+        self._snapshot_path = snapshot_path
+
+    @classmethod
+    def from_location(cls, location: str) -> 'SQLiteBackend':
+        return cls(location, archive_path_for(location), snapshot_path_for(location))
+
+    @property
+    def location(self) -> str:
+        return self.db_path
+
+    @property
+    def archive_path(self):
+        return self._archive_path
+
+    @property
+    def snapshot_path(self):
+        return self._snapshot_path
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(DB_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA cache_size=-{int(DB_CACHE_SIZE_KB)}')
+        if self._archive_path:
+            conn.execute('ATTACH DATABASE ? AS archive', (self._archive_path,))
+            conn.execute('PRAGMA archive.journal_mode=WAL')
+            conn.execute('PRAGMA archive.synchronous=NORMAL')
+        return conn
+
+    def begin_write(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+
+
+# Имя DATABASE_BACKEND -> класс бэкенда
+BACKENDS = {
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+def create_backend(location: str, name: str = None) -> StorageBackend:
+    """Создать бэкенд по имени (по умолчанию DATABASE_BACKEND из cfg)"""
+    name = name or DATABASE_BACKEND
+    backend_class = BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Неизвестный DATABASE_BACKEND: {name} (доступны: {', '.join(BACKENDS)})")
+    return backend_class.from_location(location)
@@ -0,0 +1,78 @@
+"""
+Фоновая очистка истекших записей: auth_codes, session_codes и старые ключи rate_limits,
+а также PNG в qr_store, на которые больше не ссылается payment_queue
+"""
+
+import atexit
+import threading
+import time
+import cfg
+from typing import Dict
+from database import Database
+from qr_store import QR_STORE_MIN_AGE, QR_STORE_SWEEP_INTERVAL, qr_store
+
+SWEEP_INTERVAL = getattr(cfg, 'SWEEP_INTERVAL', 300)
+
+
+class TTLSweeper:
+    """Поток, периодически удаляющий истекшие строки пачками"""
+
+    def __init__(self, db: Database = None, interval: float = SWEEP_INTERVAL):
+        self.db = db or Database()
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.runs = 0
+        self._qr_swept_at = None
+        self.last_swept = {}
+        self.total_swept = {}
+
+    def start(self):
+        """Запустить поток очистки (один раз на процесс)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ttl-sweeper', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout: float = 5.0):
+        """Остановить поток очистки"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sweep(self) -> Dict[str, int]:
+        """Выполнить один проход очистки и вернуть число удаленных строк по таблицам"""
+        swept = self.db.sweep_expired()
+        # Обход каталога QR-кодов дороже, поэтому он идет реже: раз в QR_STORE_SWEEP_INTERVAL
+        now = time.monotonic()
+        if self._qr_swept_at is None or now - self._qr_swept_at >= QR_STORE_SWEEP_INTERVAL:
+            self._qr_swept_at = now
+            swept['qr_images'] = qr_store.sweep(self.db.get_referenced_qr_hashes(), QR_STORE_MIN_AGE)
+        with self._lock:
+            self.runs += 1
+            self.last_swept = swept
+            for table, count in swept.items():
+                self.total_swept[table] = self.total_swept.get(table, 0) + count
+        return swept
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'last_swept': dict(self.last_swept),
+                'total_swept': dict(self.total_swept),
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                swept = self.sweep()
+                if any(swept.values()):
+                    details = ', '.join(f"{table}: {count}" for table, count in swept.items())
+                    print(f"🧹 Удалены истекшие записи ({details})")
+            except Exception as e:
+                print(f"❌ Ошибка очистки истекших записей: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,37 @@
+"""
+Утилита архивации: переносит завершенные транзакции, заявки на вывод и записи
+очереди платежей старше N дней из основной БД в файл архива
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация завершенных операций")
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"возраст записей в днях (по умолчанию {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                        help=f"строк за одну транзакцию (по умолчанию {ARCHIVE_BATCH_SIZE})")
+    args = parser.parse_args()
+
+    db = Database()
+    if not db.pool.archive_path:
+        print("⚠️ Архив выключен: ARCHIVE_DATABASE_PATH пуст")
+        return 1
+
+    moved = db.archive_old_records(older_than_days=args.days, batch_size=args.batch_size)
+    for table, count in moved.items():
+        print(f"🗃️ {table}: перенесено {count}")
+    print(f"✅ Архивация завершена, архив: {db.pool.archive_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Бенчмарк методов Database на синтетических данных: для каждого публичного
+метода замеряются p50/p95/p99 задержки и ops/sec, результат пишется в JSON,
+чтобы сравнивать прогоны до и после изменений индексов, PRAGMA и схемы.
+
+Исходная база копируется во временный файл, поэтому пишущие методы ее не меняют.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from generate_test_data import generate
+from check_query_plans import sql_methods
+
+# Обслуживающие методы проходят по всей базе: для них хватает нескольких замеров
+MAINTENANCE = {'rebuild_ledger_balances', 'rebuild_system_stats', 'archive_old_records',
+               'sweep_expired', 'reload_roles'}
+
+
+def copy_database(source: str) -> str:
+    """Скопировать базу через backup API во временный файл"""
+    target = os.path.join(tempfile.mkdtemp(prefix="cryptopay_bench_"), "bench.db")
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    src.backup(dst)
+    dst.close()
+    src.close()
+    return target
+
+
+def load_dataset(db: Database) -> dict:
+    """Идентификаторы из базы, на которых строятся аргументы вызовов"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, telegram_id, username FROM users ORDER BY id')
+    users = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM transactions WHERE status = 'pending' ORDER BY id")
+    pending = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT MIN(id), MAX(id), COUNT(*) FROM transactions')
+    tx_min, tx_max, tx_count = cursor.fetchone()
+    cursor.execute('SELECT MIN(id), MAX(id), COUNT(*) FROM withdrawal_requests')
+    wd_min, wd_max, wd_count = cursor.fetchone()
+    cursor.execute("SELECT u.id, u.telegram_id FROM user_roles r JOIN users u ON u.telegram_id = r.telegram_id "
+                   "WHERE r.role = 'worker'")
+    workers = [tuple(row) for row in cursor.fetchall()]
+    cursor.execute('SELECT COUNT(*) FROM payment_queue')
+    queue_count = cursor.fetchone()[0]
+    conn.close()
+    return {
+        'users': users, 'workers': workers or users[:1], 'pending': pending or [tx_min],
+        'tx_range': (tx_min, tx_max), 'withdrawal_range': (wd_min or 1, wd_max or 1),
+        'counts': {'users': len(users), 'workers': len(workers), 'transactions': tx_count,
+                   'payment_queue': queue_count, 'withdrawal_requests': wd_count},
+    }
+
+
+def build_cases(db: Database, data: dict, rng: random.Random):
+    """(имя метода, вызов) для всех замеряемых методов"""
+    users, workers = data['users'], data['workers']
+    user = lambda: rng.choice(users)
+    tx_id = lambda: rng.randint(*data['tx_range'])
+    withdrawal_id = lambda: rng.randint(*data['withdrawal_range'])
+    unique = itertools.count(1)
+    added_roles = []
+
+    def add_role():
+        telegram_id = 900_000_000 + next(unique)
+        db.add_role(telegram_id, 'worker')
+        added_roles.append(telegram_id)
+
+    def remove_role():
+        db.remove_role(added_roles.pop() if added_roles else 1, 'worker')
+
+    def auth_flow_code():
+        code = f'bench{next(unique)}'
+        db.create_auth_code(code, user()[1])
+        return code
+
+    def unit_of_work():
+        user_id = user()[0]
+        with db.unit_of_work():
+            db.freeze_user_balance_atomic(user_id, 'SOL', 0.0001, 1.0)
+            db.create_transaction(user_id, 'payment', 'SOL', -0.0001, -1.15, 11500.0, status='pending')
+
+    return [
+        ('get_user_by_telegram_id', lambda: db.get_user_by_telegram_id(user()[1])),
+        ('get_user_by_id', lambda: db.get_user_by_id(user()[0])),
+        ('get_user_by_username', lambda: db.get_user_by_username(user()[2])),
+        ('get_user_wallet', lambda: db.get_user_wallet(user()[0], 'SOL')),
+        ('get_user_balance', lambda: db.get_user_balance(user()[0], 'SOL')),
+        ('get_available_balance', lambda: db.get_available_balance(user()[0], 'SOL')),
+        ('get_all_user_balances', lambda: db.get_all_user_balances(user()[0])),
+        ('get_frozen_balance', lambda: db.get_frozen_balance(user()[0], 'SOL')),
+        ('get_transaction', lambda: db.get_transaction(tx_id())),
+        ('get_user_transactions', lambda: db.get_user_transactions(user()[0], 50)),
+        ('get_user_transactions_page', lambda: db.get_user_transactions_page(user()[0], None, 30)),
+        ('get_pending_transactions_for_admin', lambda: db.get_pending_transactions_for_admin()),
+        ('get_withdrawal_request', lambda: db.get_withdrawal_request(withdrawal_id())),
+        ('get_pending_withdrawals_for_user', lambda: db.get_pending_withdrawals_for_user(user()[0])),
+        ('get_pending_withdrawals', lambda: db.get_pending_withdrawals()),
+        ('get_payment_queue_by_transaction', lambda: db.get_payment_queue_by_transaction(tx_id())),
+        ('get_pending_payments', lambda: db.get_pending_payments()),
+        ('get_all_workers_with_wallets', lambda: db.get_all_workers_with_wallets()),
+        ('get_user_roles', lambda: db.get_user_roles(user()[1])),
+        ('has_role', lambda: db.has_role(user()[1], 'worker')),
+        ('get_role_set', lambda: db.get_role_set(user()[1])),
+        ('get_all_admins', lambda: db.get_all_admins()),
+        ('get_all_workers', lambda: db.get_all_workers()),
+        ('get_roster', lambda: db.get_roster()),
+        ('get_top_workers', lambda: db.get_top_workers()),
+        ('get_worker_stats', lambda: db.get_worker_stats(rng.choice(workers)[0])),
+        ('get_free_workers', lambda: db.get_free_workers()),
+        ('get_busy_workers_count', lambda: db.get_busy_workers_count()),
+        ('get_setting', lambda: db.get_setting('home_page_text')),
+        ('get_system_stats', lambda: db.get_system_stats()),
+        ('get_auth_code', lambda: db.get_auth_code('missing')),
+        ('get_session_code', lambda: db.get_session_code('missing')),
+        ('create_user', lambda: db.create_user(800_000_000 + next(unique), None)),
+        ('create_wallet', lambda: db.create_wallet(db.create_user(700_000_000 + next(unique)), 'SOL',
+                                                   f'BenchWallet{next(unique):033d}')),
+        ('create_transaction', lambda: db.create_transaction(user()[0], 'deposit', 'SOL', 0.01, 115.0, 11500.0)),
+        ('update_transaction_status', lambda: db.update_transaction_status(rng.choice(data['pending']), 'pending')),
+        ('update_transaction_amount_rub', lambda: db.update_transaction_amount_rub(tx_id(), 115.0)),
+        ('assign_worker_to_transaction', lambda: db.assign_worker_to_transaction(
+            rng.choice(data['pending']), rng.choice(workers)[0])),
+        ('update_user_balance', lambda: db.update_user_balance(user()[0], 'SOL', 0.5)),
+        ('increment_user_balance', lambda: db.increment_user_balance(user()[0], 'SOL', 0.001)),
+        ('decrement_user_balance', lambda: db.decrement_user_balance(user()[0], 'SOL', 0.001)),
+        ('update_balance_atomic', lambda: db.update_balance_atomic(user()[0], 'SOL', 0.5)),
+        ('freeze_user_balance', lambda: db.freeze_user_balance(user()[0], 'SOL', 0.0001)),
+        ('freeze_user_balance_atomic', lambda: db.freeze_user_balance_atomic(user()[0], 'SOL', 0.0001, 1.0)),
+        ('unfreeze_user_balance', lambda: db.unfreeze_user_balance(user()[0], 'SOL')),
+        ('reset_test_balance', lambda: db.reset_test_balance(user()[0])),
+        ('delete_test_transactions', lambda: db.delete_test_transactions(user()[0])),
+        ('unit_of_work', unit_of_work),
+        ('create_withdrawal_request', lambda: db.create_withdrawal_request(user()[0], 0.01, 'BenchWallet')),
+        ('update_withdrawal_status', lambda: db.update_withdrawal_status(withdrawal_id(), 'pending')),
+        ('add_to_payment_queue', lambda: db.add_to_payment_queue(tx_id(), 'qr', None, '{}', 115.0)),
+        ('update_payment_queue_status', lambda: db.update_payment_queue_status(rng.choice(data['pending']),
+                                                                               'pending')),
+        ('claim_pending_payments', lambda: db.claim_pending_payments()),
+        ('update_rate_limit', lambda: db.update_rate_limit(f'bench:{rng.randint(1, 1000)}', 5, 60)),
+        ('create_auth_code', auth_flow_code),
+        ('mark_code_as_used', lambda: db.mark_code_as_used(auth_flow_code())),
+        ('use_auth_code', lambda: db.use_auth_code(auth_flow_code())),
+        ('create_session_code', lambda: db.create_session_code(f'bench{next(unique)}', 'login')),
+        ('update_session_code_with_auth', lambda: db.update_session_code_with_auth('missing', '000000', 1)),
+        ('mark_session_code_as_used', lambda: db.mark_session_code_as_used('missing')),
+        ('add_role', add_role),
+        ('remove_role', remove_role),
+        ('update_worker_stats', lambda: db.update_worker_stats(rng.choice(workers)[0], 1, 5.0, 100.0)),
+        ('update_setting', lambda: db.update_setting('bench_setting', str(next(unique)))),
+        ('reload_roles', lambda: db.reload_roles()),
+        ('rebuild_ledger_balances', lambda: db.rebuild_ledger_balances()),
+        ('rebuild_system_stats', lambda: db.rebuild_system_stats()),
+        ('archive_old_records', lambda: db.archive_old_records()),
+        ('sweep_expired', lambda: db.sweep_expired()),
+    ]
+
+
+def percentile(samples, p: float) -> float:
+    """Перцентиль по ближайшему рангу; samples отсортированы"""
+    index = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples) + 0.5)) - 1))
+    return samples[index]
+
+
+def measure(call, iterations: int, cold: bool, cache) -> dict:
+    samples = []
+    for _ in range(iterations):
+        if cold:
+            cache.clear()
+        start = time.perf_counter_ns()
+        call()
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    samples.sort()
+    total = sum(samples)
+    return {
+        'count': iterations,
+        'p50_us': round(percentile(samples, 50), 1),
+        'p95_us': round(percentile(samples, 95), 1),
+        'p99_us': round(percentile(samples, 99), 1),
+        'mean_us': round(total / iterations, 1),
+        'ops_per_sec': round(iterations / (total / 1_000_000), 1) if total else None,
+    }
+
+
+def run_benchmark(source: str, iterations: int = 500, cold: bool = False, only=None, seed: int = 1) -> dict:
+    db = Database(copy_database(source))
+    data = load_dataset(db)
+    rng = random.Random(seed)
+    cases = build_cases(db, data, rng)
+
+    results = {}
+    for name, call in cases:
+        if only and name not in only:
+            continue
+        count = max(3, iterations // 100) if name in MAINTENANCE else iterations
+        results[name] = measure(call, count, cold, db.cache)
+        print(f"{name:<36}p50 {results[name]['p50_us']:>10.1f} мкс   p99 {results[name]['p99_us']:>10.1f} мкс   "
+              f"{results[name]['ops_per_sec'] or 0:>10.1f} ops/s")
+
+    measured = {name for name, _ in cases}
+    return {
+        'created_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': iterations,
+        'cold_cache': cold,
+        'dataset': data['counts'],
+        'results': results,
+        'not_measured': sorted(sql_methods() - measured),
+    }
+
+
+def compare(report: dict, baseline: dict):
+    """Вывести изменение p50/p95 относительно прошлого прогона"""
+    print(f"\n{'Метод':<36}{'p50, было':>12}{'p50, стало':>12}{'p95, было':>12}{'p95, стало':>12}")
+    for name, result in report['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old:
+            print(f"{name:<36}{old['p50_us']:>12.1f}{result['p50_us']:>12.1f}"
+                  f"{old['p95_us']:>12.1f}{result['p95_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк методов Database")
+    parser.add_argument('--db', help="база с данными (по умолчанию генерируется заново)")
+    parser.add_argument('--users', type=int, default=1000, help="пользователей при генерации")
+    parser.add_argument('--transactions', type=int, default=50000, help="транзакций при генерации")
+    parser.add_argument('--iterations', type=int, default=500, help="вызовов на метод")
+    parser.add_argument('--cold', action='store_true', help="очищать кеш сущностей перед каждым вызовом")
+    parser.add_argument('--method', action='append', help="замерить только эти методы")
+    parser.add_argument('--output', default='bench_results.json', help="куда записать JSON")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    source = args.db
+    if not source:
+        source = os.path.join(tempfile.mkdtemp(prefix="cryptopay_data_"), "data.db")
+        summary = generate(Database(source), args.users, args.transactions)
+        print(f"🧪 Сгенерированы данные за {summary['seconds']} с: {source}")
+
+    report = run_benchmark(source, args.iterations, args.cold, args.method)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Результаты записаны в {args.output}")
+    if report['not_measured']:
+        print(f"⚠️ Не замерены: {', '.join(report['not_measured'])}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
@@ -0,0 +1,70 @@
+"""
+Утилита для сравнения задержки методов Database:
+новое соединение на каждый вызов против пула постоянных соединений (WAL)
+"""
+
+import os
+import sys
+import sqlite3
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+class LegacyDatabase(Database):
+    """Database со старым поведением: sqlite3.connect() на каждый вызов"""
+
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        if self.pool.archive_path:
+            conn.execute('ATTACH DATABASE ? AS archive', (self.pool.archive_path,))
+        return conn
+
+
+def seed(db, users=50):
+    """Заполнить базу тестовыми пользователями и операциями"""
+    for i in range(users):
+        user_id = db.create_user(1_000_000 + i, f"user{i}", "Test", "User")
+        db.create_wallet(user_id, 'SOL', f"Wallet{i:040d}")
+        for _ in range(20):
+            db.create_transaction(user_id, 'payment', 'SOL', 0.01, 115.0, 11500.0)
+
+
+def measure(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def run_benchmark(iterations=2000):
+    """Замерить среднюю задержку вызова в микросекундах"""
+    with tempfile.TemporaryDirectory(prefix="cryptopay_bench_") as tmp_dir:
+        legacy = LegacyDatabase(os.path.join(tmp_dir, "legacy.db"))
+        pooled = Database(os.path.join(tmp_dir, "pooled.db"))
+        seed(legacy)
+        seed(pooled)
+
+        cases = [
+            ("get_user_by_telegram_id", lambda db: db.get_user_by_telegram_id(1_000_010)),
+            ("get_user_wallet", lambda db: db.get_user_wallet(10, 'SOL')),
+            ("get_user_balance", lambda db: db.get_user_balance(10, 'SOL')),
+            ("get_user_transactions", lambda db: db.get_user_transactions(10, 20)),
+            ("get_setting", lambda db: db.get_setting('home_page_text')),
+            ("update_transaction_status", lambda db: db.update_transaction_status(1, 'pending')),
+        ]
+
+        print(f"{'Метод':<28}{'до, мкс':>12}{'после, мкс':>14}{'ускорение':>12}")
+        for name, call in cases:
+            before = measure(lambda: call(legacy), iterations)
+            after = measure(lambda: call(pooled), iterations)
+            print(f"{name:<28}{before:>12.1f}{after:>14.1f}{before / after:>11.1f}x")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    run_benchmark(iterations)
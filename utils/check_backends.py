@@ -0,0 +1,100 @@
+"""
+Проверка бэкендов хранилища: один и тот же сценарий через API Database
+прогоняется на каждом бэкенде из storage.BACKENDS.
+
+SQLite проверяется на временном файле. Для остальных бэкендов строка
+подключения берется из переменной окружения CRYPTOPAY_<ИМЯ>_DSN;
+если она не задана, бэкенд пропускается. Сейчас зарегистрирован только
+sqlite (см. storage.py).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from storage import BACKENDS
+
+
+def backend_location(name: str, tmp_dir: str):
+    """Где поднять проверочную базу для бэкенда (None - пропустить)"""
+    if name == 'sqlite':
+        return os.path.join(tmp_dir, f"check_{name}.db")
+    return os.environ.get(f'CRYPTOPAY_{name.upper()}_DSN')
+
+
+def run_scenario(db: Database):
+    """Основные операции платежного сценария; AssertionError при расхождении"""
+    user_id = db.create_user(7001, 'backend_user', 'Backend', 'User')
+    assert db.get_user_by_telegram_id(7001)['id'] == user_id
+    db.create_wallet(user_id, 'SOL', 'BackendWallet111111111111111111111111111111')
+    assert db.get_user_wallet(user_id, 'SOL')['wallet_address'].startswith('BackendWallet')
+
+    db.update_user_balance(user_id, 'SOL', 1.0)
+    assert abs(db.get_user_balance(user_id, 'SOL') - 1.0) < 1e-9
+
+    with db.unit_of_work():
+        assert db.freeze_user_balance_atomic(user_id, 'SOL', 0.25, 1.0)
+        tx_id = db.create_transaction(user_id, 'payment', 'SOL', -0.25, -2875.0, 11500.0, status='pending')
+        db.add_to_payment_queue(tx_id, 'qr', None, '{}', 2875.0)
+    assert abs(db.get_user_balance(user_id, 'SOL') - 0.75) < 1e-9
+
+    try:
+        with db.unit_of_work():
+            db.create_transaction(user_id, 'payment', 'SOL', -0.1, status='pending')
+            raise RuntimeError('rollback')
+    except RuntimeError:
+        pass
+    assert len(db.get_user_transactions(user_id, 10)) == 1
+
+    claimed = db.claim_pending_payments()
+    assert [row['transaction_id'] for row in claimed] == [tx_id]
+    assert db.claim_pending_payments() == []
+
+    db.update_transaction_status(tx_id, 'completed')
+    assert db.get_transaction(tx_id)['status'] == 'completed'
+
+    assert db.update_rate_limit('backend:key', 5, 60)
+
+    db.add_role(7001, 'worker')
+    assert db.has_role(7001, 'worker')
+    db.remove_role(7001, 'worker')
+    assert not db.has_role(7001, 'worker')
+
+    stats = db.get_system_stats()
+    assert stats['total_users'] == 1 and stats['total_transactions'] == 1
+    assert db.rebuild_system_stats() == {}
+
+
+def check_backends(names) -> bool:
+    with tempfile.TemporaryDirectory(prefix="cryptopay_backend_") as tmp_dir:
+        return _check_backends(names, tmp_dir)
+
+
+def _check_backends(names, tmp_dir: str) -> bool:
+    failed = False
+    for name in names:
+        location = backend_location(name, tmp_dir)
+        if location is None:
+            print(f"⏭️ {name}: пропущен, задайте CRYPTOPAY_{name.upper()}_DSN")
+            continue
+        try:
+            run_scenario(Database(location, backend=name))
+            print(f"✅ {name}: сценарий пройден")
+        except Exception as e:
+            failed = True
+            frame = traceback.extract_tb(e.__traceback__)[-1]
+            print(f"❌ {name}: {type(e).__name__}: {e} ({os.path.basename(frame.filename)}:{frame.lineno})")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка бэкендов хранилища")
+    parser.add_argument('--backend', action='append', choices=sorted(BACKENDS),
+                        help="какой бэкенд проверять (по умолчанию все)")
+    args = parser.parse_args()
+    sys.exit(0 if check_backends(args.backend or sorted(BACKENDS)) else 1)
@@ -0,0 +1,256 @@
+"""
+Проверка планов запросов database.py: каждый метод Database вызывается на
+временной базе, все выполненные запросы прогоняются через EXPLAIN QUERY PLAN.
+Скрипт завершается с ошибкой, если частый запрос сканирует таблицу целиком.
+"""
+
+import inspect
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import archive_path_for, ensure_archive_views
+from database import Database
+
+# Методы, которым полный проход по таблице разрешен, и причина
+ALLOWED_SCANS = {
+    'rebuild_system_stats': 'обслуживание: пересчет счетчиков статистики с нуля',
+    'rebuild_ledger_balances': 'обслуживание: проход по всем счетам, проводки читаются по индексу',
+    'get_referenced_qr_hashes': 'обслуживание: ссылки на PNG qr_store, раз в QR_STORE_SWEEP_INTERVAL',
+}
+
+SQL_PREFIXES = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH', 'REPLACE')
+
+
+class TracedDatabase(Database):
+    """Database, запоминающая все запросы текущего метода"""
+
+    current_method = None
+    statements = []
+
+    def get_connection(self):
+        conn = super().get_connection()
+        conn.set_trace_callback(self._trace)
+        return conn
+
+    def _trace(self, sql):
+        if self.current_method and sql.lstrip().upper().startswith(SQL_PREFIXES):
+            self.statements.append((self.current_method, sql))
+
+
+def build_calls():
+    """Вызовы всех методов Database с тестовыми аргументами"""
+    state = {}
+
+    def setup(db):
+        state['user_id'] = db.create_user(5001, 'plan_user', 'Plan', 'User')
+        state['worker_user_id'] = db.create_user(5002, 'plan_worker', 'Plan', 'Worker')
+        db.create_wallet(state['user_id'], 'SOL', 'PlanWallet1111111111111111111111111111111')
+        state['tx_id'] = db.create_transaction(state['user_id'], 'payment', 'SOL', 0.01, 115.0, 11500.0,
+                                               status='pending')
+        state['withdrawal_id'] = db.create_withdrawal_request(state['user_id'], 0.01,
+                                                              'PlanWallet1111111111111111111111111111111')
+        db.create_auth_code('111111', 5001)
+        db.create_session_code('session-1', 'register')
+
+    def run_unit_of_work(db):
+        with db.unit_of_work():
+            db.freeze_user_balance_atomic(state['user_id'], 'SOL', 0.01, 1.0)
+            db.create_transaction(state['user_id'], 'payment', 'SOL', -0.01, status='pending')
+
+    return setup, state, [
+        ('update_rate_limit', lambda db: db.update_rate_limit('plan:key', 5, 60)),
+        ('create_user', lambda db: db.create_user(5003, 'plan_other')),
+        ('get_user_by_telegram_id', lambda db: db.get_user_by_telegram_id(5001)),
+        ('get_user_by_id', lambda db: db.get_user_by_id(state['user_id'])),
+        ('get_all_workers_with_wallets', lambda db: db.get_all_workers_with_wallets()),
+        ('get_user_balance', lambda db: db.get_user_balance(state['user_id'], 'SOL')),
+        ('get_available_balance', lambda db: db.get_available_balance(state['user_id'], 'SOL')),
+        ('get_all_user_balances', lambda db: db.get_all_user_balances(state['user_id'])),
+        ('update_user_balance', lambda db: db.update_user_balance(state['user_id'], 'SOL', 1.0)),
+        ('increment_user_balance', lambda db: db.increment_user_balance(state['user_id'], 'SOL', 0.5)),
+        ('decrement_user_balance', lambda db: db.decrement_user_balance(state['user_id'], 'SOL', 0.5)),
+        ('rebuild_ledger_balances', lambda db: db.rebuild_ledger_balances()),
+        ('create_wallet', lambda db: db.create_wallet(state['worker_user_id'], 'SOL',
+                                                      'PlanWallet2222222222222222222222222222222')),
+        ('get_user_wallet', lambda db: db.get_user_wallet(state['user_id'], 'SOL')),
+        ('create_transaction', lambda db: db.create_transaction(state['user_id'], 'deposit', 'SOL', 0.1)),
+        ('update_transaction_status', lambda db: db.update_transaction_status(state['tx_id'], 'pending')),
+        ('update_transaction_amount_rub', lambda db: db.update_transaction_amount_rub(state['tx_id'], 115.0)),
+        ('delete_test_transactions', lambda db: db.delete_test_transactions(state['worker_user_id'])),
+        ('get_user_by_username', lambda db: db.get_user_by_username('plan_user')),
+        ('get_transaction', lambda db: db.get_transaction(state['tx_id'])),
+        ('get_user_transactions', lambda db: db.get_user_transactions(state['user_id'], 20)),
+        ('get_user_transactions_page', lambda db: db.get_user_transactions_page(
+            state['user_id'], db.encode_transactions_cursor('2100-01-01 00:00:00', 1 << 62), 20)),
+        ('get_transaction_archived', lambda db: db.get_transaction(1 << 62, include_archived=True)),
+        ('get_user_transactions_archived', lambda db: db.get_user_transactions(
+            state['user_id'], 20, include_archived=True)),
+        ('get_user_transactions_page_archived', lambda db: db.get_user_transactions_page(
+            state['user_id'], db.encode_transactions_cursor('2100-01-01 00:00:00', 1 << 62), 20,
+            include_archived=True)),
+        ('get_pending_transactions_for_admin', lambda db: db.get_pending_transactions_for_admin()),
+        ('assign_worker_to_transaction', lambda db: db.assign_worker_to_transaction(state['tx_id'],
+                                                                                    state['worker_user_id'])),
+        ('create_withdrawal_request', lambda db: db.create_withdrawal_request(
+            state['user_id'], 0.02, 'PlanWallet1111111111111111111111111111111')),
+        ('get_withdrawal_request', lambda db: db.get_withdrawal_request(state['withdrawal_id'])),
+        ('get_pending_withdrawals_for_user', lambda db: db.get_pending_withdrawals_for_user(state['user_id'])),
+        ('get_pending_withdrawals', lambda db: db.get_pending_withdrawals()),
+        ('update_withdrawal_status', lambda db: db.update_withdrawal_status(state['withdrawal_id'], 'pending')),
+        ('add_to_payment_queue', lambda db: db.add_to_payment_queue(state['tx_id'], 'qr', None, '{}', 115.0)),
+        ('get_payment_queue_by_transaction', lambda db: db.get_payment_queue_by_transaction(state['tx_id'])),
+        ('get_pending_payments', lambda db: db.get_pending_payments()),
+        ('claim_pending_payments', lambda db: db.claim_pending_payments()),
+        ('claim_pending_payments_single', lambda db: db.claim_pending_payments(1, state['tx_id'])),
+        ('retry_payment_dispatch', lambda db: db.retry_payment_dispatch(state['tx_id'], 'check', 5, 30)),
+        ('get_next_dispatch_retry_delay', lambda db: db.get_next_dispatch_retry_delay()),
+        ('record_payment_offer', lambda db: db.record_payment_offer(state['tx_id'], 1, 30)),
+        ('get_due_payment_offers', lambda db: db.get_due_payment_offers()),
+        ('get_next_offer_delay', lambda db: db.get_next_offer_delay()),
+        ('get_referenced_qr_hashes', lambda db: db.get_referenced_qr_hashes()),
+        ('requeue_unoffered_payments', lambda db: db.requeue_unoffered_payments()),
+        ('update_payment_queue_status', lambda db: db.update_payment_queue_status(
+            state['tx_id'], 'pending', state['worker_user_id'])),
+        ('freeze_user_balance', lambda db: db.freeze_user_balance(state['user_id'], 'SOL', 0.1)),
+        ('get_frozen_balance', lambda db: db.get_frozen_balance(state['user_id'], 'SOL')),
+        ('freeze_user_balance_atomic', lambda db: db.freeze_user_balance_atomic(state['user_id'], 'SOL', 0.1, 1.0)),
+        ('unfreeze_user_balance', lambda db: db.unfreeze_user_balance(state['user_id'], 'SOL')),
+        ('update_balance_atomic', lambda db: db.update_balance_atomic(state['user_id'], 'SOL', 1.0)),
+        ('reset_test_balance', lambda db: db.reset_test_balance(state['user_id'])),
+        ('unit_of_work', run_unit_of_work),
+        ('create_auth_code', lambda db: db.create_auth_code('222222', 5001)),
+        ('get_auth_code', lambda db: db.get_auth_code('111111')),
+        ('use_auth_code', lambda db: db.use_auth_code('222222')),
+        ('mark_code_as_used', lambda db: db.mark_code_as_used('111111')),
+        ('create_session_code', lambda db: db.create_session_code('session-2', 'login')),
+        ('get_session_code', lambda db: db.get_session_code('session-1')),
+        ('update_session_code_with_auth', lambda db: db.update_session_code_with_auth('session-1', '111111', 5001)),
+        ('mark_session_code_as_used', lambda db: db.mark_session_code_as_used('session-1')),
+        ('add_role', lambda db: db.add_role(5002, 'worker')),
+        ('get_user_roles', lambda db: db.get_user_roles(5002)),
+        ('has_role', lambda db: db.has_role(5002, 'worker')),
+        ('get_role_set', lambda db: db.get_role_set(5002)),
+        ('reload_roles', lambda db: db.reload_roles()),
+        ('get_all_admins', lambda db: db.get_all_admins()),
+        ('get_all_workers', lambda db: db.get_all_workers()),
+        ('get_roster', lambda db: db.get_roster()),
+        ('get_free_workers', lambda db: db.get_free_workers()),
+        ('get_busy_workers_count', lambda db: db.get_busy_workers_count()),
+        ('touch_worker_heartbeat', lambda db: db.touch_worker_heartbeat(5002)),
+        ('get_worker_states', lambda db: db.get_worker_states([state['user_id'], state['worker_user_id']])),
+        ('update_worker_stats', lambda db: db.update_worker_stats(state['worker_user_id'], 1, 5.0, 100.0)),
+        ('get_worker_stats', lambda db: db.get_worker_stats(state['worker_user_id'])),
+        ('get_top_workers', lambda db: db.get_top_workers()),
+        ('remove_role', lambda db: db.remove_role(5002, 'worker')),
+        ('get_setting', lambda db: db.get_setting('home_page_text')),
+        ('update_setting', lambda db: db.update_setting('home_page_text', 'text')),
+        ('get_system_stats', lambda db: db.get_system_stats()),
+        ('rebuild_system_stats', lambda db: db.rebuild_system_stats()),
+        ('archive_old_records', lambda db: db.archive_old_records(older_than_days=-1)),
+        ('sweep_expired', lambda db: db.sweep_expired(rate_limit_retention=-60)),
+    ]
+
+
+def sql_methods():
+    """Публичные методы Database, выполняющие SQL"""
+    names = set()
+    for name, func in inspect.getmembers(Database, inspect.isfunction):
+        if name.startswith('_') or name in ('init_db', 'get_connection'):
+            continue
+        if 'execute(' in inspect.getsource(func):
+            names.add(name)
+    return names
+
+
+def table_scans(conn, sql):
+    """Строки плана с полным проходом по таблице (без использования индекса).
+
+    Проход по CTE и VALUES таблицей не считается: имя (или псевдоним) сканируемого
+    источника должно указывать на настоящую таблицу.
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = {alias: name for name, alias in
+               re.findall(r'(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)', sql, re.IGNORECASE)}
+
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    scans = []
+    for row in plan:
+        # Имя может быть с префиксом схемы: SCAN main.t, SCAN archive.t
+        match = re.match(r'SCAN (?:\w+\.)?(\w+)', row[3])
+        if not match or 'USING' in row[3] or 'CONSTANT ROW' in row[3]:
+            continue
+        source = aliases.get(match.group(1), match.group(1))
+        if source in tables:
+            scans.append(row[3])
+    return scans
+
+
+def check_query_plans() -> bool:
+    with tempfile.TemporaryDirectory(prefix="cryptopay_plans_") as tmp_dir:
+        return _check_query_plans(os.path.join(tmp_dir, "plans.db"))
+
+
+def _check_query_plans(db_path: str) -> bool:
+    db = TracedDatabase(db_path)
+
+    setup, state, calls = build_calls()
+    setup(db)
+
+    failed = False
+    for name, call in calls:
+        TracedDatabase.current_method = name
+        db.cache.clear()
+        try:
+            call(db)
+        except Exception as e:
+            print(f"❌ {name}: ошибка вызова: {e}")
+            failed = True
+    TracedDatabase.current_method = None
+
+    missing = sql_methods() - {name for name, _ in calls}
+    for name in sorted(missing):
+        print(f"❌ {name}: метод не покрыт проверкой планов")
+        failed = True
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path_for(db_path),))
+    ensure_archive_views(conn.cursor())
+    seen = set()
+    for method, sql in TracedDatabase.statements:
+        if (method, sql) in seen:
+            continue
+        seen.add((method, sql))
+
+        try:
+            scans = table_scans(conn, sql)
+        except sqlite3.Error as e:
+            print(f"❌ {method}: не удалось получить план: {e}")
+            print(f"   {' '.join(sql.split())}")
+            failed = True
+            continue
+
+        if not scans:
+            continue
+        if method in ALLOWED_SCANS:
+            print(f"ℹ️ {method}: {', '.join(scans)} (разрешено: {ALLOWED_SCANS[method]})")
+            continue
+
+        failed = True
+        print(f"❌ {method}: {', '.join(scans)}")
+        print(f"   {' '.join(sql.split())}")
+    conn.close()
+
+    if failed:
+        print("\n❌ Найдены запросы без подходящих индексов или с ошибками")
+    else:
+        print(f"\n✅ Проверено запросов: {len(seen)}, полных сканирований нет")
+    return not failed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
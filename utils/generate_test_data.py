@@ -0,0 +1,176 @@
+"""
+Генератор синтетических данных для базы CryptoPay: пользователи, кошельки,
+балансы, роли, транзакции, очередь платежей и заявки на вывод с распределениями,
+похожими на рабочие (активность пользователей по Парето, суммы - логнормальные,
+даты - за последние DAYS дней)
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+BASE58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+SOL_TO_RUB = 11500.0
+
+# Тип транзакции -> вес; статус -> вес
+TRANSACTION_TYPES = {'payment': 70, 'deposit': 20, 'withdrawal': 10}
+TRANSACTION_STATUSES = {'completed': 85, 'cancelled': 7, 'error': 5, 'pending': 3}
+WITHDRAWAL_STATUSES = {'completed': 80, 'rejected': 12, 'pending': 8}
+QUEUE_STATUS = {'completed': 'completed', 'cancelled': 'cancelled', 'error': 'error', 'pending': 'pending'}
+
+
+def wallet_address(rng: random.Random) -> str:
+    return ''.join(rng.choice(BASE58) for _ in range(44))
+
+
+def weighted(rng: random.Random, weights: dict, k: int) -> list:
+    return rng.choices(list(weights), weights=list(weights.values()), k=k)
+
+
+def amount_rub(rng: random.Random) -> float:
+    """Сумма платежа: логнормальная с медианой около 1500 ₽ в пределах 250-10000 ₽"""
+    return round(min(10000.0, max(250.0, rng.lognormvariate(math.log(1500), 0.8))), 2)
+
+
+def timestamp(rng: random.Random, now: datetime, days: int) -> str:
+    """Дата в пределах days дней; свежие записи встречаются чаще старых"""
+    age = min(days, rng.expovariate(3.0 / days)) if days > 0 else 0
+    return (now - timedelta(days=age)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate(db: Database, users: int = 1000, transactions: int = 50000, worker_share: float = 0.03,
+             days: int = 180, seed: int = 42) -> dict:
+    """Заполнить базу; вернуть сводку с идентификаторами для бенчмарка"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    start = time.perf_counter()
+
+    base_telegram_id = 100_000_000
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(telegram_id), 0) FROM users')
+    base_telegram_id = max(base_telegram_id, cursor.fetchone()[0] + 1)
+    conn.close()
+
+    with db.unit_of_work():
+        conn = db.get_connection()
+        conn.executemany('''
+            INSERT INTO users (telegram_id, username, first_name, last_name, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(base_telegram_id + i, f'user{base_telegram_id + i}', 'Test', f'User{i}',
+               timestamp(rng, now, days)) for i in range(users)])
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, telegram_id FROM users WHERE telegram_id >= ? ORDER BY telegram_id',
+                       (base_telegram_id,))
+        user_rows = [(row[0], row[1]) for row in cursor.fetchall()]
+        user_ids = [user_id for user_id, _ in user_rows]
+
+        conn.executemany('''
+            INSERT INTO wallets (user_id, currency, wallet_address) VALUES (?, 'SOL', ?)
+        ''', [(user_id, wallet_address(rng)) for user_id in user_ids])
+
+        workers = rng.sample(user_rows, max(1, int(users * worker_share)))
+        conn.executemany("INSERT OR IGNORE INTO user_roles (telegram_id, role) VALUES (?, 'worker')",
+                         [(telegram_id,) for _, telegram_id in workers])
+        conn.executemany('''
+            INSERT INTO worker_status (worker_id, status) VALUES (?, ?)
+        ''', [(user_id, rng.choice(('free', 'free', 'busy'))) for user_id, _ in workers])
+        conn.commit()
+
+    # Балансы - через журнал проводок, как в рабочем коде
+    for user_id in user_ids:
+        db.update_user_balance(user_id, 'SOL', round(rng.paretovariate(1.5) * 0.05, 6))
+
+    # Активность пользователей по Парето: немногие делают большую часть операций
+    activity = [rng.paretovariate(1.2) for _ in user_ids]
+    worker_ids = [user_id for user_id, _ in workers]
+
+    tx_rows = []
+    for user_id, tx_type, status in zip(rng.choices(user_ids, weights=activity, k=transactions),
+                                        weighted(rng, TRANSACTION_TYPES, transactions),
+                                        weighted(rng, TRANSACTION_STATUSES, transactions)):
+        rub = amount_rub(rng)
+        sign = 1 if tx_type == 'deposit' else -1
+        worker_id = rng.choice(worker_ids) if tx_type == 'payment' and status != 'pending' else None
+        tx_rows.append((user_id, tx_type, 'SOL', sign * round(rub / SOL_TO_RUB, 9), sign * rub, SOL_TO_RUB,
+                        status, worker_id, timestamp(rng, now, days)))
+
+    withdrawal_count = max(1, transactions // 20)
+    withdrawal_rows = [
+        (user_id, round(amount_rub(rng) / SOL_TO_RUB, 9), wallet_address(rng), status, timestamp(rng, now, days))
+        for user_id, status in zip(rng.choices(user_ids, weights=activity, k=withdrawal_count),
+                                   weighted(rng, WITHDRAWAL_STATUSES, withdrawal_count))
+    ]
+
+    with db.unit_of_work():
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transactions')
+        first_tx_id = cursor.fetchone()[0] + 1
+        conn.executemany('''
+            INSERT INTO transactions (user_id, transaction_type, currency, amount, amount_rub, exchange_rate,
+                                      status, worker_id, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row + (row[-1],) for row in tx_rows])
+
+        queue_rows = []
+        for tx_id, row in enumerate(tx_rows, start=first_tx_id):
+            if row[1] != 'payment':
+                continue
+            user_info = json.dumps({'user_id': row[0], 'real_transaction': True,
+                                    'frozen_amount_sol': -row[3], 'worker_earnings_sol': -row[3] * 0.05})
+            queue_rows.append((tx_id, f'ST00012|Sum={int(-row[4] * 100)}', user_info, -row[4],
+                               -row[4] * 0.05, QUEUE_STATUS[row[6]], row[7], row[8]))
+        conn.executemany('''
+            INSERT INTO payment_queue (transaction_id, qr_code_data, user_info, amount_rub, worker_earnings_rub,
+                                       status, assigned_worker_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', queue_rows)
+
+        conn.executemany('''
+            INSERT INTO withdrawal_requests (user_id, amount_sol, wallet_address, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [row + (row[-1],) for row in withdrawal_rows])
+        conn.commit()
+
+    db.cache.clear()
+    db.reload_roles()
+
+    return {
+        'users': users,
+        'workers': len(workers),
+        'transactions': transactions,
+        'payment_queue': len(queue_rows),
+        'withdrawal_requests': withdrawal_count,
+        'days': days,
+        'seed': seed,
+        'user_ids': [user_ids[0], user_ids[-1]],
+        'transaction_ids': [first_tx_id, first_tx_id + transactions - 1],
+        'seconds': round(time.perf_counter() - start, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация тестовых данных CryptoPay")
+    parser.add_argument('--db', required=True, help="путь к файлу базы (будет создан)")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--worker-share', type=float, default=0.03, help="доля воркеров среди пользователей")
+    parser.add_argument('--days', type=int, default=180, help="за сколько дней распределить даты")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    summary = generate(Database(args.db), args.users, args.transactions, args.worker_share, args.days, args.seed)
+    print(f"✅ Данные сгенерированы за {summary['seconds']} с: "
+          f"{summary['users']} пользователей ({summary['workers']} воркеров), "
+          f"{summary['transactions']} транзакций, {summary['payment_queue']} в очереди, "
+          f"{summary['withdrawal_requests']} заявок на вывод")
@@ -0,0 +1,200 @@
+"""
+Распределение платежей между воркерами: выбор воркеров по загрузке из worker_status
+и предложение платежа волнами вместо рассылки всем сразу
+"""
+
+import asyncio
+import time
+import cfg
+from typing import Awaitable, Callable, Dict, List
+
+WORKER_DISPATCH_STRATEGY = getattr(cfg, 'WORKER_DISPATCH_STRATEGY', 'least_loaded')
+WORKER_OFFER_FANOUT = getattr(cfg, 'WORKER_OFFER_FANOUT', 2)
+WORKER_OFFER_TIMEOUT = getattr(cfg, 'WORKER_OFFER_TIMEOUT', 30)
+WORKER_HEARTBEAT_TTL = getattr(cfg, 'WORKER_HEARTBEAT_TTL', 600)
+WORKER_HEARTBEAT_INTERVAL = getattr(cfg, 'WORKER_HEARTBEAT_INTERVAL', 60)
+
+STRATEGIES = ('least_loaded', 'round_robin', 'fastest')
+
+
+class WorkerSelector:
+    """Порядок, в котором воркерам предлагается платеж.
+
+    Сначала свободные воркеры с недавним heartbeat, затем занятые, затем неактивные;
+    внутри группы порядок задает стратегия:
+    least_loaded - меньше активных платежей, дольше без назначения;
+    round_robin - по кругу, каждый платеж начинается со следующего воркера;
+    fastest - меньше среднее время обработки, воркеры без истории в конце.
+    """
+
+    def __init__(self, strategy: str = WORKER_DISPATCH_STRATEGY, heartbeat_ttl: float = WORKER_HEARTBEAT_TTL):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Неизвестная WORKER_DISPATCH_STRATEGY: {strategy} (доступны: {', '.join(STRATEGIES)})")
+        self.strategy = strategy
+        self.heartbeat_ttl = heartbeat_ttl
+        self._next = 0
+
+    def _tier(self, state: Dict) -> int:
+        idle = state.get('idle_seconds')
+        if idle is None or idle > self.heartbeat_ttl:
+            return 2
+        return 1 if state.get('active_payments') else 0
+
+    def order(self, workers: List[Dict], states: Dict[int, Dict]) -> List[int]:
+        """telegram_id воркеров в порядке предложения; workers - строки снимка состава"""
+        workers = list({w['telegram_id']: w for w in workers}.values())
+        count = len(workers)
+        offset = self._next % count if count else 0
+        self._next += 1
+
+        def key(item):
+            position, worker = item
+            state = states.get(worker.get('user_id'), {})
+            if self.strategy == 'round_robin':
+                rank = ((position - offset) % count,)
+            elif self.strategy == 'fastest':
+                avg = state.get('avg_handle_seconds')
+                rank = (avg is None, avg or 0, state.get('active_payments') or 0)
+            else:
+                rank = (state.get('active_payments') or 0, state.get('assigned_at') or '')
+            return (self._tier(state),) + rank + (position,)
+
+        return [worker['telegram_id'] for _, worker in sorted(enumerate(workers), key=key)]
+
+    @staticmethod
+    def waves(order: List[int], fanout: int = WORKER_OFFER_FANOUT) -> List[List[int]]:
+        """Разбить порядок на волны: fanout воркеров, затем вдвое больше и т.д. (fanout <= 0 - всем сразу)"""
+        if fanout <= 0:
+            return [order] if order else []
+        waves, start, size = [], 0, fanout
+        while start < len(order):
+            waves.append(order[start:start + size])
+            start += size
+            size *= 2
+        return waves
+
+
+class WorkerOffers:
+    """Предлагает платежи воркерам волнами в цикле событий бота.
+
+    Первая волна уходит сразу; следующая - через timeout секунд, если платеж
+    все еще pending и никем не взят. Так в обычном случае сообщение получают
+    WORKER_OFFER_FANOUT воркеров, а не все. Номер волны и время следующей
+    хранятся в payment_queue (offered_wave, next_offer_at): run() продолжает
+    волны и после перезапуска бота.
+    """
+
+    def __init__(self, adb, selector: WorkerSelector = None, fanout: int = WORKER_OFFER_FANOUT,
+                 timeout: float = WORKER_OFFER_TIMEOUT, heartbeat_interval: float = WORKER_HEARTBEAT_INTERVAL):
+        self.adb = adb
+        self.selector = selector or WorkerSelector()
+        self.fanout = fanout
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._event = None
+        self._heartbeats = {}
+        self.offered = 0
+        self.sent = 0
+        self.widened = 0
+
+    async def _order(self) -> List[int]:
+        roster = await self.adb.get_roster_snapshot()
+        states = await self.adb.get_worker_states([w['user_id'] for w in roster.workers])
+        return self.selector.order(roster.workers, states)
+
+    async def offer(self, transaction_id: int, send: Callable[[int], Awaitable[bool]]) -> int:
+        """Разослать первую волну и запланировать остальные; вернуть число отправленных сообщений.
+
+        Порядок воркеров сохраняется в payment_queue.offer_order: следующие волны
+        идут по нему, поэтому никто не получает платеж дважды.
+        """
+        order = await self._order()
+        waves = self.selector.waves(order, self.fanout)
+        self.offered += 1
+        if not waves:
+            return 0
+
+        print(f"[BOT] Платеж {transaction_id}: воркеры {waves[0]} ({self.selector.strategy}), волн: {len(waves)}")
+        sent = 0
+        for telegram_id in waves[0]:
+            if await send(telegram_id):
+                sent += 1
+        self.sent += sent
+        await self.adb.record_payment_offer(transaction_id, 1, self.timeout if len(waves) > 1 else None, order)
+        if self._event is not None:
+            self._event.set()
+        return sent
+
+    async def requeue_interrupted(self) -> int:
+        """Вернуть диспетчеру платежи, рассылка которых прервалась до первой волны.
+
+        Вызывается при старте бота до запуска PaymentDispatcher.
+        """
+        requeued = await self.adb.requeue_unoffered_payments()
+        if requeued:
+            print(f"📮 Возвращено в очередь неразосланных платежей: {requeued}")
+        return requeued
+
+    async def run(self, send_wave: Callable[[Dict, List[int]], Awaitable[int]]):
+        """Рассылать следующие волны по сроку из payment_queue; send_wave(запись, воркеры) -> отправлено"""
+        self._event = asyncio.Event()
+        while True:
+            # Сброс до чтения очереди: сигнал offer() во время чтения не потеряется
+            self._event.clear()
+            try:
+                for payment in await self.adb.get_due_payment_offers():
+                    await self._widen(payment, send_wave)
+                delay = await self.adb.get_next_offer_delay()
+            except Exception as e:
+                print(f"❌ Ошибка расширения рассылки платежей: {e}")
+                delay = self.timeout
+            try:
+                await asyncio.wait_for(self._event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _widen(self, payment: Dict, send_wave):
+        transaction_id = payment['transaction_id']
+        if payment['transaction_status'] != 'pending' or payment['transaction_worker_id']:
+            await self.adb.record_payment_offer(transaction_id, payment['offered_wave'], None)
+            return
+
+        # Волны - из порядка первой волны; воркеры, появившиеся позже, дописываются в конец,
+        # поэтому уже разосланные волны не меняются
+        order = payment['offer_order'] or await self._order()
+        roster = await self.adb.get_roster_snapshot()
+        order = order + [telegram_id for telegram_id in roster.worker_ids if telegram_id not in order]
+        waves = self.selector.waves(order, self.fanout)
+        index = payment['offered_wave']
+        if index >= len(waves):
+            await self.adb.record_payment_offer(transaction_id, index, None)
+            return
+
+        # Воркеры, снятые с роли после первой волны, пропускаются
+        wave = [telegram_id for telegram_id in waves[index] if telegram_id in roster.worker_ids]
+        self.widened += 1
+        print(f"[BOT] Платеж {transaction_id} не взят за {self.timeout} с, предлагаем воркерам {wave}")
+        # Волна отмечается до отправки: сбой посреди нее не приведет к повторной рассылке тем же воркерам
+        await self.adb.record_payment_offer(transaction_id, index + 1,
+                                            self.timeout if index + 1 < len(waves) else None, order)
+        try:
+            if wave:
+                self.sent += await send_wave(payment, wave)
+        except Exception as e:
+            print(f"❌ Ошибка расширения рассылки платежа #{transaction_id}: {e}")
+
+    def heartbeat_due(self, telegram_id: int) -> bool:
+        """Пора ли записать heartbeat воркера (не чаще heartbeat_interval секунд)"""
+        now = time.monotonic()
+        if now - self._heartbeats.get(telegram_id, float('-inf')) < self.heartbeat_interval:
+            return False
+        self._heartbeats[telegram_id] = now
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'strategy': self.selector.strategy,
+            'offered': self.offered,
+            'sent': self.sent,
+            'widened': self.widened,
+        }